@@ -0,0 +1,288 @@
+#!/usr/bin/python
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import contextlib
+import multiprocessing
+
+# START FUNCTIONS
+
+# Ticker each trading mode is benchmarked with. Each needs its option file.
+benchmark_modes = {"range_trade": "TMF",
+                   "rebalance": "VOO",
+                   "sell_call_options": "SPY"}
+
+# Phases requests are grouped into, plus compute for time spent outside
+# requests
+phases = ["token", "account", "quotes", "chains", "orders_read", "orders_write", "other", "compute"]
+
+
+# Function to get the phase of a request from its method and endpoint
+def request_phase(method: str, endpoint: str):
+
+    path = endpoint.split("?")[0]
+    if path.endswith("/oauth/token"):
+        return "token"
+    if path.endswith("/quotes"):
+        return "quotes"
+    if path.endswith("/chains"):
+        return "chains"
+    if "/orders" in path:
+        return "orders_read" if method == "GET" else "orders_write"
+    if "/accounts" in path:
+        return "account"
+    return "other"
+
+
+# Function to serve the mock API in a child process, so its CPU time isn't
+# counted as the trader's. The URL is sent back on url_queue.
+def serve_mock(scenario_file: str, latency: float, url_queue):
+
+    from mock_schwab_api import MockSchwabAPI, MockSchwabServer, load_scenario
+    server = MockSchwabServer(MockSchwabAPI(load_scenario(scenario_file)), latency=latency)
+    url_queue.put(server.url())
+    server.serve_forever()
+
+
+# Function to start the mock API in a child process. Returns the process
+# and the URL of the server.
+def start_mock(scenario_file: str, latency: float):
+
+    url_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve_mock, args=(scenario_file, latency, url_queue), daemon=True)
+    process.start()
+    return process, url_queue.get(timeout=30)
+
+
+# Class recording the wall time, CPU time and bytes of each request made by
+# a SchwabClient. CPU time is that of the thread making the request, so
+# requests made at the same time from a thread pool are not counted twice.
+class RequestRecorder:
+
+    # Wrap the request function of the client
+    def __init__(self, client):
+
+        self.client = client
+        self.request = client.request
+        self.records = []
+        client.request = self.record
+
+    # Function to make a request and record it
+    def record(self, method: str, endpoint: str, access_token=None, headers=None, **kwargs):
+
+        start = time.perf_counter()
+        start_cpu = time.thread_time()
+        content = self.request(method, endpoint, access_token, headers, **kwargs)
+        data = kwargs.get("data")
+        self.records.append([request_phase(method, endpoint), start, time.perf_counter(), time.thread_time() - start_cpu,
+                             len(data) if data else 0, len(content.content)])
+        return content
+
+    # Function to stop recording
+    def close(self):
+
+        self.client.request = self.request
+
+
+# Function to get the total length of a list of [start, end] intervals,
+# counting overlapping time once
+def interval_union(intervals: list):
+
+    total = 0.0
+    end = None
+    for interval_start, interval_end in sorted(intervals):
+        if end is None or interval_start > end:
+            total = total + interval_end - interval_start
+            end = interval_end
+        elif interval_end > end:
+            total = total + interval_end - end
+            end = interval_end
+    return total
+
+
+# Function to run one cycle of a trading mode against a freshly reset mock.
+# Returns wall time, CPU time and per phase requests, wall time, CPU time
+# and bytes. Phase wall times can add up to more than the cycle when
+# requests run at the same time; compute wall time is the time no request
+# was in flight.
+def run_cycle(trader, url: str, mode: str, ticker: str):
+
+    # Reset mock, quote cache and files written by the last cycle. The daily
+    # bar cache is kept, as a live cycle would find it filled earlier in the
+    # day.
+    trader.client.post(url + "/mock/reset")
+    trader.quote_cache.quotes.clear()
+    for file_name in os.listdir("."):
+        if os.path.isdir(file_name):
+            shutil.rmtree(file_name)
+        elif not file_name.endswith((".ini", ".db")):
+            os.remove(file_name)
+
+    # Run the cycle with its output discarded
+    args = argparse.Namespace(range_trade="None", rebalance="None", sell_call_options="None", get_quote="None", collect="None", percent_threshold=1.5)
+    setattr(args, mode, ticker)
+    recorder = RequestRecorder(trader.client)
+    output = io.StringIO()
+    start = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        with contextlib.redirect_stdout(output):
+            ok = trader.run_strategies(args, "mock-access-token", "ira")
+    finally:
+        wall = time.perf_counter() - start
+        cpu = time.process_time() - start_cpu
+        recorder.close()
+    if not ok:
+        raise RuntimeError("Cycle for " + mode + " failed:\n" + output.getvalue())
+
+    # Total up requests by phase
+    cycle = {"wall": wall, "cpu": cpu, "requests": len(recorder.records), "bytes_sent": 0, "bytes_received": 0, "phases": {}}
+    for phase in phases:
+        cycle["phases"][phase] = {"requests": 0, "wall": 0.0, "cpu": 0.0, "bytes_sent": 0, "bytes_received": 0}
+    for phase, request_start, request_end, request_cpu, bytes_sent, bytes_received in recorder.records:
+        totals = cycle["phases"][phase]
+        totals["requests"] = totals["requests"] + 1
+        totals["wall"] = totals["wall"] + request_end - request_start
+        totals["cpu"] = totals["cpu"] + request_cpu
+        totals["bytes_sent"] = totals["bytes_sent"] + bytes_sent
+        totals["bytes_received"] = totals["bytes_received"] + bytes_received
+        cycle["bytes_sent"] = cycle["bytes_sent"] + bytes_sent
+        cycle["bytes_received"] = cycle["bytes_received"] + bytes_received
+    cycle["phases"]["compute"]["wall"] = wall - interval_union([[record[1], record[2]] for record in recorder.records])
+    cycle["phases"]["compute"]["cpu"] = cpu - sum(record[3] for record in recorder.records)
+    return cycle
+
+
+# Function to benchmark a trading mode. Runs warmup cycles that are not
+# counted, then returns the median of each measure over the timed cycles.
+def benchmark_mode(trader, url: str, mode: str, ticker: str, iterations: int, warmup: int):
+
+    for count in range(warmup):
+        run_cycle(trader, url, mode, ticker)
+    cycles = [run_cycle(trader, url, mode, ticker) for count in range(iterations)]
+
+    result = {"ticker": ticker}
+    for measure in ["wall", "cpu", "requests", "bytes_sent", "bytes_received"]:
+        result[measure] = statistics.median(cycle[measure] for cycle in cycles)
+    result["phases"] = {}
+    for phase in phases:
+        result["phases"][phase] = {}
+        for measure in ["requests", "wall", "cpu", "bytes_sent", "bytes_received"]:
+            result["phases"][phase][measure] = statistics.median(cycle["phases"][phase][measure] for cycle in cycles)
+    return result
+
+
+# Function to print the results for each mode
+def print_results(results: dict):
+
+    for mode in results["modes"]:
+        result = results["modes"][mode]
+        print("\n" + mode + " " + result["ticker"] + ": " + str(round(result["wall"] * 1000.0, 2)) + " ms wall, " + str(round(result["cpu"] * 1000.0, 2)) + " ms CPU, "
+              + str(result["requests"]) + " requests, " + str(result["bytes_sent"]) + " bytes sent, " + str(result["bytes_received"]) + " bytes received")
+        print("Phase         Requests   Wall ms    CPU ms  Bytes Sent  Bytes Received")
+        for phase in phases:
+            totals = result["phases"][phase]
+            if totals["requests"] or phase == "compute":
+                print(f"{phase:12s}  {totals['requests']:8g}  {totals['wall'] * 1000.0:8.2f}  {totals['cpu'] * 1000.0:8.2f}  {totals['bytes_sent']:10g}  {totals['bytes_received']:14g}")
+
+
+# Function to compare results with a baseline. Wall time, CPU time and bytes
+# fail when they grow by more than tolerance (a fraction) and, for times, by
+# more than min_delta seconds. Request counts fail when they grow at all.
+# Returns a list of failures.
+def compare_results(results: dict, baseline: dict, tolerance: float, min_delta: float):
+
+    failures = []
+    if results["latency"] != baseline["latency"]:
+        print("Warning: baseline latency of " + str(baseline["latency"]) + " seconds is not the " + str(results["latency"]) + " seconds used now")
+    for mode in results["modes"]:
+        if mode not in baseline["modes"]:
+            continue
+        result = results["modes"][mode]
+        base = baseline["modes"][mode]
+        for measure in ["wall", "cpu"]:
+            if result[measure] > base[measure] * (1.0 + tolerance) and result[measure] - base[measure] > min_delta:
+                failures.append(mode + " " + measure + " time " + str(round(result[measure] * 1000.0, 2)) + " ms is more than baseline " + str(round(base[measure] * 1000.0, 2)) + " ms")
+        if result["requests"] > base["requests"]:
+            failures.append(mode + " made " + str(result["requests"]) + " requests, more than baseline " + str(base["requests"]))
+        for measure in ["bytes_sent", "bytes_received"]:
+            if result[measure] > base[measure] * (1.0 + tolerance):
+                failures.append(mode + " " + measure.replace("_", " ") + " " + str(result[measure]) + " is more than baseline " + str(base[measure]))
+    return failures
+
+# END FUNCTIONS
+
+if __name__ == "__main__":
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(description="Benchmark a cycle of each trading mode against the mock Schwab API")
+    parser.add_argument("-modes","--modes", default="range_trade,rebalance,sell_call_options", help='Trading modes to benchmark, separated by commas. Default is all of them')
+    parser.add_argument("-iterations","--iterations", type=int, default=5, help='Timed cycles per mode. Default is 5')
+    parser.add_argument("-warmup","--warmup", type=int, default=1, help='Untimed cycles per mode before timing. Default is 1')
+    parser.add_argument("-latency","--latency", type=float, default=0.02, help='Seconds the mock holds back each response. Default is 0.02')
+    parser.add_argument("-scenario","--scenario", default="None", help='Scenario file for the mock API. Default is None (built in scenario)')
+    parser.add_argument("-output","--output", default="None", help='File to write results to in JSON format. Default is None')
+    parser.add_argument("-baseline","--baseline", default="None", help='Results file to compare with. Exits with status 1 if any mode got slower. Default is None')
+    parser.add_argument("-tolerance","--tolerance", type=float, default=0.25, help='Fraction wall time, CPU time or bytes may grow over the baseline. Default is 0.25')
+    parser.add_argument("-min_delta","--min_delta", type=float, default=0.005, help='Seconds wall or CPU time must grow by to fail. Default is 0.005')
+    args = parser.parse_args()
+
+    # Check modes and input files
+    modes = args.modes.split(",")
+    for mode in modes:
+        if mode not in benchmark_modes:
+            print("Unknown mode: " + mode + ". Exiting")
+            sys.exit(1)
+    scenario_file = None if args.scenario == "None" else os.path.abspath(args.scenario)
+    baseline = None
+    if args.baseline != "None":
+        if not os.path.exists(args.baseline):
+            print("Baseline file: " + args.baseline + " does not exist. Exiting")
+            sys.exit(1)
+        with open(args.baseline, "r") as baseline_in:
+            baseline = json.load(baseline_in)
+    output_file = None if args.output == "None" else os.path.abspath(args.output)
+
+    # Start the mock API, then run the trader from a work directory holding
+    # copies of the option files
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    mock_process, url = start_mock(scenario_file, args.latency)
+    work_dir = tempfile.mkdtemp(prefix="schwab_benchmark_")
+    for mode in modes:
+        shutil.copyfile(os.path.join(repo_dir, "schwab_" + benchmark_modes[mode] + "_" + mode + ".ini"), os.path.join(work_dir, "schwab_" + benchmark_modes[mode] + "_" + mode + ".ini"))
+    shutil.copyfile(os.path.join(repo_dir, "schwab_config.ini"), os.path.join(work_dir, "schwab_config.ini"))
+    os.chdir(work_dir)
+    try:
+        import schwab_trader
+        schwab_trader.set_api_url(url)
+        print("Benchmarking against mock Schwab API at " + url + " with " + str(args.latency) + " seconds latency per request")
+        results = {"latency": args.latency, "iterations": args.iterations, "modes": {}}
+        for mode in modes:
+            results["modes"][mode] = benchmark_mode(schwab_trader, url, mode, benchmark_modes[mode], args.iterations, args.warmup)
+    finally:
+        os.chdir(repo_dir)
+        shutil.rmtree(work_dir)
+        mock_process.terminate()
+    print_results(results)
+
+    # Write results
+    if output_file is not None:
+        with open(output_file, "w") as results_out:
+            json.dump(results, results_out, indent=4)
+        print("\nWrote results to " + output_file)
+
+    # Compare with baseline
+    if baseline is not None:
+        failures = compare_results(results, baseline, args.tolerance, args.min_delta)
+        if failures:
+            print("\nSlower than baseline " + args.baseline + ":")
+            for failure in failures:
+                print("  " + failure)
+            sys.exit(1)
+        print("\nNo slowdown against baseline " + args.baseline)
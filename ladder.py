@@ -0,0 +1,106 @@
+#!/usr/bin/python
+import numpy as np
+
+# Class holding a range trade ladder as arrays sorted by share count, so
+# lookups by price or share count are binary searches instead of scans of
+# the trade ranges dictionary. Every lookup also takes an array of prices or
+# share counts and returns an array.
+class Ladder:
+
+    # Build sorted arrays from trade ranges, which map the number of shares
+    # to own to [buy price, sell price]
+    def __init__(self, trade_shares: int, max_shares: int, trade_ranges: dict):
+
+        self.trade_shares = trade_shares
+        self.max_shares = max_shares
+        self.shares = np.array(sorted(trade_ranges), dtype=np.int64)
+        self.buy_prices = np.array([trade_ranges[shares][0] for shares in self.shares], dtype=np.float64)
+        self.sell_prices = np.array([trade_ranges[shares][1] for shares in self.shares], dtype=np.float64)
+
+        # The first rung with a buy price at or below a price is also the
+        # first rung where the lowest buy price so far is at or below it, and
+        # the last rung with a sell price at or above a price is also the last
+        # rung where the highest sell price from there on is at or above it.
+        # Both of these only fall as share count rises, so can be searched
+        # even when the ladder prices don't.
+        self.buy_floor = -np.minimum.accumulate(self.buy_prices)
+        self.sell_ceiling = -np.maximum.accumulate(self.sell_prices[::-1])[::-1]
+
+    # Function to get the number of rungs
+    def __len__(self):
+        return len(self.shares)
+
+    # Function to get the index of the first rung with a buy price at or
+    # below price, or the number of rungs if there is none
+    def first_buy_rung(self, price):
+        return np.searchsorted(self.buy_floor, -np.asarray(price), side="left")
+
+    # Function to get the index of the last rung with a sell price at or
+    # above price, or -1 if there is none
+    def last_sell_rung(self, price):
+        return np.searchsorted(self.sell_ceiling, -np.asarray(price), side="right") - 1
+
+    # Function to get the index of the deepest rung at or below a share count,
+    # or the first rung if the share count is below all of them
+    def rung_at_or_below(self, shares):
+        return np.clip(np.searchsorted(self.shares, shares, side="right") - 1, 0, len(self.shares) - 1)
+
+    # Function to get the index of the first rung at or above a share count,
+    # or the last rung if the share count is above all of them
+    def rung_at_or_above(self, shares):
+        return np.clip(np.searchsorted(self.shares, shares, side="left"), 0, len(self.shares) - 1)
+
+    # Function to get the index of the first rung above a share count, or the
+    # last rung if there is none
+    def rung_above(self, shares):
+        return np.clip(np.searchsorted(self.shares, shares, side="right"), 0, len(self.shares) - 1)
+
+    # Function to get the number of shares to own after buying at price: one
+    # rung less than the first rung the price is at or below the buy price of,
+    # or max shares if the price is below every buy price
+    def buy_target(self, price):
+
+        rung = self.first_buy_rung(price)
+        return np.where(rung < len(self.shares), self.shares[np.minimum(rung, len(self.shares) - 1)] - self.trade_shares, self.max_shares)
+
+    # Function to get the number of shares to own after selling at price: one
+    # rung more than the last rung the price is at or below the sell price of,
+    # or 0 if the price is above every sell price
+    def sell_target(self, price):
+
+        rung = self.last_sell_rung(price)
+        return np.where(rung >= 0, self.shares[np.maximum(rung, 0)] + self.trade_shares, 0)
+
+    # Function to get the buy and sell orders for a share count at each of an
+    # array of prices. Returns buy shares, buy price, sell shares and sell
+    # price arrays, with 0 shares where there is no order.
+    def orders(self, position: int, prices):
+
+        prices = np.asarray(prices, dtype=np.float64)
+        return self.orders_for_targets(position, self.buy_target(prices), self.sell_target(prices))
+
+    # Function to get the buy and sell orders for a share count from buy and
+    # sell targets already looked up for each price
+    def orders_for_targets(self, position: int, buy_target, sell_target):
+
+        trade_shares, max_shares = self.trade_shares, self.max_shares
+        no_shares = np.zeros(np.shape(buy_target), dtype=np.int64)
+        no_price = np.zeros(np.shape(buy_target))
+
+        # Sell down to the sell target, or one rung if that is less
+        if position > 0:
+            owned = min(position, max_shares)
+            to_sell = owned - sell_target
+            sell_shares = np.where(to_sell > trade_shares, to_sell, min(trade_shares, owned))
+            sell_price = np.where(to_sell > trade_shares, self.sell_prices[self.rung_at_or_above(sell_target)], self.sell_prices[self.rung_at_or_below(owned)])
+        else:
+            sell_shares, sell_price = no_shares, no_price
+
+        # Buy up to the buy target, or one rung if that is less
+        if position < max_shares:
+            to_buy = buy_target - position
+            buy_shares = np.where(to_buy > trade_shares, to_buy, trade_shares)
+            buy_price = np.where(to_buy > trade_shares, self.buy_prices[self.rung_at_or_below(buy_target)], self.buy_prices[self.rung_above(position)])
+        else:
+            buy_shares, buy_price = no_shares, no_price
+        return buy_shares, buy_price, sell_shares, sell_price
@@ -0,0 +1,213 @@
+#!/usr/bin/python
+import os
+import json
+import datetime
+import threading
+import contextlib
+import contextvars
+from urllib.parse import urlsplit
+
+# Upper bounds in seconds of the request latency histogram buckets
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+# Strategy requests are labeled with. Pool threads get the label of the
+# thread that submitted the work if it is submitted through
+# contextvars.copy_context().run.
+current_strategy = contextvars.ContextVar("strategy", default="none")
+
+
+# Function to label requests made inside a with block with a strategy
+@contextlib.contextmanager
+def strategy_label(strategy: str):
+
+    token = current_strategy.set(strategy)
+    try:
+        yield
+    finally:
+        current_strategy.reset(token)
+
+
+# Function to get the route of an endpoint, with the host, query, account
+# hash and order ID taken out, so requests to the same endpoint share labels
+def endpoint_route(endpoint: str):
+
+    segments = urlsplit(endpoint).path.split("/")
+    for index in range(len(segments)):
+        if index > 0 and segments[index-1] == "accounts" and segments[index] != "accountNumbers":
+            segments[index] = "{account}"
+        elif segments[index].isdigit():
+            segments[index] = "{order_id}"
+    return "/".join(segments)
+
+
+# Function to escape a Prometheus label value
+def escape_label(value):
+
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+# Function to format Prometheus labels
+def format_labels(labels: list):
+
+    return "{" + ",".join(name + "=\"" + escape_label(value) + "\"" for name, value in labels) + "}"
+
+
+# Class holding the totals for one method, endpoint and strategy
+class EndpointStats:
+
+    # Initialize empty totals
+    def __init__(self, buckets: list):
+
+        self.statuses = {}
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.seconds = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.retries = 0
+
+
+# Class counting API requests, status codes, latencies, bytes and retries by
+# method, endpoint and strategy. Totals are written as a Prometheus text
+# file, and each request can also be written as a JSON log line.
+class Metrics:
+
+    # Initialize empty metrics. textfile is the Prometheus text file to write
+    # and log_file the file to append JSON log lines to; either can be None.
+    def __init__(self, textfile=None, log_file=None, buckets=LATENCY_BUCKETS):
+
+        self.textfile = textfile
+        self.buckets = buckets
+        self.stats = {}
+        self.collection = None
+        self.lock = threading.Lock()
+        self.log_out = open(log_file, "a") if log_file is not None else None
+
+    # Function to record one request. Status is the HTTP status code, or
+    # "error" if no response was received. retry is True for a request
+    # repeated after the first attempt was rejected.
+    def record_request(self, method: str, endpoint: str, status, seconds: float, bytes_sent: int, bytes_received: int, retry=False):
+
+        route = endpoint_route(endpoint)
+        strategy = current_strategy.get()
+        with self.lock:
+            stats = self.stats.get((method, route, strategy))
+            if stats is None:
+                stats = self.stats[(method, route, strategy)] = EndpointStats(self.buckets)
+            stats.statuses[str(status)] = stats.statuses.get(str(status), 0) + 1
+            for index, bucket in enumerate(self.buckets):
+                if seconds <= bucket:
+                    stats.bucket_counts[index] = stats.bucket_counts[index] + 1
+                    break
+            stats.count = stats.count + 1
+            stats.seconds = stats.seconds + seconds
+            stats.bytes_sent = stats.bytes_sent + bytes_sent
+            stats.bytes_received = stats.bytes_received + bytes_received
+            if retry:
+                stats.retries = stats.retries + 1
+
+            # Write JSON log line
+            if self.log_out is not None:
+                self.log_out.write(json.dumps({"time": datetime.datetime.now().isoformat(timespec="milliseconds"),
+                                               "event": "api_request",
+                                               "method": method,
+                                               "endpoint": route,
+                                               "strategy": strategy,
+                                               "status": status,
+                                               "seconds": round(seconds, 6),
+                                               "bytes_sent": bytes_sent,
+                                               "bytes_received": bytes_received,
+                                               "retry": retry}) + "\n")
+                self.log_out.flush()
+
+    # Function to record one collection of watchlist quotes: the number of
+    # symbols, quotes received, requests and failed requests, the seconds it
+    # took, and the median and max lag in seconds from quote time to receipt
+    # (None if no quote had a quote time)
+    def record_collection(self, collection: dict):
+
+        with self.lock:
+            if self.collection is None:
+                self.collection = {"quotes_total": 0, "requests_total": 0, "errors_total": 0}
+            self.collection["quotes_total"] = self.collection["quotes_total"] + collection["quotes"]
+            self.collection["requests_total"] = self.collection["requests_total"] + collection["requests"]
+            self.collection["errors_total"] = self.collection["errors_total"] + collection["errors"]
+            self.collection["last"] = collection
+
+            # Write JSON log line
+            if self.log_out is not None:
+                self.log_out.write(json.dumps({"time": datetime.datetime.now().isoformat(timespec="milliseconds"),
+                                               "event": "collect",
+                                               "symbols": collection["symbols"],
+                                               "quotes": collection["quotes"],
+                                               "requests": collection["requests"],
+                                               "errors": collection["errors"],
+                                               "seconds": round(collection["seconds"], 6),
+                                               "lag_median": None if collection["lag_median"] is None else round(collection["lag_median"], 6),
+                                               "lag_max": None if collection["lag_max"] is None else round(collection["lag_max"], 6)}) + "\n")
+                self.log_out.flush()
+
+    # Function to get the metrics in the Prometheus text format
+    def prometheus_text(self):
+
+        with self.lock:
+            stats = sorted(self.stats.items())
+            lines = ["# HELP schwab_api_requests_total Schwab API requests by status code.",
+                     "# TYPE schwab_api_requests_total counter"]
+            for (method, route, strategy), totals in stats:
+                for status in sorted(totals.statuses):
+                    lines.append("schwab_api_requests_total" + format_labels([["method", method], ["endpoint", route], ["strategy", strategy], ["status", status]]) + " " + str(totals.statuses[status]))
+            lines = lines + ["# HELP schwab_api_request_duration_seconds Schwab API request latency.",
+                             "# TYPE schwab_api_request_duration_seconds histogram"]
+            for (method, route, strategy), totals in stats:
+                labels = [["method", method], ["endpoint", route], ["strategy", strategy]]
+                cumulative = 0
+                for bucket, bucket_count in zip(self.buckets, totals.bucket_counts):
+                    cumulative = cumulative + bucket_count
+                    lines.append("schwab_api_request_duration_seconds_bucket" + format_labels(labels + [["le", bucket]]) + " " + str(cumulative))
+                lines.append("schwab_api_request_duration_seconds_bucket" + format_labels(labels + [["le", "+Inf"]]) + " " + str(totals.count))
+                lines.append("schwab_api_request_duration_seconds_sum" + format_labels(labels) + " " + repr(round(totals.seconds, 6)))
+                lines.append("schwab_api_request_duration_seconds_count" + format_labels(labels) + " " + str(totals.count))
+            for name, help_text, attribute in [["schwab_api_sent_bytes_total", "Bytes sent in Schwab API request bodies.", "bytes_sent"],
+                                               ["schwab_api_received_bytes_total", "Bytes received in Schwab API response bodies.", "bytes_received"],
+                                               ["schwab_api_retries_total", "Schwab API requests repeated after a rejected token.", "retries"]]:
+                lines = lines + ["# HELP " + name + " " + help_text, "# TYPE " + name + " counter"]
+                for (method, route, strategy), totals in stats:
+                    lines.append(name + format_labels([["method", method], ["endpoint", route], ["strategy", strategy]]) + " " + str(getattr(totals, attribute)))
+
+            # Write watchlist collection metrics, if quotes were collected
+            if self.collection is not None:
+                last = self.collection["last"]
+                for name, metric_type, help_text, value in [["schwab_collector_quotes_total", "counter", "Watchlist quotes collected.", self.collection["quotes_total"]],
+                                                            ["schwab_collector_requests_total", "counter", "Quote requests made to collect the watchlist.", self.collection["requests_total"]],
+                                                            ["schwab_collector_errors_total", "counter", "Quote requests that failed while collecting the watchlist.", self.collection["errors_total"]],
+                                                            ["schwab_collector_symbols", "gauge", "Symbols in the watchlist at the last collection.", last["symbols"]],
+                                                            ["schwab_collector_duration_seconds", "gauge", "Seconds the last collection took.", round(last["seconds"], 6)],
+                                                            ["schwab_collector_quotes_per_second", "gauge", "Quotes collected per second in the last collection.", round(last["quotes"] / last["seconds"] if last["seconds"] > 0 else 0.0, 3)]]:
+                    lines = lines + ["# HELP " + name + " " + help_text, "# TYPE " + name + " " + metric_type, name + " " + repr(value)]
+                lines = lines + ["# HELP schwab_collector_lag_seconds Seconds from quote time to receipt in the last collection.",
+                                 "# TYPE schwab_collector_lag_seconds gauge"]
+                for quantile, key in [["0.5", "lag_median"], ["1", "lag_max"]]:
+                    if last[key] is not None:
+                        lines.append("schwab_collector_lag_seconds" + format_labels([["quantile", quantile]]) + " " + repr(round(last[key], 6)))
+        return "\n".join(lines) + "\n"
+
+    # Function to write the Prometheus text file. It is written to a
+    # temporary name and renamed, so a collector never reads a partly
+    # written file.
+    def write_textfile(self):
+
+        if self.textfile is None:
+            return
+        textfile_temp = self.textfile + ".tmp"
+        with open(textfile_temp, "w") as textfile_out:
+            textfile_out.write(self.prometheus_text())
+        os.rename(textfile_temp, self.textfile)
+
+    # Function to write the text file and close the log file
+    def close(self):
+
+        self.write_textfile()
+        if self.log_out is not None:
+            self.log_out.close()
+            self.log_out = None
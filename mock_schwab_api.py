@@ -0,0 +1,692 @@
+#!/usr/bin/python
+import re
+import sys
+import copy
+import math
+import json
+import time
+import datetime
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+# START FUNCTIONS
+
+# Scenario used when no scenario file is given. Accounts not listed by hash
+# are copied from the default account the first time they are used.
+DEFAULT_SCENARIO = {
+    "accounts": {
+        "default": {
+            "account_number": "12345678",
+            "cash": 1000.0,
+            "positions": {"TMF": 60, "BIL": 100, "VOO": 10}
+        }
+    },
+    "quotes": {
+        "TMF": {"bidPrice": 38.40, "askPrice": 38.42, "lastPrice": 38.41, "highPrice": 39.00, "lowPrice": 38.00},
+        "BIL": {"bidPrice": 91.50, "askPrice": 91.52, "lastPrice": 91.51, "highPrice": 91.60, "lowPrice": 91.40},
+        "SPY": {"bidPrice": 647.00, "askPrice": 647.20, "lastPrice": 647.10, "highPrice": 650.00, "lowPrice": 640.00},
+        "VOO": {"bidPrice": 600.00, "askPrice": 600.20, "lastPrice": 600.10, "highPrice": 610.00, "lowPrice": 598.00}
+    },
+    "chains": {},
+    "fill_mode": "marketable",
+    "fill_delay": 0.0,
+    "streamer_url": "ws://127.0.0.1:0",
+    "events": []
+}
+
+# Order statuses that an order does not leave
+TERMINAL_STATUSES = ["FILLED", "CANCELED", "REJECTED", "EXPIRED", "REPLACED"]
+
+# Query parameters that change from day to day and are left out when
+# matching recorded requests
+VOLATILE_PARAMS = ["fromEnteredTime", "toEnteredTime", "fromDate", "toDate", "startDate", "endDate"]
+
+
+# Function to load a scenario file. Settings missing from the file are taken
+# from the default scenario.
+def load_scenario(scenario_file: str):
+
+    scenario = copy.deepcopy(DEFAULT_SCENARIO)
+    if scenario_file is not None:
+        with open(scenario_file, "r") as scenario_in:
+            scenario.update(json.load(scenario_in))
+    return scenario
+
+
+# Function to get the time in the format Schwab uses for order times
+def order_time(timestamp: float):
+
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S+0000")
+
+
+# Function to check if a symbol is an option symbol such as
+# "SPY   250911C00647000"
+def is_option_symbol(symbol: str):
+
+    return len(symbol) == 21 and symbol[12] in "CP"
+
+
+# Function to build an option symbol from the underlying, expiration date
+# (YYMMDD), put or call and strike price
+def option_symbol(underlying: str, yymmdd: str, put_call: str, strike: float):
+
+    return underlying.ljust(6) + yymmdd + put_call + "%08d" % round(strike * 1000)
+
+
+# Function to get the request path and query with the volatile parameters
+# removed, used as the key for recorded requests
+def normalize_path(path: str):
+
+    parts = urlsplit(path)
+    query = sorted((key, value) for key, value in parse_qsl(parts.query) if key not in VOLATILE_PARAMS)
+    return parts.path + ("?" + urlencode(query) if query else "")
+
+
+# Class for a simulated Schwab account holding cash and positions, with
+# negative quantities for short positions
+class MockAccount:
+
+    # Initialize account from scenario settings
+    def __init__(self, account_hash: str, settings: dict):
+
+        self.account_hash = account_hash
+        self.account_number = str(settings.get("account_number", "12345678"))
+        self.cash = float(settings.get("cash", 0.0))
+        self.positions = {symbol: int(quantity) for symbol, quantity in settings.get("positions", {}).items()}
+        self.orders = []
+
+
+# Class holding the state of the simulated API: accounts, quotes and orders.
+# Working orders are checked against the quotes on every request, and fill
+# according to the scenario fill_mode: "marketable" fills limit orders whose
+# price reaches the bid or ask, "all" fills every limit order and "none"
+# fills none. Market orders always fill. Orders fill once they are
+# fill_delay seconds old. Scenario events change quotes a set number of
+# seconds after the server starts.
+class MockSchwabAPI:
+
+    # Initialize state from a scenario
+    def __init__(self, scenario: dict):
+
+        self.scenario = scenario
+        self.lock = threading.Lock()
+        self.reset()
+
+    # Function to put accounts, quotes and orders back to the start of the
+    # scenario
+    def reset(self):
+
+        scenario = self.scenario
+        self.quotes = copy.deepcopy(scenario["quotes"])
+        self.events = sorted(scenario.get("events", []), key=lambda event: event["at"])
+        self.fill_mode = scenario.get("fill_mode", "marketable")
+        self.fill_delay = float(scenario.get("fill_delay", 0.0))
+        self.accounts = {}
+        self.orders = {}
+        self.next_order_id = 1000
+        self.start_time = time.time()
+        for account_hash, settings in scenario["accounts"].items():
+            if account_hash != "default":
+                self.accounts[account_hash] = MockAccount(account_hash, copy.deepcopy(settings))
+
+    # Function to get an account by hash, creating it from the default
+    # account if it isn't in the scenario
+    def account(self, account_hash: str):
+
+        if account_hash not in self.accounts:
+            self.accounts[account_hash] = MockAccount(account_hash, self.scenario["accounts"].get("default", {}))
+        return self.accounts[account_hash]
+
+    # Function to apply scenario events that are due and fill working orders
+    # that can fill
+    def update(self):
+
+        elapsed = time.time() - self.start_time
+        while self.events and self.events[0]["at"] <= elapsed:
+            event = self.events.pop(0)
+            for symbol, quote in event.get("quotes", {}).items():
+                self.quotes.setdefault(symbol, {}).update(quote)
+            if "fill_mode" in event:
+                self.fill_mode = event["fill_mode"]
+        for account in self.accounts.values():
+            for order in list(account.orders):
+                if order["status"] == "WORKING" and order.get("orderLegCollection"):
+                    self.try_fill(account, order)
+
+    # Function to get the quote for a symbol. Option quotes not in the
+    # scenario are priced from the underlying quote.
+    def quote(self, symbol: str):
+
+        if symbol in self.quotes:
+            return self.quotes[symbol]
+        if is_option_symbol(symbol):
+            underlying = symbol[0:6].strip()
+            if underlying in self.quotes:
+                expiry = datetime.datetime.strptime(symbol[6:12], "%y%m%d").date()
+                days = max((expiry - datetime.date.today()).days, 0)
+                return self.option_quote(self.quotes[underlying], days, symbol[12], int(symbol[13:21]) / 1000.0)
+        return None
+
+    # Function to price an option from the underlying quote: intrinsic value
+    # plus time value that falls away from the strike and grows with days to
+    # expiration, with a bid ask spread of 0.02
+    def option_quote(self, underlying_quote: dict, days: int, put_call: str, strike: float):
+
+        price = (float(underlying_quote["bidPrice"]) + float(underlying_quote["askPrice"])) * 0.5
+        intrinsic = max(price - strike, 0.0) if put_call == "C" else max(strike - price, 0.0)
+        time_value = max(0.0, 0.6 * (days + 1) - 0.15 * abs(price - strike))
+        bid = max(0.01, round(intrinsic + time_value, 2))
+        ask = round(bid + 0.02, 2)
+        return {"bidPrice": bid, "askPrice": ask, "lastPrice": round(bid + 0.01, 2), "mark": round(bid + 0.01, 2),
+                "highPrice": ask, "lowPrice": bid, "delta": 0.5 if intrinsic > 0.0 else 0.3}
+
+    # Function to work out the cash held back for working buy orders, other
+    # than the order given
+    def reserved_cash(self, account: MockAccount, skip_order=None):
+
+        reserved = 0.0
+        for order in account.orders:
+            if order is not skip_order and order["status"] == "WORKING" and order.get("orderLegCollection"):
+                cost = self.order_cost(order)
+                if cost > 0.0:
+                    reserved = reserved + cost
+        return reserved
+
+    # Function to check if an account has the cash for an order
+    def has_buying_power(self, account: MockAccount, order: dict):
+
+        return self.order_cost(order) <= account.cash - self.reserved_cash(account, order) + 1e-9
+
+    # Function to send a working order, rejecting it if the account doesn't
+    # have the cash for it
+    def send_order(self, account: MockAccount, order: dict):
+
+        if not self.has_buying_power(account, order):
+            self.close_order(order, "REJECTED")
+            order["statusDescription"] = "Insufficient buying power"
+        else:
+            self.try_fill(account, order)
+
+    # Function to work out the cash an order takes if it fills, negative for
+    # orders that bring in cash
+    def order_cost(self, order: dict, price=None):
+
+        leg = order["orderLegCollection"][0]
+        if price is None:
+            price = order.get("price")
+            if price is None:
+                quote = self.quote(leg["instrument"]["symbol"]) or {}
+                price = quote.get("askPrice", 0.0) if leg["instruction"].startswith("BUY") else quote.get("bidPrice", 0.0)
+        multiplier = 100.0 if leg["instrument"].get("assetType", "").upper() == "OPTION" else 1.0
+        sign = 1.0 if leg["instruction"].startswith("BUY") else -1.0
+        return sign * float(price) * float(leg["quantity"]) * multiplier
+
+    # Function to add a new order to an account. Child orders of a TRIGGER
+    # order wait until the order fills, and child orders of an OCO order are
+    # added as orders of their own. Returns the order, which is REJECTED if
+    # the account doesn't have the cash for it.
+    def add_order(self, account: MockAccount, order: dict, status="WORKING"):
+
+        self.next_order_id = self.next_order_id + 1
+        order["orderId"] = self.next_order_id
+        order["accountNumber"] = account.account_number
+        order["enteredTime"] = order_time(time.time())
+        order["entered"] = time.time()
+        order["status"] = status
+        order["filledQuantity"] = 0.0
+        order["remainingQuantity"] = order.get("quantity", 0)
+        self.orders[order["orderId"]] = order
+        account.orders.append(order)
+        for child in order.get("childOrderStrategies", []):
+            child["parentOrderId"] = order["orderId"]
+            child_status = "AWAITING_PARENT_ORDER" if order.get("orderStrategyType") == "TRIGGER" else status
+            self.add_order(account, child, child_status)
+        if status == "WORKING" and order.get("orderLegCollection"):
+            self.send_order(account, order)
+        return order
+
+    # Function to set a closing status on an order and its waiting children
+    def close_order(self, order: dict, status: str):
+
+        order["status"] = status
+        order["closeTime"] = order_time(time.time())
+        for child in order.get("childOrderStrategies", []):
+            if child["status"] in ["AWAITING_PARENT_ORDER", "WORKING"]:
+                self.close_order(child, "CANCELED")
+
+    # Function to fill a working order if it can fill
+    def try_fill(self, account: MockAccount, order: dict):
+
+        if time.time() - order["entered"] < self.fill_delay:
+            return
+        leg = order["orderLegCollection"][0]
+        symbol = leg["instrument"]["symbol"]
+        quote = self.quote(symbol)
+        if quote is None:
+            return
+        buy = leg["instruction"].startswith("BUY")
+        market_price = float(quote["askPrice"]) if buy else float(quote["bidPrice"])
+        if order["orderType"] == "MARKET":
+            price = market_price
+        elif self.fill_mode == "all" or (self.fill_mode == "marketable" and ((buy and order["price"] >= market_price) or (not buy and order["price"] <= market_price))):
+            price = float(order["price"])
+        else:
+            return
+
+        # Update cash and position
+        quantity = int(leg["quantity"])
+        account.cash = round(account.cash - self.order_cost(order, price), 2)
+        account.positions[symbol] = account.positions.get(symbol, 0) + (quantity if buy else -quantity)
+        if account.positions[symbol] == 0:
+            del account.positions[symbol]
+
+        # Record the execution and close the order
+        now = time.time()
+        order["status"] = "FILLED"
+        order["filledQuantity"] = float(quantity)
+        order["remainingQuantity"] = 0.0
+        order["closeTime"] = order_time(now)
+        order["orderActivityCollection"] = [{"activityType": "EXECUTION",
+                                             "executionType": "FILL",
+                                             "quantity": float(quantity),
+                                             "orderRemainingQuantity": 0.0,
+                                             "executionLegs": [{"legId": leg.get("legId", 0), "quantity": float(quantity), "price": price, "time": order_time(now)}]}]
+
+        # Send child orders of a TRIGGER order, and cancel the other orders
+        # of an OCO order
+        for child in order.get("childOrderStrategies", []):
+            if child["status"] == "AWAITING_PARENT_ORDER":
+                child["status"] = "WORKING"
+                child["entered"] = now
+                child["enteredTime"] = order_time(now)
+                if child.get("orderLegCollection"):
+                    self.send_order(account, child)
+        parent = self.orders.get(order.get("parentOrderId"))
+        if parent is not None and parent.get("orderStrategyType") == "OCO":
+            for sibling in parent["childOrderStrategies"]:
+                if sibling is not order and sibling["status"] == "WORKING":
+                    self.close_order(sibling, "CANCELED")
+            parent["status"] = "FILLED"
+
+    # Function to get an order as returned by the API, without the entered
+    # timestamp used by the simulation
+    def order_json(self, order: dict):
+
+        order_json = {key: value for key, value in order.items() if key != "entered"}
+        if "childOrderStrategies" in order:
+            order_json["childOrderStrategies"] = [self.order_json(child) for child in order["childOrderStrategies"]]
+        return order_json
+
+    # Function to get the positions of an account as returned by the API
+    def positions_json(self, account: MockAccount):
+
+        positions = []
+        for symbol, quantity in account.positions.items():
+            quote = self.quote(symbol) or {}
+            mark = (float(quote.get("bidPrice", 0.0)) + float(quote.get("askPrice", 0.0))) * 0.5
+            if is_option_symbol(symbol):
+                instrument = {"assetType": "OPTION", "symbol": symbol, "underlyingSymbol": symbol[0:6].strip(), "putCall": "CALL" if symbol[12] == "C" else "PUT"}
+                market_value = round(quantity * mark * 100.0, 2)
+            else:
+                instrument = {"assetType": "COLLECTIVE_INVESTMENT", "symbol": symbol}
+                market_value = round(quantity * mark, 2)
+            positions.append({"instrument": instrument,
+                              "longQuantity": float(max(quantity, 0)),
+                              "shortQuantity": float(max(-quantity, 0)),
+                              "marketValue": market_value})
+        return positions
+
+    # Function to get an account as returned by the API
+    def account_json(self, account: MockAccount, with_positions: bool):
+
+        positions = self.positions_json(account)
+        liquidation_value = round(account.cash + sum(position["marketValue"] for position in positions), 2)
+        securities_account = {"type": "CASH",
+                              "accountNumber": account.account_number,
+                              "currentBalances": {"cashBalance": account.cash, "liquidationValue": liquidation_value},
+                              "projectedBalances": {"availableFunds": round(account.cash - self.reserved_cash(account), 2)}}
+        if with_positions:
+            securities_account["positions"] = positions
+        return {"securitiesAccount": securities_account,
+                "aggregatedBalance": {"currentLiquidationValue": liquidation_value, "liquidationValue": liquidation_value}}
+
+    # Function to get an option chain as returned by the API, with calls for
+    # each weekday from from_date to to_date and strike_count strikes around
+    # the underlying price. A chain given in the scenario is returned as is.
+    def chain_json(self, symbol: str, from_date: str, to_date: str, strike_count: int):
+
+        if symbol in self.scenario.get("chains", {}):
+            return self.scenario["chains"][symbol]
+        underlying_quote = self.quotes.get(symbol)
+        if underlying_quote is None:
+            return {"symbol": symbol, "status": "FAILED", "callExpDateMap": {}}
+        price = (float(underlying_quote["bidPrice"]) + float(underlying_quote["askPrice"])) * 0.5
+        first_strike = round(price) - strike_count // 2
+        today = datetime.date.today()
+        day = datetime.date.fromisoformat(from_date) if from_date else today
+        last_day = datetime.date.fromisoformat(to_date) if to_date else day
+        exp_date_map = {}
+        while day <= last_day:
+            if day.weekday() < 5:
+                days = max((day - today).days, 0)
+                strikes = {}
+                for strike in range(first_strike, first_strike + strike_count):
+                    quote = self.option_quote(underlying_quote, days, "C", float(strike))
+                    strikes["%.1f" % strike] = [{"putCall": "CALL",
+                                                 "symbol": option_symbol(symbol, day.strftime("%y%m%d"), "C", strike),
+                                                 "bid": quote["bidPrice"],
+                                                 "ask": quote["askPrice"],
+                                                 "mark": quote["mark"],
+                                                 "delta": quote["delta"],
+                                                 "openInterest": 100,
+                                                 "strikePrice": float(strike),
+                                                 "daysToExpiration": days}]
+                exp_date_map[day.isoformat() + ":" + str(days)] = strikes
+            day = day + datetime.timedelta(days=1)
+        return {"symbol": symbol, "status": "SUCCESS", "underlyingPrice": price, "callExpDateMap": exp_date_map}
+
+    # Function to get the daily candles of a symbol as returned by the API,
+    # for each weekday from start_date to end_date (epoch milliseconds), or
+    # the last period years if start_date is None. Prices drift up to the
+    # current quote with a swing, so the all time high is some time back.
+    # Candles given in the scenario history are returned as is.
+    def price_history_json(self, symbol: str, start_date, end_date, period: int):
+
+        if symbol in self.scenario.get("history", {}):
+            return {"symbol": symbol, "empty": False, "candles": self.scenario["history"][symbol]}
+        quote = self.quotes.get(symbol)
+        if quote is None:
+            return {"symbol": symbol, "empty": True, "candles": []}
+        price = (float(quote["bidPrice"]) + float(quote["askPrice"])) * 0.5
+        today = datetime.date.today()
+        last_day = datetime.date.fromtimestamp(int(end_date) / 1000.0) if end_date else today
+        day = datetime.date.fromtimestamp(int(start_date) / 1000.0) if start_date else today - datetime.timedelta(days=365 * period)
+        candles = []
+        while day <= last_day:
+            if day.weekday() < 5:
+                days_ago = (today - day).days
+                close = round(price * (1.0 + 0.08 * math.sin(days_ago / 60.0)) * (1.0 - 0.0001 * days_ago), 2)
+                candles.append({"open": round(close * 0.999, 2), "high": round(close * 1.004, 2), "low": round(close * 0.996, 2), "close": close,
+                                "volume": 1000000, "datetime": int(datetime.datetime.combine(day, datetime.time()).timestamp() * 1000)})
+            day = day + datetime.timedelta(days=1)
+        return {"symbol": symbol, "empty": not candles, "candles": candles}
+
+    # Function to handle one request. Returns status code, response body and
+    # Location header, or None if there is no Location header.
+    def handle(self, method: str, path: str, body: bytes):
+
+        parts = urlsplit(path)
+        query = dict(parse_qsl(parts.query))
+        route = parts.path
+
+        with self.lock:
+
+            # Reset the scenario
+            if method == "POST" and route == "/mock/reset":
+                self.reset()
+                return 200, None, None
+
+            self.update()
+
+            # OAuth token
+            if method == "POST" and route.endswith("/oauth/token"):
+                return 200, {"access_token": "mock-access-token", "refresh_token": "mock-refresh-token",
+                             "token_type": "Bearer", "expires_in": 1800, "scope": "api"}, None
+
+            # Market data
+            if method == "GET" and route == "/marketdata/v1/quotes":
+                quotes = {}
+                for symbol in query.get("symbols", "").split(","):
+                    quote = self.quote(symbol)
+                    if quote is not None:
+                        quotes[symbol] = {"symbol": symbol, "quote": dict({"quoteTime": int(time.time() * 1000)}, **quote)}
+                return 200, quotes, None
+            if method == "GET" and route == "/marketdata/v1/chains":
+                return 200, self.chain_json(query.get("symbol", ""), query.get("fromDate"), query.get("toDate"), int(query.get("strikeCount", 24))), None
+
+            if method == "GET" and route == "/marketdata/v1/pricehistory":
+                return 200, self.price_history_json(query.get("symbol", ""), query.get("startDate"), query.get("endDate"), int(query.get("period", 1))), None
+
+            # User preferences with streamer info
+            if method == "GET" and route == "/trader/v1/userPreference":
+                return 200, {"accounts": [], "streamerInfo": [{"streamerSocketUrl": self.scenario.get("streamer_url", "ws://127.0.0.1:0"),
+                                                              "schwabClientCustomerId": "mock-customer",
+                                                              "schwabClientCorrelId": "mock-correl",
+                                                              "schwabClientChannel": "N9",
+                                                              "schwabClientFunctionId": "APIAPP"}]}, None
+
+            # Accounts
+            if method == "GET" and route == "/trader/v1/accounts/accountNumbers":
+                for account_hash in self.scenario["accounts"]:
+                    if account_hash != "default":
+                        self.account(account_hash)
+                return 200, [{"accountNumber": account.account_number, "hashValue": account.account_hash} for account in self.accounts.values()], None
+            match = re.fullmatch(r"/trader/v1/accounts/([^/]+)", route)
+            if method == "GET" and match:
+                return 200, self.account_json(self.account(match.group(1)), "positions" in query.get("fields", "")), None
+
+            # Orders
+            match = re.fullmatch(r"/trader/v1/accounts/([^/]+)/orders", route)
+            if match:
+                account = self.account(match.group(1))
+                if method == "GET":
+                    orders = [self.order_json(order) for order in account.orders if order["status"] != "AWAITING_PARENT_ORDER"]
+                    if "status" in query:
+                        orders = [order for order in orders if order["status"] == query["status"].upper()]
+                    return 200, orders, None
+                if method == "POST":
+                    order = self.add_order(account, json.loads(body))
+                    if order["status"] == "REJECTED":
+                        return 400, {"message": order["statusDescription"]}, None
+                    return 201, None, route + "/" + str(order["orderId"])
+            match = re.fullmatch(r"/trader/v1/accounts/([^/]+)/orders/(\d+)", route)
+            if match:
+                account = self.account(match.group(1))
+                order = self.orders.get(int(match.group(2)))
+                if order is None or order not in account.orders:
+                    return 404, {"message": "Order not found"}, None
+                if method == "GET":
+                    return 200, self.order_json(order), None
+                if order["status"] in TERMINAL_STATUSES:
+                    return 400, {"message": "Order is " + order["status"]}, None
+                if method == "DELETE":
+                    self.close_order(order, "CANCELED")
+                    return 200, None, None
+                if method == "PUT":
+                    self.close_order(order, "REPLACED")
+                    new_order = self.add_order(account, json.loads(body))
+                    if new_order["status"] == "REJECTED":
+                        return 400, {"message": new_order["statusDescription"]}, None
+                    return 201, None, route.rsplit("/", 1)[0] + "/" + str(new_order["orderId"])
+
+        return 404, {"message": "No mock for " + method + " " + route}, None
+
+
+# Class replaying requests recorded from the live API. Requests are matched
+# on method and path with the volatile query parameters removed. Repeated
+# requests get the recorded responses in order, and the last one once the
+# recording runs out.
+class ReplayAPI:
+
+    # Load recorded requests
+    def __init__(self, replay_file: str):
+
+        self.responses = {}
+        self.lock = threading.Lock()
+        with open(replay_file, "r") as replay_in:
+            for line in replay_in:
+                if line.strip():
+                    exchange = json.loads(line)
+                    self.responses.setdefault((exchange["method"], normalize_path(exchange["path"])), []).append(exchange)
+
+    # Function to handle one request
+    def handle(self, method: str, path: str, body: bytes):
+
+        with self.lock:
+            exchanges = self.responses.get((method, normalize_path(path)))
+            if not exchanges:
+                return 404, {"message": "No recorded response for " + method + " " + path}, None
+            exchange = exchanges.pop(0) if len(exchanges) > 1 else exchanges[0]
+        return exchange["status"], exchange["response"], exchange.get("location")
+
+
+# Class passing requests on to the live API and appending each request and
+# response to a record file for later replay. Tokens are not recorded.
+class RecordAPI:
+
+    # Open record file and HTTP session
+    def __init__(self, upstream: str, record_file: str):
+
+        import requests
+        self.upstream = upstream.rstrip("/")
+        self.session = requests.Session()
+        self.record_out = open(record_file, "a")
+        self.lock = threading.Lock()
+
+    # Function to handle one request
+    def handle(self, method: str, path: str, body: bytes, headers=None):
+
+        forward_headers = {key: value for key, value in (headers or {}).items() if key.lower() in ["authorization", "content-type", "accept"]}
+        content = self.session.request(method, self.upstream + path, headers=forward_headers, data=body, timeout=30.0)
+        try:
+            response = content.json()
+        except ValueError:
+            response = None
+        location = content.headers.get("Location")
+
+        # Leave tokens out of the record
+        request = None
+        recorded = response
+        if path.endswith("/oauth/token"):
+            if isinstance(response, dict):
+                recorded = dict(response, access_token="REDACTED", refresh_token="REDACTED", id_token="REDACTED")
+        elif body:
+            request = json.loads(body)
+        with self.lock:
+            self.record_out.write(json.dumps({"method": method, "path": path, "request": request, "status": content.status_code, "location": location, "response": recorded}) + "\n")
+            self.record_out.flush()
+        return content.status_code, response, location
+
+
+# Class handling HTTP requests by passing them to the server's API object
+class MockRequestHandler(BaseHTTPRequestHandler):
+
+    # Keep connections open like the live API, and send responses without
+    # waiting on Nagle's algorithm, which would add delayed ACK stalls to
+    # every request on a reused connection
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.respond("GET")
+
+    def do_POST(self):
+        self.respond("POST")
+
+    def do_PUT(self):
+        self.respond("PUT")
+
+    def do_DELETE(self):
+        self.respond("DELETE")
+
+    # Function to handle a request and write the response
+    def respond(self, method: str):
+
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.server.latency > 0.0:
+            time.sleep(self.server.latency)
+        if isinstance(self.server.api, RecordAPI):
+            status, response, location = self.server.api.handle(method, self.path, body, dict(self.headers))
+        else:
+            status, response, location = self.server.api.handle(method, self.path, body)
+        data = b"" if response is None else json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if location is not None:
+            self.send_header("Location", location if "://" in location else "http://" + self.headers.get("Host", "127.0.0.1") + location)
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.requests.append([time.time(), method, self.path, status, len(body), len(data)])
+
+    # Function to log requests unless the server is quiet
+    def log_message(self, format, *args):
+
+        if not self.server.quiet:
+            sys.stderr.write("%s - %s\n" % (self.log_date_time_string(), format % args))
+
+
+# Class for a local stand-in of the Schwab trader, market data and OAuth
+# endpoints. The API object is a MockSchwabAPI for scripted scenarios, a
+# ReplayAPI for recorded sessions or a RecordAPI to record a session. Each
+# response is held back latency seconds to stand in for the network.
+class MockSchwabServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    # Initialize server
+    def __init__(self, api, host="127.0.0.1", port=0, quiet=True, latency=0.0):
+
+        super().__init__((host, port), MockRequestHandler)
+        self.api = api
+        self.quiet = quiet
+        self.latency = latency
+        self.requests = []
+        self.thread = None
+
+    # Function to get the base URL of the server, to pass to the -api_url
+    # option of schwab_trader.py
+    def url(self):
+
+        return "http://" + self.server_address[0] + ":" + str(self.server_address[1])
+
+    # Function to serve requests on a background thread
+    def start(self):
+
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url()
+
+    # Function to stop serving
+    def stop(self):
+
+        self.shutdown()
+        self.server_close()
+
+# END FUNCTIONS
+
+if __name__ == "__main__":
+
+    # Argument Parsing
+    parser = argparse.ArgumentParser(description="Serve a local stand-in of the Schwab API for offline runs of schwab_trader.py")
+    parser.add_argument("-port","--port", required=False, default=8080, help='Port to serve on. Default is 8080.')
+    parser.add_argument("-scenario","--scenario", required=False, default="None", help='JSON file with the accounts, quotes, fill rules and events to simulate. Default is None (built in scenario).')
+    parser.add_argument("-replay","--replay", required=False, default="None", help='File of recorded requests to replay instead of simulating. Default is None.')
+    parser.add_argument("-record","--record", required=False, default="None", help='File to record requests and responses to. Requests are passed on to the live API. Default is None.')
+    parser.add_argument("-upstream","--upstream", required=False, default="https://api.schwabapi.com", help='API to pass requests on to when recording. Default is https://api.schwabapi.com.')
+    parser.add_argument("-latency","--latency", required=False, default=0.0, help='Seconds to hold back each response, to stand in for the network. Default is 0.0.')
+    parser.add_argument("-quiet","--quiet", action='store_true', help='Do not log each request.')
+    args = parser.parse_args()
+
+    # Set up API to serve
+    if args.record != "None":
+        api = RecordAPI(args.upstream, args.record)
+        print("Recording requests to " + args.upstream + " in " + args.record)
+    elif args.replay != "None":
+        api = ReplayAPI(args.replay)
+        print("Replaying requests from " + args.replay)
+    else:
+        api = MockSchwabAPI(load_scenario(None if args.scenario == "None" else args.scenario))
+        print("Simulating scenario " + ("built in" if args.scenario == "None" else args.scenario))
+
+    # Serve until interrupted
+    server = MockSchwabServer(api, port=int(args.port), quiet=args.quiet, latency=float(args.latency))
+    print("Serving mock Schwab API at " + server.url() + ". Run schwab_trader.py with -api_url " + server.url())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,199 @@
+#!/usr/bin/python
+import asyncio
+import argparse
+import json
+import time
+import websockets
+from schwab_streamer import AccountActivityStreamer, MAX_UNCLAIMED_FILLS
+
+# Class for a local stand-in of the Schwab streamer. It accepts LOGIN and
+# ACCT_ACTIVITY SUBS requests and pushes account activity messages for fills
+# so the streaming client can be exercised without a live account.
+class MockStreamerServer:
+
+    # Initialize server state
+    def __init__(self, host="127.0.0.1", port=0):
+
+        self.host = host
+        self.port = port
+        self.server = None
+        self.clients = set()
+        self.seq = 0
+
+    # Function to start serving and return streamer info pointing at the server
+    async def start(self):
+
+        self.server = await websockets.serve(self.handle_client, self.host, self.port)
+        self.port = list(self.server.sockets)[0].getsockname()[1]
+        return {"streamerSocketUrl": "ws://" + self.host + ":" + str(self.port),
+                "schwabClientCustomerId": "mock-customer",
+                "schwabClientCorrelId": "mock-correl",
+                "schwabClientChannel": "N9",
+                "schwabClientFunctionId": "APIAPP"}
+
+    # Function to handle requests from one client
+    async def handle_client(self, websocket, path=None):
+
+        try:
+            async for message in websocket:
+                for request in json.loads(message).get("requests", []):
+                    if request["command"] == "LOGIN" and not request["parameters"].get("Authorization"):
+                        code = 3
+                    else:
+                        code = 0
+                    if request["command"] == "SUBS" and request["service"] == "ACCT_ACTIVITY":
+                        self.clients.add(websocket)
+                    if request["command"] == "LOGOUT":
+                        self.clients.discard(websocket)
+                    await websocket.send(json.dumps({"response": [{"service": request["service"],
+                                                                   "command": request["command"],
+                                                                   "requestid": request["requestid"],
+                                                                   "SchwabClientCorrelId": request["SchwabClientCorrelId"],
+                                                                   "timestamp": int(time.time() * 1000),
+                                                                   "content": {"code": code, "msg": "mock"}}]}))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.clients.discard(websocket)
+
+    # Function to push an account activity message to subscribed clients
+    async def push_activity(self, message_type: str, message_data: dict, account="12345678"):
+
+        self.seq = self.seq + 1
+        message = json.dumps({"data": [{"service": "ACCT_ACTIVITY",
+                                        "timestamp": int(time.time() * 1000),
+                                        "command": "SUBS",
+                                        "content": [{"seq": self.seq,
+                                                     "key": "Account Activity",
+                                                     "1": account,
+                                                     "2": message_type,
+                                                     "3": json.dumps(message_data)}]}]})
+        for websocket in list(self.clients):
+            await websocket.send(message)
+
+    # Function to push a completed fill for an order
+    async def push_fill(self, order_id: str, symbol="SPY", quantity=1):
+
+        await self.push_activity("OrderFillCompleted", {"SchwabOrderID": str(order_id),
+                                                        "Symbol": symbol,
+                                                        "Quantity": quantity})
+
+    # Function to close the connection of every subscribed client, as if the
+    # streamer dropped them
+    async def drop_clients(self):
+
+        for websocket in list(self.clients):
+            await websocket.close()
+
+    # Function to stop the server
+    async def stop(self):
+
+        self.server.close()
+        await self.server.wait_closed()
+
+
+# Function to check that the streaming client resolves a fill pushed by the
+# mock server, and report how long it took
+async def self_check(delay: float):
+
+    server = MockStreamerServer()
+    streamer_info = await server.start()
+    logins = []
+    def get_access_token():
+        logins.append(time.time())
+        return "mock-access-token-" + str(len(logins))
+    streamer = AccountActivityStreamer(streamer_info, "mock-access-token", get_access_token, first_delay=0.1)
+    await streamer.connect()
+    print("Connected to mock streamer at " + streamer_info["streamerSocketUrl"])
+
+    # Push an unrelated message, then a fill for the order being waited on
+    waiter = asyncio.ensure_future(streamer.wait_for_fill("1001", delay + 5.0))
+    await asyncio.sleep(delay)
+    start = time.perf_counter()
+    await server.push_activity("OrderCreated", {"SchwabOrderID": "1001"})
+    await server.push_fill("1001")
+    fill = await waiter
+    elapsed = (time.perf_counter() - start) * 1000.0
+    if fill is None:
+        print("FAILED: fill for order 1001 not received")
+    else:
+        print("Fill for order 1001 received " + str(round(elapsed, 3)) + " ms after it was pushed")
+
+    # A fill received before waiting resolves right away, and is only kept
+    # until it is waited on
+    await server.push_fill("1002")
+    await asyncio.sleep(0.1)
+    kept = await streamer.wait_for_fill("1002", 0.5) is not None and not streamer.fills
+    print("Earlier fill for order 1002 found and removed" if kept else "FAILED: earlier fill for order 1002 not found or not removed")
+
+    # Fills nobody waits on are capped at the newest MAX_UNCLAIMED_FILLS
+    for order_id in range(MAX_UNCLAIMED_FILLS + 10):
+        await server.push_fill(str(2000 + order_id))
+    for attempt in range(50):
+        if str(2000 + MAX_UNCLAIMED_FILLS + 9) in streamer.fills:
+            break
+        await asyncio.sleep(0.1)
+    capped = len(streamer.fills) == MAX_UNCLAIMED_FILLS and "2000" not in streamer.fills
+    print("Unclaimed fills capped at " + str(len(streamer.fills)) if capped else "FAILED: " + str(len(streamer.fills)) + " unclaimed fills kept")
+
+    # A canceled order is done too
+    waiter = asyncio.ensure_future(streamer.wait_for_fill("1003", 5.0))
+    await asyncio.sleep(0.1)
+    await server.push_activity("OrderUROutCompleted", {"SchwabOrderID": "1003"})
+    canceled = await waiter is not None
+    print(("Cancel" if canceled else "FAILED: cancel") + " for order 1003 " + ("received" if canceled else "not received"))
+
+    # A dropped connection releases waiters right away, and the client logs
+    # in again with a new token
+    waiter = asyncio.ensure_future(streamer.wait_for_fill("1004", 5.0))
+    await asyncio.sleep(0.1)
+    start = time.perf_counter()
+    await server.drop_clients()
+    released = await waiter is None and time.perf_counter() - start < 1.0
+    print(("Waiter for order 1004 released " if released else "FAILED: waiter for order 1004 not released ") + str(round((time.perf_counter() - start) * 1000.0, 3)) + " ms after the connection dropped")
+    for attempt in range(50):
+        if streamer.connected:
+            break
+        await asyncio.sleep(0.1)
+    reconnected = streamer.connected and len(logins) == 2
+    print("Reconnected with a new token" if reconnected else "FAILED: not reconnected")
+    waiter = asyncio.ensure_future(streamer.wait_for_fill("1005", 5.0))
+    await asyncio.sleep(0.1)
+    await server.push_fill("1005")
+    refilled = await waiter is not None
+    print("Fill for order 1005 received after reconnecting" if refilled else "FAILED: fill for order 1005 not received after reconnecting")
+
+    await streamer.close()
+    await server.stop()
+    return fill is not None and kept and capped and canceled and released and reconnected and refilled
+
+
+# Function to run the mock server until interrupted. Order IDs typed on
+# stdin are pushed as fills.
+async def serve_forever(port: int):
+
+    server = MockStreamerServer(port=port)
+    streamer_info = await server.start()
+    print(json.dumps(streamer_info, indent=4))
+    print("Type an order ID and press enter to push a fill")
+    loop = asyncio.get_running_loop()
+    while True:
+        line = await loop.run_in_executor(None, input)
+        if line.strip():
+            await server.push_fill(line.strip())
+
+
+if __name__ == "__main__":
+
+    # Argument Parsing
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-port","--port", required=False, default=0, help='Port to serve on. Default is 0 (any free port).')
+    parser.add_argument("-self_check","--self_check", action='store_true', help='Run the streaming client against the mock server and report fill latency.')
+    parser.add_argument("-delay","--delay", required=False, default=0.5, help='Seconds to wait before pushing the fill in the self check. Default is 0.5.')
+    args = parser.parse_args()
+
+    if args.self_check:
+        if not asyncio.run(self_check(float(args.delay))):
+            raise SystemExit(1)
+    else:
+        asyncio.run(serve_forever(int(args.port)))
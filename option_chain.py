@@ -0,0 +1,163 @@
+#!/usr/bin/python
+from array import array
+from bisect import bisect_left, bisect_right
+
+# Class holding a decoded option chain as compact parallel arrays, one entry
+# per contract. Contracts can also be looked up by symbol, which returns
+# (bid, ask) so the chain can be used like the old symbol -> [bid, ask] dict.
+# After build_index is called, contracts are indexed by (expiry, strike) with
+# sorted strikes per expiry so strike selection queries use bisect.
+class OptionChain:
+
+    # Initialize empty parallel arrays
+    def __init__(self):
+
+        self.symbol = []
+        self.expiry = []
+        self.strike = array("d")
+        self.bid = array("d")
+        self.ask = array("d")
+        self.mark = array("d")
+        self.delta = array("d")
+        self.open_interest = array("q")
+        self.row = {}
+        self.expiry_strike_row = {}
+        self.expiry_index = {}
+
+    # Function to add one contract to the chain
+    def append(self, symbol: str, expiry: str, strike: float, bid: float, ask: float, mark: float, delta: float, open_interest: int):
+
+        self.row[symbol] = len(self.symbol)
+        self.symbol.append(symbol)
+        self.expiry.append(expiry)
+        self.strike.append(strike)
+        self.bid.append(bid)
+        self.ask.append(ask)
+        self.mark.append(mark)
+        self.delta.append(delta)
+        self.open_interest.append(open_interest)
+
+    def __len__(self):
+        return len(self.symbol)
+
+    def __contains__(self, symbol):
+        return symbol in self.row
+
+    def __iter__(self):
+        return iter(self.symbol)
+
+    def __getitem__(self, symbol):
+        row = self.row[symbol]
+        return self.bid[row], self.ask[row]
+
+    # Function to index contracts by (expiry, strike). For each expiry this
+    # stores the strikes in ascending order with their rows, the running
+    # maximum bid from the highest strike down and the running minimum ask
+    # from the lowest strike up. Both running values are stored negated so
+    # they are ascending and can be searched with bisect.
+    def build_index(self):
+
+        # Group rows by expiry
+        self.expiry_strike_row = {}
+        rows_by_expiry = {}
+        for row in range(len(self.symbol)):
+            self.expiry_strike_row[(self.expiry[row], self.strike[row])] = row
+            rows_by_expiry.setdefault(self.expiry[row], []).append(row)
+
+        # Build sorted strike arrays per expiry
+        self.expiry_index = {}
+        for expiry, rows in rows_by_expiry.items():
+            rows.sort(key=lambda row: self.strike[row])
+            strikes = [self.strike[row] for row in rows]
+            neg_max_bid = [0.0] * len(rows)
+            max_bid = float("-inf")
+            for i in range(len(rows) - 1, -1, -1):
+                max_bid = max(max_bid, self.bid[rows[i]])
+                neg_max_bid[i] = -max_bid
+            neg_min_ask = [0.0] * len(rows)
+            min_ask = float("inf")
+            for i in range(len(rows)):
+                min_ask = min(min_ask, self.ask[rows[i]])
+                neg_min_ask[i] = -min_ask
+            self.expiry_index[expiry] = (strikes, rows, neg_max_bid, neg_min_ask)
+
+    # Function to get the symbol for an expiry and strike. Returns None if
+    # the contract is not in the chain.
+    def find(self, expiry: str, strike: float):
+
+        row = self.expiry_strike_row.get((expiry, float(strike)))
+        if row is None:
+            return None
+        return self.symbol[row]
+
+    # Function to get the highest strike for an expiry with a bid at or above
+    # min_bid. If low_strike or high_strike are set, only strikes in that
+    # range are considered. Returns None if no contract matches.
+    def highest_strike_bid_at_least(self, expiry: str, min_bid: float, low_strike=None, high_strike=None):
+
+        if expiry not in self.expiry_index:
+            return None
+        strikes, rows, neg_max_bid, neg_min_ask = self.expiry_index[expiry]
+
+        # Search whole expiry using running maximum bid
+        if low_strike is None and high_strike is None:
+            i = bisect_right(neg_max_bid, -min_bid) - 1
+            if i < 0:
+                return None
+            return self.symbol[rows[i]]
+
+        # Narrow to strike range and search it from the top down
+        start = 0 if low_strike is None else bisect_left(strikes, low_strike)
+        end = len(strikes) if high_strike is None else bisect_right(strikes, high_strike)
+        for i in range(end - 1, start - 1, -1):
+            if self.bid[rows[i]] >= min_bid:
+                return self.symbol[rows[i]]
+        return None
+
+    # Function to get the lowest strike for an expiry with an ask at or below
+    # max_ask. Returns None if no contract matches.
+    def lowest_strike_ask_at_most(self, expiry: str, max_ask: float):
+
+        if expiry not in self.expiry_index:
+            return None
+        strikes, rows, neg_max_bid, neg_min_ask = self.expiry_index[expiry]
+        i = bisect_left(neg_min_ask, -max_ask)
+        if i >= len(rows):
+            return None
+        return self.symbol[rows[i]]
+
+
+# Function to decode a /chains response that has already been parsed from
+# JSON. Every contract is visited once. Expiration dates are stored in YYMMDD
+# format to match the date in the option symbol.
+def decode_option_chain(chain: dict, exp_date_map="callExpDateMap"):
+
+    # Create empty chain
+    option_chain = OptionChain()
+
+    # Loop over expiration dates and strike prices
+    for exp_date, strikes in chain.get(exp_date_map, {}).items():
+        expiry = exp_date[2:4] + exp_date[5:7] + exp_date[8:10]
+        for strike_price, contracts in strikes.items():
+            contract = contracts[0]
+            option_chain.append(contract["symbol"],
+                                expiry,
+                                float(strike_price),
+                                float(contract["bid"]),
+                                float(contract["ask"]),
+                                float(contract.get("mark", 0.0)),
+                                float(contract.get("delta", 0.0)),
+                                int(contract.get("openInterest", 0)))
+
+    # Index contracts by expiry and strike
+    option_chain.build_index()
+
+    # Return the decoded chain
+    return option_chain
+
+
+# Function to get the expiration date (YYMMDD) and strike price from an
+# option symbol such as "SPY   250911C00647000"
+def parse_option_symbol(symbol: str):
+
+    return symbol[6:12], int(symbol[13:21]) / 1000.0
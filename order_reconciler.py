@@ -0,0 +1,99 @@
+#!/usr/bin/python
+import math
+from dataclasses import dataclass
+
+# Actions an order plan can take
+KEEP = "KEEP"
+REPLACE = "REPLACE"
+CANCEL = "CANCEL"
+PLACE = "PLACE"
+
+
+# Class for one step of an order plan. order is [symbol, instruction,
+# quantity, price]: the wanted order for KEEP, REPLACE and PLACE, and the
+# working order for CANCEL. order_id is the working order kept, replaced or
+# canceled, and None for PLACE.
+@dataclass
+class OrderAction:
+    action: str
+    order_id: object
+    order: list
+
+
+# Class indexing working orders, as returned by get_orders, by symbol and
+# instruction, so finding the orders for a symbol is a lookup instead of a
+# scan of every order
+class OrderIndex:
+
+    # Build index from a dictionary of order ID to [symbol, instruction,
+    # quantity, price]
+    def __init__(self, orders: dict):
+
+        self.orders = orders
+        self.index = {}
+        for order_id in orders:
+            self.index.setdefault((orders[order_id][0], orders[order_id][1]), []).append(order_id)
+
+    # Function to get the IDs of orders for a symbol and instruction
+    def find(self, symbol: str, instruction: str):
+        return self.index.get((symbol, instruction), [])
+
+    # Function to get the IDs of orders for a symbol, instruction and quantity
+    def find_quantity(self, symbol: str, instruction: str, quantity: int):
+        return [order_id for order_id in self.find(symbol, instruction) if self.orders[order_id][2] == quantity]
+
+
+# Function to check if a working order is the same as a wanted order
+def orders_match(wanted: list, working: list):
+
+    return wanted[0] == working[0] and wanted[1] == working[1] and wanted[2] == working[2] and math.isclose(wanted[3], working[3])
+
+
+# Function to work out the fewest actions that turn the working orders into
+# the wanted orders. Working orders the same as a wanted order are kept. For
+# each symbol and instruction, other working orders are replaced by the
+# remaining wanted orders, preferring orders of the same quantity, then any
+# wanted orders left are placed and any working orders left are canceled.
+# Only working orders for the symbols and instructions in managed_keys are
+# touched, which defaults to those of the wanted orders. Cancels come first
+# so they free buying power, then the wanted orders in the order given.
+def reconcile_orders(wanted: list, working: dict, managed_keys=None):
+
+    index = OrderIndex(working)
+    if managed_keys is None:
+        managed_keys = [(order[0], order[1]) for order in wanted]
+
+    # Keep working orders that match a wanted order
+    unmatched = {}
+    for key in managed_keys:
+        unmatched[tuple(key)] = list(index.find(key[0], key[1]))
+    steps = []
+    for order in wanted:
+        candidates = unmatched.setdefault((order[0], order[1]), [])
+        match = next((order_id for order_id in candidates if orders_match(order, working[order_id])), None)
+        if match is not None:
+            candidates.remove(match)
+        steps.append([order, match])
+
+    # Replace other working orders for the same symbol and instruction, or
+    # place a new order if there are none
+    plan = []
+    for order, match in steps:
+        if match is not None:
+            plan.append(OrderAction(KEEP, match, order))
+            continue
+        candidates = unmatched[(order[0], order[1])]
+        if candidates:
+            same_quantity = [order_id for order_id in candidates if working[order_id][2] == order[2]]
+            order_id = (same_quantity or candidates)[0]
+            candidates.remove(order_id)
+            plan.append(OrderAction(REPLACE, order_id, order))
+        else:
+            plan.append(OrderAction(PLACE, None, order))
+
+    # Cancel working orders left over
+    cancels = []
+    for key in unmatched:
+        for order_id in unmatched[key]:
+            cancels.append(OrderAction(CANCEL, order_id, working[order_id]))
+    return cancels + plan
@@ -0,0 +1,106 @@
+#!/usr/bin/python
+import sqlite3
+import datetime
+import threading
+
+# START FUNCTIONS
+
+# Class caching daily bars for many tickers in one SQLite file. Bars are
+# keyed by ticker and date, so the bars of a ticker are read from the index
+# without scanning the others. The all time high of each ticker is kept with
+# the date it was last updated, so it is read without looking at the bars.
+#
+# Only completed days are stored. The first update of a ticker loads its
+# full history; after that each day needs one request for the days since the
+# last bar stored.
+class PriceHistory:
+
+    # Open, or create, the cache in db_file
+    def __init__(self, db_file: str):
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_file, timeout=30.0, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS bars (ticker TEXT, date TEXT, open REAL, high REAL, low REAL, close REAL, volume INTEGER, PRIMARY KEY (ticker, date)) WITHOUT ROWID")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS tickers (ticker TEXT PRIMARY KEY, updated TEXT, ath REAL, ath_date TEXT)")
+
+    # Function to get the date (YYYY-MM-DD) a ticker was last updated, and the
+    # date of its last bar. Either is None if not known.
+    def last_update(self, ticker: str):
+
+        with self.lock:
+            updated = self.connection.execute("SELECT updated FROM tickers WHERE ticker = ?", (ticker,)).fetchone()
+            last_bar = self.connection.execute("SELECT MAX(date) FROM bars WHERE ticker = ?", (ticker,)).fetchone()
+        return (updated[0] if updated else None), last_bar[0]
+
+    # Function to bring the bars of a ticker up to date, at most once a day.
+    # fetch_candles(ticker, start_date) returns the daily candles of the API
+    # from start_date (a datetime.date, or None for the full history) to
+    # today, or None if the request failed. Returns False if the request
+    # failed, so cached bars are used as they are.
+    def update(self, ticker: str, fetch_candles, today=None):
+
+        today = datetime.date.today() if today is None else today
+        updated, last_bar = self.last_update(ticker)
+        if updated == today.isoformat():
+            return True
+
+        # Request the days after the last bar, or the full history
+        start_date = None if last_bar is None else datetime.date.fromisoformat(last_bar) + datetime.timedelta(days=1)
+        candles = fetch_candles(ticker, start_date)
+        if candles is None:
+            return False
+
+        # Store completed days and update the all time high
+        bars = []
+        for candle in candles:
+            date = datetime.datetime.fromtimestamp(candle["datetime"] / 1000.0).date()
+            if date < today:
+                bars.append((ticker, date.isoformat(), float(candle["open"]), float(candle["high"]), float(candle["low"]), float(candle["close"]), int(candle.get("volume", 0))))
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?)", bars)
+            ath = self.connection.execute("SELECT high, date FROM bars WHERE ticker = ? ORDER BY high DESC, date LIMIT 1", (ticker,)).fetchone()
+            self.connection.execute("INSERT OR REPLACE INTO tickers VALUES (?, ?, ?, ?)", (ticker, today.isoformat(), ath[0] if ath else None, ath[1] if ath else None))
+        return True
+
+    # Function to get the all time high of a ticker from cached bars, and the
+    # date it was set. Both are None if no bars are cached.
+    def all_time_high(self, ticker: str):
+
+        with self.lock:
+            row = self.connection.execute("SELECT ath, ath_date FROM tickers WHERE ticker = ?", (ticker,)).fetchone()
+        return (row[0], row[1]) if row else (None, None)
+
+    # Function to get the highest high of the last days cached bars of a
+    # ticker, or None if no bars are cached
+    def rolling_high(self, ticker: str, days: int):
+
+        with self.lock:
+            row = self.connection.execute("SELECT MAX(high) FROM (SELECT high FROM bars WHERE ticker = ? ORDER BY date DESC LIMIT ?)", (ticker, days)).fetchone()
+        return row[0]
+
+    # Function to get the percent price is below the all time high of a
+    # ticker, counting high_of_day as part of the history. Returns None if
+    # the all time high is not known.
+    def drawdown(self, ticker: str, price: float, high_of_day=0.0):
+
+        ath = max(self.all_time_high(ticker)[0] or 0.0, high_of_day)
+        if ath <= 0.0:
+            return None
+        return round((ath - price) / ath * 100.0, 2)
+
+    # Function to get the cached bars of a ticker from start to end dates
+    # (YYYY-MM-DD), oldest first, as tuples of date, open, high, low, close
+    # and volume
+    def bars(self, ticker: str, start="0000-00-00", end="9999-99-99"):
+
+        with self.lock:
+            return self.connection.execute("SELECT date, open, high, low, close, volume FROM bars WHERE ticker = ? AND date >= ? AND date <= ? ORDER BY date", (ticker, start, end)).fetchall()
+
+    # Function to close the cache
+    def close(self):
+
+        with self.lock:
+            self.connection.close()
+
+# END FUNCTIONS
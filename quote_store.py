@@ -0,0 +1,228 @@
+#!/usr/bin/python
+import os
+import sys
+import time
+import glob
+import struct
+import argparse
+import datetime
+import threading
+
+# Fields of a quote record, and the quote keys they are taken from. Times are
+# the local wall clock time of the quote in milliseconds since 1970-01-01, so
+# they read as local times when viewed as datetime64[ms].
+QUOTE_FIELDS = [("time", "q", "quoteTime"),
+                ("bid", "d", "bidPrice"),
+                ("ask", "d", "askPrice"),
+                ("last", "d", "lastPrice"),
+                ("high", "d", "highPrice"),
+                ("low", "d", "lowPrice"),
+                ("volume", "q", "totalVolume")]
+
+# Packed layout of a quote record. Records are fixed width and little endian
+# with no padding, so a file of them is a flat array.
+QUOTE_RECORD = struct.Struct("<" + "".join(code for name, code, key in QUOTE_FIELDS))
+
+# Extension of quote files
+QUOTE_EXTENSION = ".quotes"
+
+# START FUNCTIONS
+
+# Function to get the numpy dtype of a quote record
+def quote_dtype():
+
+    import numpy as np
+    return np.dtype([(name, "<M8[ms]" if name == "time" else "<" + ("i8" if code == "q" else "f8")) for name, code, key in QUOTE_FIELDS])
+
+
+# Function to get the file holding the quotes of a ticker on a day
+# (YYYYMMDD)
+def quote_file(store_dir: str, ticker: str, day: str):
+
+    return os.path.join(store_dir, ticker, day + QUOTE_EXTENSION)
+
+
+# Function to get the local wall clock time of a quote in milliseconds.
+# Uses the quote time, or received (a time.time() value) if it is missing.
+def local_millis(quote: dict, received: float):
+
+    seconds = quote["quoteTime"] / 1000.0 if quote.get("quoteTime") else received
+    local_time = datetime.datetime.fromtimestamp(seconds)
+    return round((local_time - datetime.datetime(1970, 1, 1)).total_seconds() * 1000.0)
+
+
+# Class appending quotes to one file per ticker per day. Each quote is
+# written and flushed as soon as it is recorded, so readers see it right
+# away. A quote no newer than the last one recorded for the ticker is
+# skipped, which keeps each file in time order.
+class QuoteRecorder:
+
+    # Initialize recorder writing under store_dir
+    def __init__(self, store_dir: str):
+
+        self.store_dir = store_dir
+        self.files = {}
+        self.last_times = {}
+        self.lock = threading.Lock()
+
+    # Function to open the quote file of a ticker for a day, closing the file
+    # of the day before. A partly written record left by a crash is cut off
+    # so later records line up.
+    def open_file(self, ticker: str, day: str):
+
+        if ticker in self.files:
+            self.files[ticker][1].close()
+        file_name = quote_file(self.store_dir, ticker, day)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        quote_out = open(file_name, "ab")
+        size = quote_out.tell()
+        if size % QUOTE_RECORD.size != 0:
+            size = size - size % QUOTE_RECORD.size
+            quote_out.truncate(size)
+        if size > 0 and ticker not in self.last_times:
+            with open(file_name, "rb") as quote_in:
+                quote_in.seek(size - QUOTE_RECORD.size)
+                self.last_times[ticker] = QUOTE_RECORD.unpack(quote_in.read(QUOTE_RECORD.size))[0]
+        self.files[ticker] = [day, quote_out]
+        return quote_out
+
+    # Function to record a quote. received is the time.time() the quote was
+    # received, used if the quote has no quote time. Returns True if the
+    # quote was written.
+    def record(self, ticker: str, quote: dict, received=None):
+
+        millis = local_millis(quote, time.time() if received is None else received)
+        day = datetime.datetime(1970, 1, 1) + datetime.timedelta(milliseconds=millis)
+        values = [millis]
+        for name, code, key in QUOTE_FIELDS[1:]:
+            value = quote.get(key)
+            if code == "q":
+                values.append(int(value) if value is not None else 0)
+            else:
+                values.append(float(value) if value is not None else float("nan"))
+        with self.lock:
+            if ticker not in self.files or self.files[ticker][0] != day.strftime("%Y%m%d"):
+                self.open_file(ticker, day.strftime("%Y%m%d"))
+            if millis <= self.last_times.get(ticker, -1):
+                return False
+            quote_out = self.files[ticker][1]
+            quote_out.write(QUOTE_RECORD.pack(*values))
+            quote_out.flush()
+            self.last_times[ticker] = millis
+        return True
+
+    # Function to close all open quote files
+    def close(self):
+
+        with self.lock:
+            for day, quote_out in self.files.values():
+                quote_out.close()
+            self.files = {}
+
+
+# Function to open a quote file memory mapped as an array of quote records.
+# A partly written last record is left out.
+def open_quotes(file_name: str):
+
+    import numpy as np
+    dtype = quote_dtype()
+    count = os.path.getsize(file_name) // dtype.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(file_name, dtype=dtype, mode="r", shape=(count,))
+
+
+# Function to read the quotes of a ticker from start to end, given as local
+# times such as "2026-10-16" or "2026-10-16 09:30". Either can be None to
+# read from the first or to the last quote. Only the files of days in the
+# range are opened, and each is cut to the range by binary search on the
+# time column. Returns a single array of quote records; a range inside one
+# day is a view of the memory mapped file.
+def read_quotes(store_dir: str, ticker: str, start=None, end=None):
+
+    import numpy as np
+    start_time = None if start is None else np.datetime64(start.replace(" ", "T"), "ms")
+    end_time = None if end is None else np.datetime64(end.replace(" ", "T"), "ms")
+    if end_time is not None and len(end) <= 10:
+        end_time = end_time + np.timedelta64(1, "D") - np.timedelta64(1, "ms")
+    start_day = None if start_time is None else str(start_time.astype("datetime64[D]")).replace("-", "")
+    end_day = None if end_time is None else str(end_time.astype("datetime64[D]")).replace("-", "")
+
+    # Cut each day in the range to the start and end times
+    parts = []
+    for file_name in sorted(glob.glob(os.path.join(store_dir, ticker, "*" + QUOTE_EXTENSION))):
+        day = os.path.basename(file_name)[:-len(QUOTE_EXTENSION)]
+        if (start_day is not None and day < start_day) or (end_day is not None and day > end_day):
+            continue
+        quotes = open_quotes(file_name)
+        first = 0 if start_time is None else np.searchsorted(quotes["time"], start_time, side="left")
+        last = len(quotes) if end_time is None else np.searchsorted(quotes["time"], end_time, side="right")
+        if last > first:
+            parts.append(quotes[first:last])
+    if not parts:
+        return np.zeros(0, dtype=quote_dtype())
+    if len(parts) == 1:
+        return parts[0]
+    return np.concatenate(parts)
+
+
+# Function to turn quotes into minute bars of the last price, in the form
+# range_trade_backtest.run_backtest takes. Volume is left out since quotes
+# only carry the volume traded so far that day.
+def quote_bars(quotes):
+
+    import numpy as np
+    quotes = quotes[~np.isnan(quotes["last"])]
+    minutes = quotes["time"].astype("datetime64[m]")
+    starts = np.flatnonzero(np.r_[True, minutes[1:] != minutes[:-1]]) if len(quotes) > 0 else np.zeros(0, dtype=np.int64)
+    ends = np.r_[starts[1:], len(quotes)].astype(np.int64) - 1
+    last = np.asarray(quotes["last"])
+    return {"time": minutes[starts],
+            "open": last[starts],
+            "high": np.maximum.reduceat(last, starts) if len(starts) > 0 else last[:0],
+            "low": np.minimum.reduceat(last, starts) if len(starts) > 0 else last[:0],
+            "close": last[ends],
+            "volume": None}
+
+# END FUNCTIONS
+
+if __name__ == "__main__":
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(description="Read quotes recorded by schwab_trader.py -quote_store")
+    parser.add_argument("-quote_store","--quote_store", default="quotes", help='Directory quotes are recorded in. Default is quotes')
+    parser.add_argument("-ticker","--ticker", default="None", help='Ticker to read quotes for')
+    parser.add_argument("-start","--start", default="None", help='Local time to read from, such as 2026-10-16 or "2026-10-16 09:30". Default is None (first quote)')
+    parser.add_argument("-end","--end", default="None", help='Local time to read to, such as 2026-10-16 or "2026-10-16 16:00". Default is None (last quote)')
+    parser.add_argument("-csv","--csv", default="None", help='CSV file to write minute bars of the last price to, in the form range_trade_backtest.py reads. Default is None')
+    args = parser.parse_args()
+
+    # Check required options
+    if args.ticker == "None":
+        print("Option -ticker is required. Exiting")
+        sys.exit(1)
+
+    # Read quotes, timing the read without the numpy import
+    quote_dtype()
+    start_time = time.perf_counter()
+    quotes = read_quotes(args.quote_store, args.ticker, None if args.start == "None" else args.start, None if args.end == "None" else args.end)
+    elapsed = time.perf_counter() - start_time
+    if len(quotes) == 0:
+        print("No quotes found for " + args.ticker + " in " + args.quote_store)
+        sys.exit(1)
+
+    # Write out summary
+    print("Quotes:    " + str(len(quotes)) + ", " + str(quotes["time"][0]).replace("T", " ") + " to " + str(quotes["time"][-1]).replace("T", " "))
+    print("Last:      " + str(quotes["last"][-1]))
+    print("High:      " + str(quotes["high"][-1]))
+    print("Low:       " + str(quotes["low"][-1]))
+    print("Read in " + str(round(elapsed * 1000.0, 3)) + " ms")
+
+    # Write minute bars, if requested
+    if args.csv != "None":
+        bars = quote_bars(quotes)
+        with open(args.csv, "w") as bars_out:
+            bars_out.write("time,open,high,low,close\n")
+            for index in range(len(bars["time"])):
+                bars_out.write(str(bars["time"][index]).replace("T", " ") + "," + ",".join(repr(float(bars[name][index])) for name in ["open", "high", "low", "close"]) + "\n")
+        print("Wrote " + str(len(bars["time"])) + " minute bars to " + args.csv)
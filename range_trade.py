@@ -0,0 +1,14 @@
+#!/usr/bin/python
+
+# Function to construct range trade orders for the current price and share
+# count from a Ladder. Returns a dictionary of orders, each a list of
+# [ticker, instruction, shares, limit price], with any sell order first.
+def build_range_trade_orders(ticker: str, current: float, position: int, ladder):
+
+    buy_shares, buy_price, sell_shares, sell_price = ladder.orders(position, current)
+    orders = {}
+    if sell_shares > 0:
+        orders[len(orders)] = [ticker, "SELL", int(sell_shares), float(sell_price)]
+    if buy_shares > 0:
+        orders[len(orders)] = [ticker, "BUY", int(buy_shares), float(buy_price)]
+    return orders
@@ -0,0 +1,265 @@
+#!/usr/bin/python
+import os
+import sys
+import csv
+import argparse
+import time
+import numpy as np
+from settings import load_range_trade_settings
+from quote_store import read_quotes, quote_bars
+
+# START FUNCTIONS
+
+# Function to load minute bars from a CSV file with columns of time, open,
+# high, low, close and an optional volume. Times are in Eastern time, either
+# as "YYYY-MM-DD HH:MM" text or as epoch seconds. A header line is skipped.
+# Only bars in the regular session (9:30 to 15:59) are kept.
+def load_bars(csv_file: str):
+
+    # Read columns from input file
+    times, columns = [], [[], [], [], [], []]
+    with open(csv_file, 'r', newline='') as file:
+        for row in csv.reader(file):
+            if len(row) < 5 or not row[1].strip().replace('.', '', 1).isdigit():
+                continue
+            times.append(row[0].strip())
+            for column in range(5):
+                columns[column].append(row[column + 1] if column + 1 < len(row) else "nan")
+    if not times:
+        raise ValueError("No bars found in " + csv_file)
+
+    # Convert to arrays
+    if times[0].isdigit():
+        bar_times = np.array(times, dtype=np.int64).astype("datetime64[s]").astype("datetime64[m]")
+    else:
+        bar_times = np.array([bar_time.replace(' ', 'T') for bar_time in times], dtype="datetime64[m]")
+    bars = {"time": bar_times}
+    for name, column in zip(["open", "high", "low", "close", "volume"], columns):
+        bars[name] = np.array(column, dtype=np.float64)
+    if np.isnan(bars["volume"]).all():
+        bars["volume"] = None
+
+    # Keep regular session bars, in time order
+    return session_bars(bars)
+
+
+# Function to keep only bars in the regular session (9:30 to 15:59), in time
+# order
+def session_bars(bars: dict):
+
+    minutes = (bars["time"] - bars["time"].astype("datetime64[D]")).astype(np.int64)
+    keep = (minutes >= 570) & (minutes <= 959)
+    order = np.argsort(bars["time"][keep], kind="stable")
+    return {name: (None if values is None else values[keep][order]) for name, values in bars.items()}
+
+
+# Function to get prices of the buying power ticker lined up with bar times.
+# Each bar gets the close of the last buying power bar at or before it.
+def align_prices(bars: dict, price_bars: dict):
+
+    index = np.searchsorted(price_bars["time"], bars["time"], side="right") - 1
+    return price_bars["close"][np.clip(index, 0, len(price_bars["time"]) - 1)]
+
+
+# Function to get the price each cycle decides its orders on. Within a day
+# this is the close of the previous bar. On the first bar of a day it is the
+# open, since orders are DAY orders placed again each morning.
+def decision_prices(bars: dict):
+
+    prices = np.empty_like(bars["close"])
+    prices[0] = bars["open"][0]
+    prices[1:] = bars["close"][:-1]
+    days = bars["time"].astype("datetime64[D]")
+    new_day = np.concatenate([[False], days[1:] != days[:-1]])
+    prices[new_day] = bars["open"][new_day]
+    return prices
+
+
+# Function to backtest a range trade ladder over minute bars. Each minute the
+# orders are rebuilt from the previous close and the share count, and an
+# ALL_OR_NONE limit order fills in full if the bar trades through its price
+# (and, when volume is known, at least as many shares as the order traded).
+# A buy fills at its limit price or a better open. Buys first use cash, then
+# sell shares of the buying power ticker. At the end of each day, if prices
+# for the buying power ticker are given, cash is parked in it.
+#
+# Share count only changes on a fill, so instead of stepping through every
+# bar the whole block of bars up to the next fill is checked at once with
+# NumPy, in blocks that grow while no fill is found.
+def run_backtest(bars: dict, ladder, cash=100000.0, position=0, buying_power_prices=None):
+
+    opens, highs, lows, closes, volumes = bars["open"], bars["high"], bars["low"], bars["close"], bars["volume"]
+    num_bars = len(closes)
+
+    # Ladder targets for each bar's decision price
+    prices = decision_prices(bars)
+    buy_target = ladder.buy_target(prices)
+    sell_target = ladder.sell_target(prices)
+
+    # Last bar of each day, for parking cash
+    days = bars["time"].astype("datetime64[D]")
+    day_end = np.concatenate([days[1:] != days[:-1], [True]])
+
+    # Starting account
+    start_cash, start_position = cash, position
+    start_equity = cash + position * prices[0]
+    parked = 0
+    fills = []
+    changes = []
+
+    # Scan bars in blocks for the next fill or cash to park
+    start, block = 0, 256
+    while start < num_bars:
+        end = min(start + block, num_bars)
+        buy_shares, buy_price, sell_shares, sell_price = ladder.orders_for_targets(position, buy_target[start:end], sell_target[start:end])
+        funds = cash if buying_power_prices is None else cash + parked * buying_power_prices[start:end]
+        buy_hit = (buy_shares > 0) & (lows[start:end] <= buy_price) & (buy_shares * buy_price <= funds)
+        sell_hit = (sell_shares > 0) & (highs[start:end] >= sell_price)
+        if volumes is not None:
+            buy_hit &= volumes[start:end] >= buy_shares
+            sell_hit &= volumes[start:end] >= sell_shares
+        park_hit = np.zeros(end - start, dtype=bool)
+        if buying_power_prices is not None:
+            park_hit = day_end[start:end] & (cash >= buying_power_prices[start:end])
+        hits = np.flatnonzero(buy_hit | sell_hit | park_hit)
+        if len(hits) == 0:
+            start, block = end, min(block * 2, 65536)
+            continue
+
+        # Apply the fill on the first bar found
+        hit = hits[0]
+        bar = start + hit
+        change = [bar, 0, 0.0, 0]
+        if buy_hit[hit] and sell_hit[hit]:
+            # Both orders traded through, take the one nearest the open
+            buy_first = abs(opens[bar] - buy_price[hit]) <= abs(sell_price[hit] - opens[bar])
+        else:
+            buy_first = buy_hit[hit]
+        if buy_first:
+            price = min(buy_price[hit], opens[bar])
+            cost = buy_shares[hit] * price
+            if cost > cash:
+                sell_parked = min(int((cost - cash) / buying_power_prices[bar]) + 1, parked)
+                parked = parked - sell_parked
+                cash = cash + sell_parked * buying_power_prices[bar]
+                change[2] = change[2] + sell_parked * buying_power_prices[bar]
+                change[3] = change[3] - sell_parked
+            cash = cash - cost
+            position = position + int(buy_shares[hit])
+            change[1], change[2] = int(buy_shares[hit]), change[2] - cost
+            fills.append([bar, "BUY", int(buy_shares[hit]), price])
+        elif sell_hit[hit]:
+            price = max(sell_price[hit], opens[bar])
+            cash = cash + sell_shares[hit] * price
+            position = position - int(sell_shares[hit])
+            change[1], change[2] = -int(sell_shares[hit]), sell_shares[hit] * price
+            fills.append([bar, "SELL", int(sell_shares[hit]), price])
+        if buying_power_prices is not None and day_end[bar]:
+            park_shares = int(cash / buying_power_prices[bar])
+            parked = parked + park_shares
+            cash = cash - park_shares * buying_power_prices[bar]
+            change[2] = change[2] - park_shares * buying_power_prices[bar]
+            change[3] = change[3] + park_shares
+        changes.append(change)
+        start, block = bar + 1, 256
+
+    # Build share count, cash and equity for every bar from the changes
+    share_change = np.zeros(num_bars, dtype=np.int64)
+    cash_change = np.zeros(num_bars)
+    parked_change = np.zeros(num_bars, dtype=np.int64)
+    if changes:
+        changes = np.array(changes)
+        index = changes[:, 0].astype(np.int64)
+        share_change[index] = changes[:, 1].astype(np.int64)
+        cash_change[index] = changes[:, 2]
+        parked_change[index] = changes[:, 3].astype(np.int64)
+    positions = start_position + np.cumsum(share_change)
+    equity = start_cash + np.cumsum(cash_change) + positions * closes
+    if buying_power_prices is not None:
+        equity = equity + np.cumsum(parked_change) * buying_power_prices
+    drawdown = np.maximum.accumulate(equity) - equity
+
+    return {"bars": num_bars,
+            "days": int(day_end.sum()),
+            "fills": fills,
+            "buys": sum(1 for fill in fills if fill[1] == "BUY"),
+            "sells": sum(1 for fill in fills if fill[1] == "SELL"),
+            "position": position,
+            "cash": cash,
+            "parked": parked,
+            "start_equity": start_equity,
+            "end_equity": float(equity[-1]),
+            "pnl": float(equity[-1]) - start_equity,
+            "max_drawdown": float(drawdown.max()),
+            "positions": positions,
+            "equity": equity}
+
+# END FUNCTIONS
+
+if __name__ == "__main__":
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(description="Backtest range trading a stock or ETF over minute bars")
+    parser.add_argument("-csv","--csv", default="None", help='CSV file of minute bars: time, open, high, low, close and optional volume')
+    parser.add_argument("-quote_store","--quote_store", default="None", help='Directory of quotes recorded by schwab_trader.py -quote_store to build minute bars of the ticker from, instead of -csv')
+    parser.add_argument("-ticker","--ticker", default="None", help='Stock or ETF symbol. Settings are read from schwab_$ticker_range_trade.ini')
+    parser.add_argument("-settings_file","--settings_file", default="None", help='Range trade settings file to use instead of schwab_$ticker_range_trade.ini')
+    parser.add_argument("-buying_power_csv","--buying_power_csv", default="None", help='CSV file of minute bars for the buying power ticker. Without it, cash is not parked')
+    parser.add_argument("-cash","--cash", type=float, default=100000.0, help='Starting cash. Default is 100000')
+    parser.add_argument("-start_shares","--start_shares", type=int, default=0, help='Starting number of shares owned. Default is 0')
+    parser.add_argument("-fills_file","--fills_file", default="None", help='CSV file to write each fill to')
+    args = parser.parse_args()
+
+    # Check required options
+    if args.csv == "None" and (args.quote_store == "None" or args.ticker == "None"):
+        print("Option -csv, or -quote_store with -ticker, is required. Exiting")
+        sys.exit(1)
+    if args.ticker == "None" and args.settings_file == "None":
+        print("Option -ticker or -settings_file is required. Exiting")
+        sys.exit(1)
+    settings_file = args.settings_file
+    if settings_file == "None":
+        settings_file = "schwab_" + args.ticker + "_range_trade.ini"
+    for input_file in [settings_file] + ([args.csv] if args.csv != "None" else []):
+        if not os.path.exists(input_file):
+            print("Input file: " + input_file + " does not exist. Exiting")
+            sys.exit(1)
+
+    # Load settings and bars
+    settings = load_range_trade_settings(settings_file)
+    if args.csv != "None":
+        bars = load_bars(args.csv)
+    else:
+        bars = session_bars(quote_bars(read_quotes(args.quote_store, args.ticker)))
+        if len(bars["time"]) == 0:
+            print("No quotes found for " + args.ticker + " in " + args.quote_store + ". Exiting")
+            sys.exit(1)
+    buying_power_prices = None
+    if args.buying_power_csv != "None":
+        buying_power_prices = align_prices(bars, load_bars(args.buying_power_csv))
+
+    # Run backtest
+    start_time = time.perf_counter()
+    results = run_backtest(bars, settings.ladder, args.cash, args.start_shares, buying_power_prices)
+    elapsed = time.perf_counter() - start_time
+
+    # Write out results
+    print("Bars:            " + str(results["bars"]) + " over " + str(results["days"]) + " days, " + str(bars["time"][0]) + " to " + str(bars["time"][-1]))
+    print("Fills:           " + str(len(results["fills"])) + " (" + str(results["buys"]) + " buys, " + str(results["sells"]) + " sells)")
+    print("Shares owned:    " + str(results["position"]))
+    print("Cash:            " + str(round(results["cash"], 2)))
+    if buying_power_prices is not None:
+        print(settings.buying_power_ticker + " shares owned: " + str(results["parked"]))
+    print("Start equity:    " + str(round(results["start_equity"], 2)))
+    print("End equity:      " + str(round(results["end_equity"], 2)))
+    print("P&L:             " + str(round(results["pnl"], 2)))
+    print("Max drawdown:    " + str(round(results["max_drawdown"], 2)))
+    print("Simulated in " + str(round(elapsed, 3)) + " seconds")
+
+    # Write out fills, if requested
+    if args.fills_file != "None":
+        with open(args.fills_file, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(["time", "instruction", "shares", "price"])
+            for bar, instruction, shares, price in results["fills"]:
+                writer.writerow([str(bars["time"][bar]).replace('T', ' '), instruction, shares, round(price, 4)])
@@ -1,12 +1,211 @@
 #!/usr/bin/python
+import os
+import sys
+import argparse
+import itertools
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 
-shares = 10
-maxshares = 600
-buyprice = 41.21
-sellprice = 42.01
-buyinc = 0.10
+# START FUNCTIONS
 
-for sharecount in range(shares, maxshares+shares, shares):
-    print(str(sharecount) + ", " + str(round(buyprice,2)) + ", " + str(round(sellprice,2)))
-    buyprice = buyprice - buyinc
-    sellprice = sellprice - buyinc
+# Function to build a ladder of shares to own, buy price and sell price. The
+# top rung owns shares at buyprice and sellprice, and each further rung owns
+# shares more at prices buyinc lower.
+def build_ladder(shares: int, maxshares: int, buyprice: float, sellprice: float, buyinc: float):
+
+    trade_ranges = {}
+    for sharecount in range(shares, maxshares+shares, shares):
+        trade_ranges[sharecount] = [round(buyprice,2), round(sellprice,2)]
+        buyprice = buyprice - buyinc
+        sellprice = sellprice - buyinc
+    return trade_ranges
+
+
+# Function to print a ladder in the format used by the option file
+def print_ladder(trade_ranges: dict):
+
+    for sharecount in trade_ranges:
+        print(str(sharecount) + ", " + str(trade_ranges[sharecount][0]) + ", " + str(trade_ranges[sharecount][1]))
+
+
+# Function to parse a sweep option. Takes a single value, a list of values
+# separated by commas, or start:stop:step with stop included.
+def parse_values(option: str, value_type):
+
+    if ':' in option:
+        start, stop, step = [value_type(value) for value in option.split(':')]
+        values = []
+        count = 0
+        while start + count * step <= stop + step * 1e-6:
+            values.append(value_type(round(start + count * step, 6)))
+            count = count + 1
+        return values
+    return [value_type(value) for value in option.split(',')]
+
+
+# Function to get the ladder settings to test. Skips settings that can't make
+# a valid option file: max shares that is not a multiple of shares, a sell
+# price at or below the buy price, or a ladder that reaches a price of 0.
+def sweep_settings(shares_list: list, maxshares_list: list, buyprice_list: list, sellprice_list: list, buyinc_list: list):
+
+    settings = []
+    for shares, maxshares, buyprice, sellprice, buyinc in itertools.product(shares_list, maxshares_list, buyprice_list, sellprice_list, buyinc_list):
+        if shares <= 0 or maxshares < shares or maxshares % shares != 0 or sellprice <= buyprice or buyinc <= 0.0:
+            continue
+        if buyprice - buyinc * (maxshares // shares - 1) <= 0.0:
+            continue
+        settings.append((shares, maxshares, buyprice, sellprice, buyinc))
+    return settings
+
+
+# Function to write bars, and buying power prices lined up with them, to a
+# .npy file that workers open memory mapped instead of being sent a copy
+def write_bars_file(data_file: str, bars: dict, buying_power_prices):
+
+    import numpy as np
+    fields = [("time", "datetime64[m]"), ("open", "f8"), ("high", "f8"), ("low", "f8"), ("close", "f8"), ("volume", "f8"), ("buying_power", "f8")]
+    data = np.lib.format.open_memmap(data_file, mode="w+", dtype=fields, shape=(len(bars["time"]),))
+    for name in ["time", "open", "high", "low", "close"]:
+        data[name] = bars[name]
+    data["volume"] = np.nan if bars["volume"] is None else bars["volume"]
+    data["buying_power"] = np.nan if buying_power_prices is None else buying_power_prices
+    data.flush()
+    del data
+
+
+# Bars opened by each worker process
+worker_data = {}
+
+
+# Function to open the bars file memory mapped in a worker process
+def init_worker(data_file: str):
+
+    import numpy as np
+    data = np.load(data_file, mmap_mode="r")
+    bars = {name: data[name] for name in ["time", "open", "high", "low", "close"]}
+    bars["volume"] = None if np.isnan(data["volume"][0]) else data["volume"]
+    worker_data["bars"] = bars
+    worker_data["buying_power_prices"] = None if np.isnan(data["buying_power"][0]) else data["buying_power"]
+
+
+# Function to backtest a list of ladder settings in a worker process
+def score_settings(settings: list, cash: float):
+
+    from ladder import Ladder
+    from range_trade_backtest import run_backtest
+    scores = []
+    for shares, maxshares, buyprice, sellprice, buyinc in settings:
+        ladder = Ladder(shares, maxshares, build_ladder(shares, maxshares, buyprice, sellprice, buyinc))
+        results = run_backtest(worker_data["bars"], ladder, cash, 0, worker_data["buying_power_prices"])
+        scores.append([(shares, maxshares, buyprice, sellprice, buyinc), results["pnl"], results["max_drawdown"], len(results["fills"]), results["position"]])
+    return scores
+
+
+# Function to backtest all ladder settings on a process pool. Settings are
+# sent in batches to keep the number of tasks down. Returns scores ranked by
+# P&L, best first.
+def run_sweep(data_file: str, settings: list, cash: float, workers: int):
+
+    batch_size = max(1, min(64, len(settings) // (workers * 4)))
+    batches = [settings[start:start+batch_size] for start in range(0, len(settings), batch_size)]
+    scores = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(data_file,)) as pool:
+        for batch_scores in pool.map(score_settings, batches, [cash] * len(batches)):
+            scores.extend(batch_scores)
+    scores.sort(key=lambda score: score[1], reverse=True)
+    return scores
+
+
+# Function to write a ladder to a range trade option file. The file is
+# written to a temporary name and renamed, so a running trader never reads a
+# partly written file. Any existing file is kept with a .bak extension.
+def write_settings_file(settings_file: str, ticker: str, buying_power_ticker: str, shares: int, maxshares: int, trade_ranges: dict):
+
+    settings_temp = settings_file + ".tmp"
+    with open(settings_temp, "w") as settings_out:
+        settings_out.write("Shares of " + ticker + " to trade: " + str(shares) + "\n")
+        settings_out.write("Max shares of " + ticker + " to own: " + str(maxshares) + "\n")
+        settings_out.write("Ticker to Buy/Sell for Buying Power: " + buying_power_ticker + "\n")
+        settings_out.write("Num Shares, Buy Price, Sell Price\n")
+        for sharecount in trade_ranges:
+            settings_out.write(str(sharecount) + ", " + str(trade_ranges[sharecount][0]) + ", " + str(trade_ranges[sharecount][1]) + "\n")
+    if os.path.exists(settings_file):
+        shutil.copyfile(settings_file, settings_file + ".bak")
+    os.rename(settings_temp, settings_file)
+
+# END FUNCTIONS
+
+if __name__ == "__main__":
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(description="Print a range trade ladder, or sweep ladder settings over historical minute bars")
+    parser.add_argument("-shares","--shares", default="10", help='Shares to trade per rung. Default is 10')
+    parser.add_argument("-maxshares","--maxshares", default="600", help='Max shares to own. Default is 600')
+    parser.add_argument("-buyprice","--buyprice", default="41.21", help='Buy price of the first rung. Default is 41.21')
+    parser.add_argument("-sellprice","--sellprice", default="42.01", help='Sell price of the first rung. Default is 42.01')
+    parser.add_argument("-buyinc","--buyinc", default="0.10", help='Price drop between rungs. Default is 0.10')
+    parser.add_argument("-csv","--csv", default="None", help='CSV file of minute bars to sweep settings over. Each setting above may then be a value, a list of values separated by commas, or start:stop:step')
+    parser.add_argument("-buying_power_csv","--buying_power_csv", default="None", help='CSV file of minute bars for the buying power ticker')
+    parser.add_argument("-cash","--cash", type=float, default=100000.0, help='Starting cash for each backtest. Default is 100000')
+    parser.add_argument("-workers","--workers", type=int, default=os.cpu_count(), help='Number of worker processes. Default is the number of cores')
+    parser.add_argument("-top","--top", type=int, default=10, help='Number of ranked settings to print. Default is 10')
+    parser.add_argument("-ticker","--ticker", default="None", help='Write the winning ladder to schwab_$ticker_range_trade.ini')
+    parser.add_argument("-buying_power_ticker","--buying_power_ticker", default="BIL", help='Buying power ticker for the written option file. Default is BIL')
+    args = parser.parse_args()
+
+    # Get settings to use
+    shares_list = parse_values(args.shares, int)
+    maxshares_list = parse_values(args.maxshares, int)
+    buyprice_list = parse_values(args.buyprice, float)
+    sellprice_list = parse_values(args.sellprice, float)
+    buyinc_list = parse_values(args.buyinc, float)
+
+    # Without bars, print the ladder
+    if args.csv == "None":
+        if max(len(shares_list), len(maxshares_list), len(buyprice_list), len(sellprice_list), len(buyinc_list)) > 1:
+            print("Option -csv is required to sweep more than one setting. Exiting")
+            sys.exit(1)
+        print_ladder(build_ladder(shares_list[0], maxshares_list[0], buyprice_list[0], sellprice_list[0], buyinc_list[0]))
+        sys.exit(0)
+
+    # Check input files
+    for input_file in [args.csv, args.buying_power_csv]:
+        if input_file != "None" and not os.path.exists(input_file):
+            print("Input file: " + input_file + " does not exist. Exiting")
+            sys.exit(1)
+    settings = sweep_settings(shares_list, maxshares_list, buyprice_list, sellprice_list, buyinc_list)
+    if not settings:
+        print("No valid settings to test. Exiting")
+        sys.exit(1)
+
+    # Load bars and write them where workers can memory map them
+    from range_trade_backtest import load_bars, align_prices
+    bars = load_bars(args.csv)
+    buying_power_prices = None
+    if args.buying_power_csv != "None":
+        buying_power_prices = align_prices(bars, load_bars(args.buying_power_csv))
+    data_dir = tempfile.mkdtemp(prefix="range_trade_sweep_")
+    data_file = os.path.join(data_dir, "bars.npy")
+    try:
+        write_bars_file(data_file, bars, buying_power_prices)
+        print("Testing " + str(len(settings)) + " settings over " + str(len(bars["time"])) + " bars with " + str(args.workers) + " workers")
+        start_time = time.perf_counter()
+        scores = run_sweep(data_file, settings, args.cash, args.workers)
+        print("Finished in " + str(round(time.perf_counter() - start_time, 2)) + " seconds\n")
+    finally:
+        shutil.rmtree(data_dir)
+
+    # Write out ranked table
+    print("Rank  Shares  MaxShares  BuyPrice  SellPrice  BuyInc   Fills           P&L  MaxDrawdown")
+    for rank, score in enumerate(scores[:args.top]):
+        (shares, maxshares, buyprice, sellprice, buyinc), pnl, drawdown, fills, position = score
+        print(f"{rank+1:4d}  {shares:6d}  {maxshares:9d}  {buyprice:8.2f}  {sellprice:9.2f}  {buyinc:6.2f}  {fills:6d}  {pnl:12.2f}  {drawdown:11.2f}")
+
+    # Write winning ladder to option file
+    if args.ticker != "None":
+        shares, maxshares, buyprice, sellprice, buyinc = scores[0][0]
+        settings_file = "schwab_" + args.ticker + "_range_trade.ini"
+        write_settings_file(settings_file, args.ticker, args.buying_power_ticker, shares, maxshares, build_ladder(shares, maxshares, buyprice, sellprice, buyinc))
+        print("\nWrote winning ladder to " + settings_file)
@@ -0,0 +1,94 @@
+#!/usr/bin/python
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import endpoint_route
+from tracing import span
+
+# Class holding one keep-alive HTTP session that is shared by every API call,
+# so connections to api.schwabapi.com are reused instead of reopened per call
+class SchwabClient:
+
+    # Set up session with a sized connection pool, default headers and timeout
+    def __init__(self, pool_size=10, timeout=10.0):
+
+        self.timeout = timeout
+        self.token_manager = None
+        self.metrics = None
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"accept": "application/json"})
+
+    # Function to make a request. The bearer token is added when an access
+    # token is passed. If a token manager is set, its current token is used
+    # instead, and a request rejected with 401 is retried once after
+    # refreshing the token. Extra headers are merged with the session defaults.
+    def request(self, method: str, endpoint: str, access_token=None, headers=None, **kwargs):
+
+        # Use latest token from the token manager
+        if access_token is not None and self.token_manager is not None:
+            access_token = self.token_manager.get_access_token()
+
+        # Make request on the shared session
+        content = self.send(method, endpoint, access_token, headers, **kwargs)
+
+        # Refresh token and retry once if the token was rejected
+        if content.status_code == 401 and access_token is not None and self.token_manager is not None:
+            access_token = self.token_manager.refresh(access_token)
+            content = self.send(method, endpoint, access_token, headers, retry=True, **kwargs)
+        return content
+
+    # Function to send one request on the shared session, traced as a span
+    # if a cycle is being traced. If metrics are set, the status, latency and
+    # bytes of the request are recorded.
+    def send(self, method: str, endpoint: str, access_token, headers, retry=False, **kwargs):
+
+        with span(method + " " + endpoint_route(endpoint)):
+            return self.send_request(method, endpoint, access_token, headers, retry, **kwargs)
+
+    # Function to send one request and record its metrics
+    def send_request(self, method: str, endpoint: str, access_token, headers, retry, **kwargs):
+
+        # Define headers for request
+        request_headers = {}
+        if access_token is not None:
+            request_headers["Authorization"] = f"Bearer {access_token}"
+        if headers is not None:
+            request_headers.update(headers)
+
+        if self.metrics is None:
+            return self.session.request(method, endpoint, headers=request_headers, timeout=self.timeout, **kwargs)
+
+        # Time the request, including reading the response body
+        data = kwargs.get("data")
+        bytes_sent = len(data) if isinstance(data, (str, bytes)) else 0
+        start = time.perf_counter()
+        try:
+            content = self.session.request(method, endpoint, headers=request_headers, timeout=self.timeout, **kwargs)
+        except requests.RequestException:
+            self.metrics.record_request(method, endpoint, "error", time.perf_counter() - start, bytes_sent, 0, retry)
+            raise
+        self.metrics.record_request(method, endpoint, content.status_code, time.perf_counter() - start, bytes_sent, len(content.content), retry)
+        return content
+
+    # Function to make a GET request
+    def get(self, endpoint: str, access_token=None, **kwargs):
+        return self.request("GET", endpoint, access_token, **kwargs)
+
+    # Function to make a POST request
+    def post(self, endpoint: str, access_token=None, **kwargs):
+        return self.request("POST", endpoint, access_token, **kwargs)
+
+    # Function to make a PUT request
+    def put(self, endpoint: str, access_token=None, **kwargs):
+        return self.request("PUT", endpoint, access_token, **kwargs)
+
+    # Function to make a DELETE request
+    def delete(self, endpoint: str, access_token=None, **kwargs):
+        return self.request("DELETE", endpoint, access_token, **kwargs)
+
+    # Function to close all pooled connections
+    def close(self):
+        self.session.close()
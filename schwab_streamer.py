@@ -0,0 +1,279 @@
+#!/usr/bin/python
+import asyncio
+import collections
+import json
+import threading
+import websockets
+
+# Account activity message types that mean an order has been completely filled
+FILL_MESSAGE_TYPES = ["OrderFillCompleted"]
+
+# Account activity message types that mean an order is done: filled,
+# canceled (including replaced orders), rejected or expired
+TERMINAL_MESSAGE_TYPES = FILL_MESSAGE_TYPES + ["OrderUROutCompleted", "OrderCanceled", "OrderRejected", "OrderExpired"]
+
+# Maximum number of done orders to keep that nobody is waiting on yet. Most
+# are orders that are never waited on, such as range trade fills, so only the
+# newest are kept.
+MAX_UNCLAIMED_FILLS = 1000
+
+
+# Function to find the order ID in the data of an account activity message.
+# The order ID is nested at different depths depending on the message type,
+# so search the whole message for it.
+def find_order_id(message_data):
+
+    if isinstance(message_data, dict):
+        for key in ["SchwabOrderID", "OrderID", "orderId"]:
+            if key in message_data and not isinstance(message_data[key], (dict, list)):
+                return str(message_data[key])
+        for value in message_data.values():
+            order_id = find_order_id(value)
+            if order_id is not None:
+                return order_id
+    elif isinstance(message_data, list):
+        for value in message_data:
+            order_id = find_order_id(value)
+            if order_id is not None:
+                return order_id
+    return None
+
+
+# Class for an asyncio client of the Schwab streamer account activity
+# service. Each order being waited on gets a future that is resolved as soon
+# as a message saying the order is done (filled, canceled, rejected or
+# expired) is pushed by the streamer. If the connection drops, the waiting
+# futures are resolved with None so callers can fall back to polling, and the
+# client connects and logs in again, first_delay seconds later and then
+# doubling up to max_delay, until it succeeds.
+class AccountActivityStreamer:
+
+    # Store streamer info returned by the user preference endpoint.
+    # get_access_token, if set, is called for a new access token each time
+    # the client logs in; otherwise access_token is used.
+    def __init__(self, streamer_info: dict, access_token: str, get_access_token=None, first_delay=1.0, max_delay=60.0):
+
+        self.streamer_info = streamer_info
+        self.access_token = access_token
+        self.get_access_token = get_access_token
+        self.first_delay = first_delay
+        self.max_delay = max_delay
+        self.websocket = None
+        self.reader = None
+        self.reconnector = None
+        self.connected = False
+        self.closing = False
+        self.request_id = 0
+        self.fills = collections.OrderedDict()
+        self.waiters = {}
+        self.responses = asyncio.Queue()
+
+    # Function to build a request for the streamer
+    def build_request(self, service: str, command: str, parameters: dict):
+
+        self.request_id = self.request_id + 1
+        return {"requests": [{"requestid": str(self.request_id),
+                              "service": service,
+                              "command": command,
+                              "SchwabClientCustomerId": self.streamer_info["schwabClientCustomerId"],
+                              "SchwabClientCorrelId": self.streamer_info["schwabClientCorrelId"],
+                              "parameters": parameters}]}
+
+    # Function to send a request and wait for its response
+    async def send_request(self, service: str, command: str, parameters: dict):
+
+        await self.websocket.send(json.dumps(self.build_request(service, command, parameters)))
+        response = await asyncio.wait_for(self.responses.get(), 10.0)
+        if response["content"]["code"] != 0:
+            raise RuntimeError("Streamer " + service + " " + command + " failed: " + str(response["content"]))
+        return response
+
+    # Function to connect, log in and subscribe to account activity, then
+    # keep the connection up in the background. Raises an error if the
+    # first connection fails.
+    async def connect(self):
+
+        await self.open()
+        self.reconnector = asyncio.ensure_future(self.keep_connected())
+
+    # Function to open a connection, log in with the latest access token and
+    # subscribe to account activity
+    async def open(self):
+
+        if self.get_access_token is not None:
+            self.access_token = await asyncio.get_running_loop().run_in_executor(None, self.get_access_token)
+        self.websocket = await websockets.connect(self.streamer_info["streamerSocketUrl"])
+        self.responses = asyncio.Queue()
+        self.reader = asyncio.ensure_future(self.read_messages())
+        try:
+            await self.send_request("ADMIN", "LOGIN", {"Authorization": self.access_token,
+                                                       "SchwabClientChannel": self.streamer_info["schwabClientChannel"],
+                                                       "SchwabClientFunctionId": self.streamer_info["schwabClientFunctionId"]})
+            await self.send_request("ACCT_ACTIVITY", "SUBS", {"keys": "Account Activity", "fields": "0,1,2,3"})
+        except BaseException:
+            self.reader.cancel()
+            await self.websocket.close()
+            raise
+        self.connected = True
+
+    # Function to connect again whenever the connection closes, until the
+    # client is closed
+    async def keep_connected(self):
+
+        while not self.closing:
+            await asyncio.wait([self.reader])
+            if self.closing:
+                return
+            delay = self.first_delay
+            while not self.closing:
+                print("Account activity streamer is down. Reconnecting in " + str(delay) + " seconds")
+                await asyncio.sleep(delay)
+                try:
+                    await self.open()
+                    print("Account activity streamer reconnected")
+                    break
+                except (OSError, RuntimeError, asyncio.TimeoutError, websockets.WebSocketException) as error:
+                    print("Account activity streamer reconnect failed: " + str(error))
+                    delay = min(delay * 2, self.max_delay)
+
+    # Function to read messages from the streamer until the connection
+    # closes. Orders being waited on are then released so callers poll.
+    async def read_messages(self):
+
+        try:
+            await self.handle_messages()
+        except websockets.ConnectionClosed:
+            if not self.closing:
+                print("Account activity streamer connection closed")
+        finally:
+            self.connected = False
+            for waiter in self.waiters.values():
+                if not waiter.done():
+                    waiter.set_result(None)
+            self.waiters = {}
+
+    # Function to handle each message from the streamer
+    async def handle_messages(self):
+
+        async for message in self.websocket:
+            message = json.loads(message)
+            # Pass command responses back to the request that is waiting
+            for response in message.get("response", []):
+                await self.responses.put(response)
+            # Resolve waiters for any orders that are done
+            for data in message.get("data", []):
+                if data.get("service") != "ACCT_ACTIVITY":
+                    continue
+                for content in data.get("content", []):
+                    if content.get("2") not in TERMINAL_MESSAGE_TYPES:
+                        continue
+                    try:
+                        message_data = json.loads(content.get("3", "{}"))
+                    except ValueError:
+                        continue
+                    order_id = find_order_id(message_data)
+                    if order_id is not None:
+                        self.set_filled(order_id, message_data)
+
+    # Function to record that an order is done and resolve the future
+    # waiting on it. If nobody is waiting yet, the message is kept for a
+    # later wait, dropping the oldest once MAX_UNCLAIMED_FILLS are kept.
+    def set_filled(self, order_id: str, message_data: dict):
+
+        waiter = self.waiters.pop(order_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(message_data)
+            return
+        self.fills[order_id] = message_data
+        self.fills.move_to_end(order_id)
+        while len(self.fills) > MAX_UNCLAIMED_FILLS:
+            self.fills.popitem(last=False)
+
+    # Function to get a future that resolves when an order is done. If the
+    # message has already been received the future is already resolved, and
+    # if the connection is down it is resolved with None.
+    def fill_future(self, order_id: str):
+
+        order_id = str(order_id)
+        future = asyncio.get_running_loop().create_future()
+        if order_id in self.fills:
+            future.set_result(self.fills.pop(order_id))
+        elif not self.connected:
+            future.set_result(None)
+        else:
+            self.waiters[order_id] = future
+        return future
+
+    # Function to wait for an order to be done. Returns the message data, or
+    # None if no message arrives within the timeout or the connection is down.
+    async def wait_for_fill(self, order_id: str, timeout: float):
+
+        try:
+            return await asyncio.wait_for(self.fill_future(order_id), timeout)
+        except asyncio.TimeoutError:
+            self.waiters.pop(str(order_id), None)
+            return None
+
+    # Function to stop reconnecting, log out and close the connection
+    async def close(self):
+
+        self.closing = True
+        if self.reconnector is not None:
+            self.reconnector.cancel()
+        try:
+            if self.connected:
+                await self.websocket.send(json.dumps(self.build_request("ADMIN", "LOGOUT", {})))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            await self.websocket.close()
+            self.reader.cancel()
+
+
+# Class running an AccountActivityStreamer on an event loop in a background
+# thread, so the blocking trading code can wait on fills without asyncio
+class StreamerThread:
+
+    # Start event loop thread and connect the streamer. get_access_token, if
+    # set, is called for a new access token each time the streamer logs in.
+    def __init__(self, streamer_info: dict, access_token: str, get_access_token=None):
+
+        self.closed = False
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.streamer = self.run(self.create_streamer(streamer_info, access_token, get_access_token), 15.0)
+
+    # Function to create and connect the streamer on the event loop
+    async def create_streamer(self, streamer_info: dict, access_token: str, get_access_token):
+
+        streamer = AccountActivityStreamer(streamer_info, access_token, get_access_token)
+        await streamer.connect()
+        return streamer
+
+    # Function to run a coroutine on the event loop and wait for its result
+    def run(self, coroutine, timeout: float):
+
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout + 1.0)
+
+    # Function to wait for an order to be filled, canceled, rejected or
+    # expired. Returns True if a message saying so was received within the
+    # timeout. Returns False right away if the connection is down, so the
+    # caller can poll the order instead.
+    def wait_for_fill(self, order_id: str, timeout: float):
+
+        if not self.streamer.connected:
+            return False
+        return self.run(self.streamer.wait_for_fill(order_id, timeout), timeout) is not None
+
+    # Function to close the streamer and stop the event loop. Does nothing if
+    # already closed.
+    def close(self):
+
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.run(self.streamer.close(), 5.0)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
@@ -1,79 +1,42 @@
 #!/usr/bin/python
-import requests
 import os
 import sys
-import base64
-import configparser
 import argparse
 import datetime
 import time
-import holidays
 import json
-import math
+import atexit
+import traceback
+import threading
+import contextvars
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from schwab_client import SchwabClient
+from token_manager import TokenManager
+from option_chain import decode_option_chain, parse_option_symbol
+from range_trade import build_range_trade_orders
+from order_reconciler import OrderIndex, reconcile_orders
+from metrics import Metrics, strategy_label
+from tracing import trace_cycle, trace_phase, span, mark
+from quote_store import QuoteRecorder
+from price_history import PriceHistory
+from trading_calendar import load_calendar, minute_hhmm, SESSION_OPEN, SESSION_CLOSE
+from settings import load_config, load_sell_call_options_settings, load_range_trade_settings, load_rebalance_settings
 
 # START FUNCTIONS
 
-# Function to get tokens for API
-def get_tokens(endpoint: str, token_file: str, config_file: str):
-
-    #Read in variables from configuration files
-    config = configparser.ConfigParser()
-    config.read(config_file)
-    app_key = config.get("myvars", "app_key")
-    app_secret = config.get("myvars", "app_secret")
-    config = configparser.ConfigParser()
-    config.read(token_file)
-    refresh_token = config.get("myvars", "refresh_token")
-
-    #Define payload and headers
-    payload = {"grant_type":"refresh_token",
-               "refresh_token":refresh_token}
-    headers = {
-             "Authorization": f'Basic {base64.b64encode(f"{app_key}:{app_secret}".encode()).decode()}',
-             "Content-Type": "application/x-www-form-urlencoded"}
-
-    #Make request for new token
-    content = requests.post(url = endpoint, headers = headers, data = payload)
-
-    #Convert json to a dictionary
-    auth = content.json()
-    print (auth)
-    print ("Access Token: " + auth["access_token"])
-    print ("Refresh Token: " + auth["refresh_token"])
-
-    #Define name of temporary token file
-    token_temp = token_file + ".tmp"
-
-    #Open temporary token file and write out new tokens
-    auth_out = open(token_temp,"w+")
-    auth_out.write('[myvars]\n')
-    auth_out.write('refresh_token: ' + str(auth["refresh_token"]) + '\n')
-    auth_out.write('access_token: ' + str(auth["access_token"]) + '\n')
-    auth_out.close()
-
-    #Move token file to final name
-    os.rename(token_temp,token_file)
-
-
-# Function to get values from a config file
+# Function to get values from a config file. The file is only parsed again
+# when it changes.
 def get_config_value(config_file: str, config_string: str):
-
-    #Read variables from input file
-    config = configparser.ConfigParser()
-    config.read(config_file)
-    return config.get("myvars", config_string)
+    return load_config(config_file)[config_string]
 
 
 # Function to get account hashes
 def get_account_hashes(endpoint: str, access_token: str):
 
-    # Define headers for request
-    headers = {
-        "Authorization": f"Bearer {access_token}"
-    }
-
     # Make request to get account info
-    content = requests.get(url = endpoint, headers = headers)
+    content = client.get(endpoint, access_token)
 
     # Open account hashes in JSON format
     print(json.dumps(content.json(),indent=4))
@@ -82,52 +45,29 @@ def get_account_hashes(endpoint: str, access_token: str):
 # Function to read settings from a config file
 def read_settings(config_file: str):
 
-    #Read variables from input file
-    config = configparser.ConfigParser()
-    config.read(config_file)
-    return float(config.get("myvars", "limit_price")), float(config.get("myvars", "min_limit_price")), int(config.get("myvars", "transition_time")), int(config.get("myvars", "num_contracts")), int(config.get("myvars", "max_contracts"))
+    settings = load_sell_call_options_settings(config_file)
+    return settings.limit_price, settings.min_limit_price, settings.transition_time, settings.num_contracts, settings.max_contracts
 
 
 # Function to read range trade settings from a file
 def read_settings_range_trade(option_file: str):
 
-    # Initialize trade ranges dictionary
-    trade_ranges = {}
-
-    # Read variables from input file
-    with open(option_file, 'r') as file:
-        shares = int(file.readline().split(':')[1])
-        max_shares = int(file.readline().split(':')[1])
-        buying_power_ticker = file.readline().split(':')[1].strip()
-        next(file)
-        for line in file.readlines():
-            trade_ranges[int(line.split(',')[0])] = [float(line.split(',')[1]), float(line.split(',')[2])]
-    return shares, max_shares, buying_power_ticker, trade_ranges
+    settings = load_range_trade_settings(option_file)
+    return settings.trade_shares, settings.max_shares, settings.buying_power_ticker, settings.ladder
 
 
 # Function to read rebalance settings from a file
 def read_settings_rebalance(option_file: str):
 
-    # Read variables from input file
-    with open(option_file, 'r') as file:
-        available_cash = float(file.readline().split(':')[1])
-        min_position = float(file.readline().split(':')[1])
-        max_position = float(file.readline().split(':')[1])
-        min_allocation = float(file.readline().split(':')[1]) * 0.01
-        buying_power_ticker = file.readline().split(':')[1].strip()
-    return available_cash, min_position, max_position, min_allocation, buying_power_ticker
+    settings = load_rebalance_settings(option_file)
+    return settings.available_cash, settings.min_position, settings.max_position, settings.min_allocation, settings.buying_power_ticker
 
 
 # Function to get account balance
 def get_account_info(endpoint: str, access_token: str, info_type: str, ticker="None", assetType=["OPTION"]):
 
-    # Define headers for request
-    headers = {
-        "Authorization": f"Bearer {access_token}"
-    }
-
     # Make request to get account info
-    content = requests.get(url = endpoint, headers = headers)
+    content = client.get(endpoint, access_token)
 
     # Convert json to a dictionary
     if info_type == "balance":
@@ -154,41 +94,132 @@ def get_account_info(endpoint: str, access_token: str, info_type: str, ticker="N
 # Function to get quote
 def get_quote(endpoint: str, access_token: str, ticker: str, quote_type="stock"):
 
-    # Define headers for request
-    headers = {
-        "Authorization": f"Bearer {access_token}"
-    }
-
     # Make request to get account info
-    content = requests.get(url = endpoint, headers = headers)
+    content = client.get(endpoint, access_token)
 
     # Convert json to a dictionary
     if quote_type == "stock":
-        return round((float(content.json()[ticker]['quote']['bidPrice'])+float(content.json()[ticker]['quote']['askPrice']))*0.5,3), float(content.json()[ticker]['quote']['highPrice']), float(content.json()[ticker]['quote']['lowPrice'])
+        return quote_prices(content.json()[ticker]['quote'])
     elif quote_type == "option":
-        quotes = {}
-        for exp_date in content.json()['callExpDateMap']:
-            for strike_price in content.json()['callExpDateMap'][exp_date]:
-                # Extract option symbol
-                symbol = content.json()['callExpDateMap'][exp_date][strike_price][0]['symbol']
-                # Compute limit price to pay for option as average of "ask" and "mark"
-                quotes[symbol] = [content.json()['callExpDateMap'][exp_date][strike_price][0]["bid"], content.json()['callExpDateMap'][exp_date][strike_price][0]["ask"]]
-               
-        return quotes
+        # Parse the chain once and decode it into parallel arrays
+        return decode_option_chain(content.json())
+
+# Function to get the current price (mid of bid and ask), high and low of day from a quote
+def quote_prices(quote: dict):
+
+    return round((float(quote['bidPrice'])+float(quote['askPrice']))*0.5,3), float(quote['highPrice']), float(quote['lowPrice'])
+
+# Class caching quotes for a short time so repeat lookups within a cycle
+# don't make another request
+class QuoteCache:
+
+    # Initialize empty cache
+    def __init__(self, ttl: float):
+
+        self.ttl = ttl
+        self.quotes = {}
+        self.lock = threading.Lock()
+
+    # Function to get a cached quote. Returns None if missing or expired.
+    def get(self, ticker: str):
+
+        with self.lock:
+            if ticker in self.quotes and time.time() - self.quotes[ticker][0] <= self.ttl:
+                return self.quotes[ticker][1]
+        return None
+
+    # Function to get the time.time() a cached quote was received, or None
+    def received(self, ticker: str):
+
+        with self.lock:
+            if ticker in self.quotes:
+                return self.quotes[ticker][0]
+        return None
+
+    # Function to store a quote
+    def put(self, ticker: str, quote: dict):
+
+        with self.lock:
+            self.quotes[ticker] = [time.time(), quote]
+
+# Class limiting requests to a number per period, such as the market data
+# limit of 120 requests a minute. acquire waits until another request can be
+# made without going over the limit.
+class RateLimiter:
+
+    # Initialize limiter allowing requests per period seconds
+    def __init__(self, requests: int, period: float):
+
+        self.requests = requests
+        self.period = period
+        self.times = collections.deque()
+        self.lock = threading.Lock()
+
+    # Function to wait for a request slot and take it
+    def acquire(self):
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                while self.times and now - self.times[0] >= self.period:
+                    self.times.popleft()
+                if len(self.times) < self.requests:
+                    self.times.append(now)
+                    return
+                wait = self.period - (now - self.times[0])
+            time.sleep(wait)
+
+# Function to request quotes for up to quote_chunk_size symbols in one
+# /quotes call. Quotes are cached, and recorded if quotes are recorded.
+# Returns a dictionary of ticker to quote fields.
+def request_quotes(access_token: str, tickers: list):
+
+    # Wait for a slot under the market data rate limit
+    marketdata_limiter.acquire()
+
+    # Request quotes
+    endpoint = marketdata_endpoint + "/quotes?symbols=" + ",".join(tickers) + "&fields=quote&indicative=false"
+    content = client.get(endpoint, access_token)
+    quotes = {}
+    for ticker, data in content.json().items():
+        if "quote" in data:
+            quote_cache.put(ticker, data["quote"])
+            quotes[ticker] = data["quote"]
+            if quote_recorder is not None:
+                quote_recorder.record(ticker, data["quote"])
+    return quotes
+
+# Function to get quotes for many tickers. Cached quotes are used where
+# possible and the rest are requested in as few /quotes calls as possible,
+# chunked to the maximum number of symbols per request. Returns a dictionary
+# of ticker to quote fields.
+def get_quotes(access_token: str, tickers: list):
+
+    # Use cached quotes where possible
+    quotes = {}
+    missing = []
+    for ticker in tickers:
+        quote = quote_cache.get(ticker)
+        if quote is not None:
+            quotes[ticker] = quote
+        elif ticker not in missing:
+            missing.append(ticker)
+
+    # Request the rest in chunks
+    for start in range(0, len(missing), quote_chunk_size):
+        quotes.update(request_quotes(access_token, missing[start:start+quote_chunk_size]))
+
+    # Return the quotes
+    return quotes
 
 # Function to get current orders
 def get_orders(endpoint: str, access_token: str, order_date: str, status: str, assetType="OPTION"):
 
-    # Define headers for request
-    headers = {
-        "Authorization": f"Bearer {access_token}"
-    }
-
     # Add start and end time to endpoint
     endpoint = endpoint + "?fromEnteredTime=" + order_date + "T04:00:00.000Z&toEnteredTime=" + order_date + "T23:00:00.000Z"
 
     # Make request to get account info
-    content = requests.get(url = endpoint, headers = headers)
+    content = client.get(endpoint, access_token)
 
     # Initialize orders dictionary
     orders = {}
@@ -207,24 +238,18 @@ def get_orders(endpoint: str, access_token: str, order_date: str, status: str, a
 # Function to cancel an order
 def cancel_order(endpoint: str, access_token: str, order_id: str):
 
-    # Define headers for request
-    headers = {
-        "Authorization": f"Bearer {access_token}"
-    }
-
     # Add start and end time to endpoint
     endpoint = endpoint + "/" + order_id
 
     # Make request to delete to cancel the order
-    content = requests.delete(url = endpoint, headers = headers)
+    with span("cancel_order", order_id=order_id):
+        content = client.delete(endpoint, access_token)
 
     #Return status code
     return content.status_code
 
-# Function to place and order
-def place_order(
-    endpoint,
-    access_token,
+# Function to build the payload for an order
+def build_order_payload(
     symbol,
     order_type,
     instruction,
@@ -270,149 +295,315 @@ def place_order(
     if special_instructions != "NONE":
         order_payload["specialInstruction"] = special_instructions
 
+    # Return the payload
+    return order_payload
+
+# Function to build a TRIGGER order. The child orders are sent once the
+# first order fills.
+def build_trigger_order(first_order: dict, child_orders: list):
+
+    trigger_order = dict(first_order)
+    trigger_order["orderStrategyType"] = "TRIGGER"
+    trigger_order["childOrderStrategies"] = child_orders
+    return trigger_order
+
+# Function to build an OCO order. When one of the orders fills, the others
+# are canceled.
+def build_oco_order(orders: list):
+
+    return {"orderStrategyType": "OCO", "childOrderStrategies": orders}
+
+# Function to place and order. If child orders are given, they are attached
+# to the order as a TRIGGER order and sent in the same request.
+def place_order(endpoint, access_token, return_order_id=False, child_orders=None, **order):
+
+    # Build order, with any child orders
+    order_payload = build_order_payload(**order)
+    if child_orders:
+        order_payload = build_trigger_order(order_payload, child_orders)
+
     # Define headers for request
     headers = {
-        "Authorization": f"Bearer {access_token}",
         "accept": "*/*",
         "Content-Type": "application/json"
     }
 
-    # Make request to get account info
-    content = requests.post(url = endpoint, headers = headers, data = json.dumps(order_payload))
+    # Make request to place the order
+    with span("place_order", symbol=order["symbol"], instruction=order["instruction"]):
+        content = client.post(endpoint, access_token, headers = headers, data = json.dumps(order_payload))
+
+    # Return status code, and order ID from the Location header if requested
+    if return_order_id:
+        return content.status_code, get_order_id(content)
+    return content.status_code
+
+# Function to replace a working order with a new one. Schwab cancels the
+# working order and places the new one in a single request.
+def replace_order(endpoint, access_token, order_id, return_order_id=False, **order):
+
+    # Define headers for request
+    headers = {
+        "accept": "*/*",
+        "Content-Type": "application/json"
+    }
+
+    # Make request to replace the order
+    with span("replace_order", symbol=order["symbol"], instruction=order["instruction"]):
+        content = client.put(endpoint + "/" + str(order_id), access_token, headers = headers, data = json.dumps(build_order_payload(**order)))
+
+    # Return status code, and ID of the new order from the Location header if requested
+    if return_order_id:
+        return content.status_code, get_order_id(content)
     return content.status_code
 
+# Function to get the order ID from the Location header of a place order response
+def get_order_id(content):
+
+    location = content.headers.get("Location", "")
+    if location == "":
+        return None
+    return location.rstrip("/").split("/")[-1]
+
+# Function to get streamer info for the account activity streamer
+def get_streamer_info(endpoint: str, access_token: str):
+
+    # Make request to get user preferences
+    content = client.get(endpoint, access_token)
+
+    # Return streamer info
+    return content.json()["streamerInfo"][0]
+
+# Function to check if an order from get_orders is one stored in the order
+# log as still WORKING. The order log is keyed by symbol.
+def is_stored_working(stored_orders: dict, order: list):
+
+    stored = stored_orders.get(order[0])
+    return stored is not None and stored[0] == order[1] and stored[1] == order[2] and stored[2] == "WORKING"
+
+# Order statuses that an order does not leave
+TERMINAL_STATUSES = ["FILLED", "CANCELED", "REJECTED", "EXPIRED", "REPLACED"]
+
+# Class holding the status of an order. Status is TIMEOUT if the order was
+# still working at the deadline. Price is the average fill price, or None if
+# nothing filled.
+@dataclass
+class OrderResult:
+    order_id: object
+    status: str
+    filled_quantity: float
+    price: object
+
+# Function to get the status of an order
+def get_order(endpoint: str, access_token: str, order_id):
+
+    # Make request to get the order
+    order = client.get(endpoint + "/" + str(order_id), access_token).json()
+
+    # Work out average fill price from the execution legs
+    filled_quantity = 0.0
+    filled_value = 0.0
+    for activity in order.get("orderActivityCollection", []):
+        for leg in activity.get("executionLegs", []):
+            filled_quantity = filled_quantity + leg["quantity"]
+            filled_value = filled_value + leg["quantity"] * leg["price"]
+    price = round(filled_value / filled_quantity, 4) if filled_quantity > 0 else None
+
+    # Return the order result
+    return OrderResult(order_id, order["status"].upper(), order.get("filledQuantity", filled_quantity), price)
+
+# Function to wait until an order reaches a terminal status or the deadline,
+# a time.time() value, passes. If the account activity streamer is running,
+# waits for the order to be pushed as done and then checks it once.
+# Otherwise, or if the streamer is down, polls the order, starting at
+# first_delay seconds between requests and doubling up to max_delay, so a
+# quick fill is seen quickly without polling a slow one hard.
+def await_order(endpoint: str, access_token: str, order_id, deadline: float, description: str, first_delay=0.1, max_delay=2.0):
+
+    with span("await_order", description=description, order_id=order_id):
+        if order_id is None:
+            print("No order ID returned for " + description + ". Can't wait for it to be filled")
+            return OrderResult(order_id, "UNKNOWN", 0.0, None)
+        print("Waiting up to " + str(round(max(deadline - time.time(), 0.0), 1)) + " seconds for " + description + " to be filled")
+        if streamer is not None and streamer.wait_for_fill(order_id, max(deadline - time.time(), 0.0)):
+            result = get_order(endpoint, access_token, order_id)
+        else:
+            delay = first_delay
+            while True:
+                result = get_order(endpoint, access_token, order_id)
+                if result.status in TERMINAL_STATUSES or time.time() >= deadline:
+                    break
+                time.sleep(min(delay, max(deadline - time.time(), 0.0)))
+                delay = min(delay * 2, max_delay)
+        if result.status not in TERMINAL_STATUSES:
+            result.status = "TIMEOUT"
+        return result
+
+# Function to chase a working limit order. Waits interval seconds for a fill,
+# then replaces the order at a price step further (step is negative to walk
+# a sell down), until the order fills or the next price would pass
+# limit_price. The order stays working at its last price if it isn't filled.
+# Returns whether the order filled, the ID of the last order and its price.
+def chase_order(endpoint: str, access_token: str, order_id, start_price: float, step: float, limit_price: float, interval: float, description: str, **order):
+
+    with span("chase_order", description=description):
+        price = start_price
+        while True:
+            result = await_order(endpoint, access_token, order_id, time.time() + interval, description)
+            if result.status == "FILLED":
+                return True, order_id, price
+            if result.status != "TIMEOUT":
+                print ("Not changing limit price of " + description + ". Order status: " + result.status)
+                return False, order_id, price
+            # Stop once the next price would pass the limit
+            next_price = round(price + step, 2)
+            if (step < 0.0 and next_price < limit_price) or (step > 0.0 and next_price > limit_price):
+                return False, order_id, price
+            # Replace the order at the next price
+            print ("Replacing " + description + " " + str(order_id) + " with limit price of " + str(next_price))
+            order_status, new_order_id = replace_order(endpoint, access_token, order_id, price=next_price, return_order_id=True, **order)
+            if order_status != 201:
+                # The order may have filled before it could be replaced
+                print ("FAILED to replace " + description + " " + str(order_id))
+                return get_order(endpoint, access_token, order_id).status == "FILLED", order_id, price
+            order_id, price = new_order_id, next_price
+
 # Function to resistance level high and update it, if necessary
-def get_resistance_level(max_file: str, highofday: float):
+def get_resistance_level(access_token: str, ticker: str, highofday: float):
 
     # Attempt to read current MAX from file
+    max_file = ticker + "_max.txt"
     if os.path.exists(max_file):
         with open(max_file, 'r') as file:
-            resistance_level = float(file.readline())
+            file_level = float(file.readline())
     else:
-        resistance_level = 0.0
+        file_level = 0.0
+
+    # Get all time high from daily bars, bringing them up to date once a day
+    history = open_price_history()
+    if not history.update(ticker, lambda symbol, start_date: get_price_history(access_token, symbol, start_date)):
+        print("Price history for " + ticker + " could not be updated. Using cached bars")
+    all_time_high = history.all_time_high(ticker)[0] or 0.0
 
     # Check to see if new resistence level set
-    if highofday > resistance_level:
-        resistance_level = highofday
+    resistance_level = max(file_level, all_time_high, highofday)
+    if resistance_level > file_level:
         with open(max_file, 'w') as file:
             file.write(str(resistance_level) + "\n")
 
     # Return the resistence level
     return resistance_level
 
-# Function to get list of holidays for years input
-def get_holidays(years: list):
-
-    return holidays.financial_holidays('NYSE', years=years)
-
+# Function to get the daily candles of a ticker from /pricehistory, from
+# start_date (a datetime.date) to today, or for the last 20 years if
+# start_date is None. Returns None if the request failed.
+def get_price_history(access_token: str, ticker: str, start_date):
 
-# END FUNCTIONS
-
-# BEGIN MAIN CODE
+    # Wait for a slot under the market data rate limit
+    marketdata_limiter.acquire()
 
-# Define endpoints
-trading_endpoint = r"https://api.schwabapi.com/trader/v1"
-marketdata_endpoint = r"https://api.schwabapi.com/marketdata/v1"
-token_endpoint = r"https://api.schwabapi.com/v1/oauth/token"
-
-# Define configuration file containing access token
-token_file = "schwab_tokens.ini"
-
-# Define configuation file containing hash of account numbers
-config_file = "schwab_config.ini"
-
-# Argument Parsing
-parser = argparse.ArgumentParser()
-
-# Read in arguments
-parser.add_argument("-get_tokens","--get_tokens", action='store_true', help='Get an updated access token.')
-parser.add_argument("-get_account_hashes","--get_account_hashes", action='store_true', help='Get hash value for all accounts returned in JSON format.')
-parser.add_argument("-get_balance","--get_balance", action='store_true', help='Get current account balance. Use account_type option to set the account. Default is brokerage.')
-parser.add_argument("-account_type","--account_type", required=False, default="brokerage", help='Account type to grab balance or place trades for. Options are ira or brokerage. Default is brokerage.')
-parser.add_argument("-get_quote","--get_quote", required=False, default="None", help='Ticker Symbol to get quote for. Result will be stored in ${TickerSymbol}.csv. Default is None (No quote requested).')
-parser.add_argument("-sell_call_options","--sell_call_options", required=False, default="None", help='Ticker Symbol to sell call options for. Default is None. If set, this will automatically get a quote for the ticker. A threshold for %% from resistance level can be set with the -percent_threshold option. The default threshold is 1.5%%. Option file schwab_$ticker_sell_call_options.ini is required.')
-parser.add_argument("-percent_threshold","--percent_threshold", required=False, default=1.5, help='Percent threshold from resistance level in which options trading is allowed. If outside this threshold, no new option trades will be placed. Default is 1.5.')
-parser.add_argument("-range_trade","--range_trade", required=False, default="None", help='Ticker Symbol to range trade for. Default is None. Option file schwab_$ticker_range_trade.ini with settings for trading is required.')
-parser.add_argument("-rebalance","--rebalance", required=False, default="None", help='Ticker Symbol to use for rebalancing. Default is None. Option file schwab_$ticker_rebalance.ini with settings for trading is required.')
-
-# Parse the input
-args = parser.parse_args()
-
-# Check to see if new token should be grabbed
-if args.get_tokens:
-
-    # Get updated tokens
-    get_tokens(token_endpoint, token_file, config_file)
-
-# Make sure account type is all lower case
-account_type = args.account_type.lower()
-
-# Get latest access token
-access_token = get_config_value(token_file, "access_token")
-
-# Check to see if account hashes should be grabbed
-if args.get_account_hashes:
-
-    # Define endpint for getting account hashes
-    endpoint = trading_endpoint + "/accounts/accountNumbers"
-
-    # Get account hashes
-    get_account_hashes(endpoint, access_token)
-
-# Check to see if account balance is requested.
-if args.get_balance:
-
-    # Get current date
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d")
-
-    # Get account type hash
-    account_hash = get_config_value(config_file, account_type)
-
-    # Define endpoint for account balance
-    endpoint = trading_endpoint + "/accounts/" + account_hash
-
-    # Get account balance
-    account_balance = get_account_info(endpoint, access_token, "balance")
-
-    # Write out account balance
-    print(account_type + " account balance:")
-    print(str(timestamp) + ", " + str(account_balance))
-
-    # Define name of file to output balance to
-    balance_file = "schwab_" + account_type + "_balance.csv"
+    # Request candles
+    endpoint = marketdata_endpoint + "/pricehistory?symbol=" + ticker + "&periodType=year&frequencyType=daily&frequency=1"
+    if start_date is None:
+        endpoint = endpoint + "&period=20"
+    else:
+        endpoint = endpoint + "&startDate=" + str(int(datetime.datetime.combine(start_date, datetime.time()).timestamp() * 1000)) + "&endDate=" + str(int(time.time() * 1000))
+    content = client.get(endpoint, access_token)
+    if content.status_code != 200:
+        print("Price history request for " + ticker + " failed with status " + str(content.status_code))
+        return None
+    return content.json().get("candles", [])
+
+# Function to get the cache of daily bars, opening it the first time
+def open_price_history():
+
+    global price_history
+    with price_history_lock:
+        if price_history is None:
+            price_history = PriceHistory(price_history_file)
+    return price_history
+
+# Function to get the trading calendar, loading it the first time. The
+# holidays package is only imported if the cached calendar has to be built.
+def open_trading_calendar():
+
+    global trading_calendar
+    with trading_calendar_lock:
+        if trading_calendar is None:
+            trading_calendar = load_calendar(calendar_file)
+    return trading_calendar
+
+# Function to get the start and end (HHMM) of a daemon window on a day.
+# Windows are set in minutes from the open or close of the session, so they
+# end early on half days. Days without a session use regular hours.
+def window_hhmm(window: list, day=None):
+
+    session = open_trading_calendar().session(day) or (SESSION_OPEN, SESSION_CLOSE)
+    anchors = {"open": session[0], "close": session[1]}
+    return tuple(minute_hhmm(anchors[anchor] + minutes) for anchor, minutes in window)
+
+# Function to check if hhmm is in a daemon window today
+def in_window(window: list, hhmm: int):
+
+    start_hhmm, end_hhmm = window_hhmm(window)
+    return start_hhmm <= hhmm <= end_hhmm
+
+
+
+# Class holding the orders, positions and quotes fetched at the start of a cycle
+@dataclass
+class TradeState:
+    open_orders: dict
+    buying_power: float
+    positions: dict
+    quote: tuple
+    buying_power_quote: tuple
+
+
+# Function to run a request on the fetch pool. The pool thread runs it in a
+# copy of the caller's context, so its requests keep the caller's metrics
+# strategy label.
+def submit_fetch(function, *args):
+    return fetch_pool.submit(contextvars.copy_context().run, function, *args)
+
+
+# Function to fetch working orders, positions, the ticker quote and the
+# buying power ticker quote at the same time. None of the requests depend on
+# each other, so the cycle waits for one round trip instead of four. Both
+# quotes come from one batched request. Orders and the ticker quote can be
+# skipped if the caller already has them.
+def fetch_trade_state(orders_endpoint: str, account_endpoint: str, access_token: str, trading_day: str, ticker: str, buying_power_ticker: str, fetch_orders=True, fetch_quote=True):
+
+    # Start all requests
+    if fetch_orders:
+        orders_future = submit_fetch(get_orders, orders_endpoint, access_token, trading_day, "WORKING", "EQUITY")
+    positions_future = submit_fetch(get_account_info, account_endpoint, access_token, "positions", ticker, ["stock", buying_power_ticker])
+    if fetch_quote:
+        quotes_future = submit_fetch(get_quotes, access_token, [ticker, buying_power_ticker])
+    else:
+        quotes_future = submit_fetch(get_quotes, access_token, [buying_power_ticker])
 
-    # Append account balance to a file
-    balance_out = open(balance_file,"a")
-    balance_out.write(str(timestamp) + ", " + str(account_balance) + "\n")
-    balance_out.close()
+    # Wait for all requests and return one snapshot
+    buying_power, positions = positions_future.result()
+    quotes = quotes_future.result()
+    return TradeState(open_orders=orders_future.result() if fetch_orders else {},
+                      buying_power=buying_power,
+                      positions=positions,
+                      quote=quote_prices(quotes[ticker]) if fetch_quote else None,
+                      buying_power_quote=quote_prices(quotes[buying_power_ticker]))
 
-# Set ticker to use for quote and/or options or rebalance trading
-if args.sell_call_options != "None":
-    ticker = args.sell_call_options
-elif args.rebalance != "None":
-    ticker = args.rebalance
-elif args.get_quote != "None": 
-    ticker = args.get_quote
-else:
-    ticker = "None"
 
-# Check to see if quote requested.
-if ticker != "None":
+# Function to get a quote for a ticker and update its resistance level
+def run_get_quote(access_token: str, ticker: str):
 
     # Get current timestamp
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    # Defined endpoint for quote
-    endpoint = marketdata_endpoint + "/quotes?symbols=" + ticker + "&fields=quote&indicative=false"
-
     # Get quote
-    current, highofday, lowofday = get_quote(endpoint, access_token, ticker)
-
-    # Define name of file containing resistence level
-    max_file = ticker + "_max.txt"
+    trace_phase("quote")
+    current, highofday, lowofday = quote_prices(get_quotes(access_token, [ticker])[ticker])
 
     # Get resistance level
-    resistance_level = get_resistance_level(max_file, highofday)
+    resistance_level = get_resistance_level(access_token, ticker, highofday)
 
     # Informational Print
     print(ticker + " quotes valid at " + timestamp + ":")
@@ -421,33 +612,59 @@ if ticker != "None":
     print("Low of Day:        " + str(lowofday))
     print("Resistance Level:  " + str(resistance_level))
 
-# Check for range trading
-if args.range_trade != "None":
+    # Return quote and resistance level
+    return current, highofday, lowofday, resistance_level
+
+
+# Function to print the all time high, drawdown from it and rolling highs of
+# many tickers. Daily bars of all tickers are brought up to date at the same
+# time, and the current prices come from one batched quote request.
+def run_get_ath(access_token: str, tickers: list):
+
+    # Update daily bars and get quotes
+    history = open_price_history()
+    futures = [submit_fetch(history.update, ticker, lambda symbol, start_date: get_price_history(access_token, symbol, start_date)) for ticker in tickers]
+    quotes = get_quotes(access_token, tickers)
+    for ticker, future in zip(tickers, futures):
+        if not future.result():
+            print("Price history for " + ticker + " could not be updated. Using cached bars")
+
+    # Informational Print
+    print("Ticker         ATH    ATH Date     Current  Drawdown %   20d High   50d High  252d High")
+    for ticker in tickers:
+        all_time_high, all_time_high_date = history.all_time_high(ticker)
+        current, highofday = None, 0.0
+        if ticker in quotes:
+            current, highofday, lowofday = quote_prices(quotes[ticker])
+        if highofday > (all_time_high or 0.0):
+            all_time_high, all_time_high_date = highofday, datetime.date.today().isoformat()
+        drawdown = None if current is None else history.drawdown(ticker, current, highofday)
+        columns = [all_time_high, all_time_high_date, current, drawdown] + [history.rolling_high(ticker, days) for days in [20, 50, 252]]
+        print(ticker.ljust(8) + "".join(("-" if value is None else str(value)).rjust(11 if index != 1 else 12) for index, value in enumerate(columns)))
+
+
+# Function to run one range trading cycle for a ticker
+def run_range_trade(access_token: str, account_type: str, ticker: str):
 
     # Define file containing settings for range trading
-    settings_file = "schwab_" + args.range_trade + "_range_trade.ini"
+    settings_file = "schwab_" + ticker + "_range_trade.ini"
 
     # Check to make sure settings file is present
     if not os.path.exists(settings_file):
         print("Option file: " + settings_file + " does not exist. Exiting")
-        sys.exit(1)
+        return False
 
     # Read variables from settings file
-    trade_shares, max_shares, buying_power_ticker, trade_ranges = read_settings_range_trade(settings_file)
-
-    # Define current day, trading day and set year to pull holidays for
-    current_yyyymmdd = datetime.datetime.now().strftime("%Y%m%d")
-    this_year = current_yyyymmdd[0:4]
-    year_list = [this_year]
-    current_trading_day = current_yyyymmdd[0:4] + "-" + current_yyyymmdd[4:6] + "-" + current_yyyymmdd[6:8]
+    trace_phase("settings_load")
+    trade_shares, max_shares, buying_power_ticker, ladder = read_settings_range_trade(settings_file)
 
-    # Call function to get list of holidays for this year and next year
-    holiday_dates = get_holidays(year_list)
+    # Define current trading day
+    current_trading_day = datetime.datetime.now().strftime("%Y-%m-%d")
 
     # Check if current day is a holiday
-    if datetime.datetime.now() in holiday_dates:
+    if open_trading_calendar().is_holiday():
         print("Today is a market holiday. No trading today. Exiting")
-        sys.exit(1)
+        return False
 
     # Get account type hash
     account_hash = get_config_value(config_file, account_type)
@@ -455,85 +672,31 @@ if args.range_trade != "None":
     # Define endpoint for orders
     orders_endpoint = trading_endpoint + "/accounts/" + account_hash + "/orders"
 
-    # Get all current open orders
-    current_open_orders = get_orders(orders_endpoint, access_token, current_trading_day, "WORKING", "EQUITY")
-
     # Define endpoint for account positions
     account_endpoint = trading_endpoint + "/accounts/" + account_hash + "?fields=positions"
 
-    # Get list of current stock positions
-    buying_power, account_positions = get_account_info(account_endpoint, access_token, "positions", args.range_trade, ["stock", buying_power_ticker])
+    # Get current open orders, stock positions and quotes all at once
+    trace_phase("state_fetch")
+    state = fetch_trade_state(orders_endpoint, account_endpoint, access_token, current_trading_day, ticker, buying_power_ticker)
+    current_open_orders = state.open_orders
+    buying_power, account_positions = state.buying_power, state.positions
     print("Account Buying Power: " + str(buying_power))
     if buying_power_ticker not in account_positions:
         account_positions[buying_power_ticker] = 0
-    if args.range_trade not in account_positions:
-        account_positions[args.range_trade] = 0
+    if ticker not in account_positions:
+        account_positions[ticker] = 0
     print(buying_power_ticker + " shares owned: " + str(account_positions[buying_power_ticker]))
-    print(args.range_trade + " shares owned: " + str(account_positions[args.range_trade]))
+    print(ticker + " shares owned: " + str(account_positions[ticker]))
 
-    # Defined endpoint for quote
-    quote_endpoint = marketdata_endpoint + "/quotes?symbols=" + args.range_trade + "&fields=quote&indicative=false"
     # Get latest quote for range trade ticker
-    current, highofday, lowofday = get_quote(quote_endpoint, access_token, args.range_trade)
-    print(args.range_trade + " Current Price: " + str(current))
-    print(args.range_trade + " High of Day:   " + str(highofday))
-    print(args.range_trade + " Low of Day:    " + str(lowofday))
+    current, highofday, lowofday = state.quote
+    print(ticker + " Current Price: " + str(current))
+    print(ticker + " High of Day:   " + str(highofday))
+    print(ticker + " Low of Day:    " + str(lowofday))
 
     # Construct orders to place based on current share count
-    orders = {}
-    if account_positions[args.range_trade] == 0:
-        # Buy Order Only
-        max_shares_to_own = max_shares
-        for shares in trade_ranges:
-            if current >= trade_ranges[shares][0]:
-                max_shares_to_own = shares - trade_shares
-                break
-        if max_shares_to_own > trade_shares:
-            orders[0] = [args.range_trade, "BUY", max_shares_to_own, trade_ranges[max_shares_to_own][0]]
-        else:
-            orders[0] = [args.range_trade, "BUY", trade_shares, trade_ranges[account_positions[args.range_trade] + trade_shares][0]]
-        num_orders = 1
-    elif account_positions[args.range_trade] >= max_shares:
-        # Sell Order Only
-        max_shares_to_own = 0
-        for shares in trade_ranges:
-            if current <= trade_ranges[shares][1]:
-                max_shares_to_own = shares + trade_shares
-        max_shares_to_trade = max_shares - max_shares_to_own
-        if max_shares_to_trade > trade_shares:
-            if max_shares_to_own == 0:
-                orders[0] = [args.range_trade, "SELL", max_shares_to_trade, trade_ranges[trade_shares][1]]
-            else: 
-                orders[0] = [args.range_trade, "SELL", max_shares_to_trade, trade_ranges[max_shares_to_own][1]]
-        else:
-            orders[0] = [args.range_trade, "SELL", trade_shares, trade_ranges[max_shares][1]]
-        num_orders = 1
-    else:
-        # Sell Order
-        max_shares_to_own = 0
-        for shares in trade_ranges:
-            if current <= trade_ranges[shares][1]:
-                max_shares_to_own = shares + trade_shares
-        max_shares_to_trade = account_positions[args.range_trade] - max_shares_to_own
-        if max_shares_to_trade > trade_shares:
-            if max_shares_to_own == 0:
-                orders[0] = [args.range_trade, "SELL", max_shares_to_trade, trade_ranges[trade_shares][1]]
-            else:
-                orders[0] = [args.range_trade, "SELL", max_shares_to_trade, trade_ranges[max_shares_to_own][1]]
-        else:
-            orders[0] = [args.range_trade, "SELL", trade_shares, trade_ranges[account_positions[args.range_trade]][1]]
-        # Buy Order
-        max_shares_to_own = max_shares
-        for shares in trade_ranges:
-            if current >= trade_ranges[shares][0]:
-                 max_shares_to_own = shares - trade_shares
-                 break
-        max_shares_to_trade = max_shares_to_own - account_positions[args.range_trade]
-        if max_shares_to_trade > trade_shares:
-            orders[1] = [args.range_trade, "BUY", max_shares_to_trade, trade_ranges[max_shares_to_own][0]]
-        else:
-            orders[1] = [args.range_trade, "BUY", trade_shares, trade_ranges[account_positions[args.range_trade] + trade_shares][0]]
-        num_orders = 2
+    trace_phase("decision")
+    orders = build_range_trade_orders(ticker, current, account_positions[ticker], ladder)
 
     # Write out current open orders, if any
     if current_open_orders:
@@ -544,39 +707,56 @@ if args.range_trade != "None":
             print("Instruction: " + current_open_orders[current_order][1])
             print("#Shares: " + str(current_open_orders[current_order][2]))
             print("Price: " + str(current_open_orders[current_order][3]))
-            # Loop over orders to place
-            for order in range(num_orders):
-                # Delete order to place if already in place
-                if order in orders:
-                    if orders[order][0] == current_open_orders[current_order][0] and orders[order][1] == current_open_orders[current_order][1] and orders[order][2] == current_open_orders[current_order][2] and math.isclose(orders[order][3],current_open_orders[current_order][3]):
-                        del orders[order]
-
-    # Loop over orders to place
-    for order in orders:
-        # Check on order type
+
+    # Work out which open orders to keep, replace or cancel and which to place
+    plan = reconcile_orders(list(orders.values()), current_open_orders, [(ticker, "BUY"), (ticker, "SELL")])
+
+    # Loop over plan
+    trace_phase("orders")
+    for step in plan:
+        order = step.order
+        # Order already in place
+        if step.action == "KEEP":
+            print ("Order to " + order[1].lower() + " " + str(order[2]) + " shares of " + order[0] + " at limit price of " + str(order[3]) + " already in place")
+            continue
+        # Cancel orders that are no longer wanted
+        if step.action == "CANCEL":
+            order_status = cancel_order(orders_endpoint,access_token,str(step.order_id))
+            # Check order status
+            if order_status == 200:
+                print ("Canceled previous " + order[1] + " order for: " + order[0] + " successfully\n")
+            else:
+                print ("FAILED to cancel previous " + order[1] + " order for: " + order[0] + "\n")
+            continue
+        # Define order to place
+        order_args = dict(symbol=order[0],
+                          order_type="LIMIT",
+                          instruction=order[1],
+                          quantity=order[2],
+                          order_leg_type="EQUITY",
+                          asset_type="EQUITY",
+                          position_effect="OPENING",
+                          price=order[3],
+                          special_instructions="ALL_OR_NONE")
         # BUY order
-        if orders[order][1] == "BUY":
-            # Cancel any buy orders that are currently in place
-            for current_order in current_open_orders:
-                # Check for matching buy order
-                if orders[order][0] == current_open_orders[current_order][0] and orders[order][1] == current_open_orders[current_order][1] and orders[order][2] == current_open_orders[current_order][2]:
-                    order_status = cancel_order(orders_endpoint,access_token,str(current_order))
-                    # Check order status
-                    if order_status == 200:
-                        print ("Canceled previous " + orders[order][1] + " order for: " + orders[order][0] + " successfully\n")
-                    else:
-                        print ("FAILED to cancel previous " + orders[order][1] + " order for: " + orders[order][0] + "\n")
+        if order[1] == "BUY":
             # Compute needed buying power
-            needed_buying_power = float(orders[order][2]) * orders[order][3] - buying_power
-            # Defined endpoint for quote
-            quote_endpoint = marketdata_endpoint + "/quotes?symbols=" + buying_power_ticker + "&fields=quote&indicative=false"
+            needed_buying_power = float(order[2]) * order[3] - buying_power
             # Get latest quote for buying power ticker
-            current, highofday, lowofday = get_quote(quote_endpoint, access_token, buying_power_ticker)
-            # Compute number of shares needed to sell to raise buying power
+            current, highofday, lowofday = state.buying_power_quote
+            # Raise buying power first if needed, with the buy order triggered by the sale
             if needed_buying_power > 0.0:
+                # Compute number of shares needed to sell to raise buying power
                 sell_shares = int(needed_buying_power / highofday) + 1
-                # Place market order to sell to raise buying power
-                print ("Placing market order to sell " + str(sell_shares) + " shares of " + buying_power_ticker)
+                # An open order can't be replaced with an order that triggers it, so cancel it
+                if step.action == "REPLACE":
+                    order_status = cancel_order(orders_endpoint,access_token,str(step.order_id))
+                    if order_status != 200:
+                        print ("FAILED to cancel previous " + order[1] + " order for: " + order[0] + "\n")
+                        continue
+                    print ("Canceled previous " + order[1] + " order for: " + order[0] + " successfully\n")
+                # Place market order to sell that triggers the buy order once filled
+                print ("Placing market order to sell " + str(sell_shares) + " shares of " + buying_power_ticker + " that triggers order to buy " + str(order[2]) + " shares of " + order[0] + " at limit price of " + str(order[3]))
                 order_status = place_order(
                                endpoint=orders_endpoint,
                                access_token=access_token,
@@ -586,93 +766,37 @@ if args.range_trade != "None":
                                quantity=sell_shares,
                                order_leg_type="EQUITY",
                                asset_type="EQUITY",
-                               position_effect="CLOSING")
-                # Check order status
-                if order_status == 201:
-                    print ("Order successfully placed to sell " + str(sell_shares) + " shares of " + buying_power_ticker)
-                    # Compute needed buying power to buy shares
-                    needed_buying_power = float(orders[order][2]) * orders[order][3]
-                    # Loop to see if order has been filled and buying power has increased
-                    for i in range(7):
-                        print("Sleeping 5 seconds. Waiting for market order to be filled")
-                        time.sleep(5)
-                        buying_power, account_positions = get_account_info(account_endpoint, access_token, "positions", args.range_trade, ["stock", buying_power_ticker])
-                        if buying_power >= needed_buying_power:
-                            print ("Order to sell " + str(sell_shares) + " shares of " + buying_power_ticker + " has been filled. \nPlacing order to buy " + str(orders[order][2]) + " shares of " + orders[order][0] + " at limit price of " + str(orders[order][3]))
-                            order_status = place_order(
-                                           endpoint=orders_endpoint,
-                                           access_token=access_token,
-                                           symbol=orders[order][0],
-                                           order_type="LIMIT", 
-                                           instruction=orders[order][1],
-                                           quantity=orders[order][2],
-                                           order_leg_type="EQUITY",
-                                           asset_type="EQUITY",
-                                           position_effect="OPENING",
-                                           price=orders[order][3],
-                                           special_instructions="ALL_OR_NONE")
-                            # Check order status
-                            if order_status == 201:
-                                print ("Order successfully placed to buy " + str(orders[order][2]) + " shares of " + orders[order][0] + " at limit price of " + str(orders[order][3]))
-                            else:
-                                print ("FAILED to place order to buy " + str(orders[order][2]) + " shares of " + orders[order][0] + " at limit price of " + str(orders[order][3]))
-                            # Exit from loop
-                            break
-                else:
-                    print ("FAILED to place order to sell " + str(sell_shares) + " shares of " + buying_power_ticker)
-            else:
-                print ("Placing order to buy " + str(orders[order][2]) + " shares of " + orders[order][0] + " at limit price of " + str(orders[order][3]))
-                order_status = place_order(
-                               endpoint=orders_endpoint,
-                               access_token=access_token,
-                               symbol=orders[order][0],
-                               order_type="LIMIT", 
-                               instruction=orders[order][1],
-                               quantity=orders[order][2],
-                               order_leg_type="EQUITY",
-                               asset_type="EQUITY",
-                               position_effect="OPENING",
-                               price=orders[order][3],
-                               special_instructions="ALL_OR_NONE")
+                               position_effect="CLOSING",
+                               child_orders=[build_order_payload(**order_args)])
                 # Check order status
                 if order_status == 201:
-                    print ("Order successfully placed to buy " + str(orders[order][2]) + " shares of " + orders[order][0] + " at limit price of " + str(orders[order][3]))
+                    print ("Order successfully placed to sell " + str(sell_shares) + " shares of " + buying_power_ticker + " and then buy " + str(order[2]) + " shares of " + order[0])
                 else:
-                    print ("FAILED to place order to buy " + str(orders[order][2]) + " shares of " + orders[order][0] + " at limit price of " + str(orders[order][3]))
-
-        # SELL order
-        elif orders[order][1] == "SELL":
-            print ("Placing order to sell " + str(orders[order][2]) + " shares of " + orders[order][0] + " at limit price of " + str(orders[order][3]))
-            order_status = place_order(
-                           endpoint=orders_endpoint,
-                           access_token=access_token,
-                           symbol=orders[order][0],
-                           order_type="LIMIT", 
-                           instruction=orders[order][1],
-                           quantity=orders[order][2],
-                           order_leg_type="EQUITY",
-                           asset_type="EQUITY",
-                           position_effect="OPENING",
-                           price=orders[order][3],
-                           special_instructions="ALL_OR_NONE")
-            # Check order status
-            if order_status == 201:
-                print ("Order successfully placed to sell " + str(orders[order][2]) + " shares of " + orders[order][0] + " at limit price of " + str(orders[order][3]))
-            else:
-                print ("FAILED to place order to sell " + str(orders[order][2]) + " shares of " + orders[order][0] + " at limit price of " + str(orders[order][3]))
-
-    # Get current time, HHMM
-    hhmm = int(datetime.datetime.now().strftime("%H%M"))
+                    print ("FAILED to place order to sell " + str(sell_shares) + " shares of " + buying_power_ticker + " and then buy " + str(order[2]) + " shares of " + order[0])
+                continue
+        # Place the order, or replace the open order with it
+        if step.action == "REPLACE":
+            print ("Replacing previous " + order[1] + " order " + str(step.order_id) + " for: " + order[0])
+        print ("Placing order to " + order[1].lower() + " " + str(order[2]) + " shares of " + order[0] + " at limit price of " + str(order[3]))
+        if step.action == "REPLACE":
+            order_status = replace_order(orders_endpoint, access_token, step.order_id, **order_args)
+        else:
+            order_status = place_order(endpoint=orders_endpoint, access_token=access_token, **order_args)
+        # Check order status
+        if order_status == 201:
+            print ("Order successfully placed to " + order[1].lower() + " " + str(order[2]) + " shares of " + order[0] + " at limit price of " + str(order[3]))
+        else:
+            print ("FAILED to place order to " + order[1].lower() + " " + str(order[2]) + " shares of " + order[0] + " at limit price of " + str(order[3]))
 
-    # At end of trading day, use any remaining buying power to buy shares of BIL.
-    if hhmm == 1559:
+    # At end of trading day, use any remaining buying power to buy shares of
+    # BIL. This is the last minute before the close, 15:59 or 12:59 on half days.
+    if open_trading_calendar().minutes_to_close() == 1:
+        trace_phase("park_buying_power")
         # Get latest buying power
-        buying_power, account_positions = get_account_info(account_endpoint, access_token, "positions", args.range_trade, ["stock", buying_power_ticker])
+        buying_power, account_positions = get_account_info(account_endpoint, access_token, "positions", ticker, ["stock", buying_power_ticker])
         print("\nLatest Account Buying Power: " + str(buying_power))
-        # Defined endpoint for quote
-        quote_endpoint = marketdata_endpoint + "/quotes?symbols=" + buying_power_ticker + "&fields=quote&indicative=false"
         # Get latest quote for buying power ticker
-        current, highofday, lowofday = get_quote(quote_endpoint, access_token, buying_power_ticker)
+        current, highofday, lowofday = quote_prices(get_quotes(access_token, [buying_power_ticker])[buying_power_ticker])
         print(buying_power_ticker + " latest quote: " + str(current))
         # Compute number of shares to buy
         buy_shares = int(buying_power / highofday)
@@ -695,36 +819,35 @@ if args.range_trade != "None":
             else:
                 print ("FAILED to place order to buy " + str(buy_shares) + " shares of " + buying_power_ticker)
 
+    # Return that the cycle ran
+    return True
 
-# Check for rebalance
-if args.rebalance != "None":
+
+# Function to run one rebalancing cycle for a ticker
+def run_rebalance(access_token: str, account_type: str, ticker: str, current: float, resistance_level: float):
 
     # Define file containing settings for rebalancing
-    settings_file = "schwab_" + args.rebalance + "_rebalance.ini"
+    settings_file = "schwab_" + ticker + "_rebalance.ini"
 
     # Check to make sure settings file is present
     if not os.path.exists(settings_file):
         print("Option file: " + settings_file + " does not exist. Exiting")
-        sys.exit(1)
+        return False
 
     # Read variables from settings file
+    trace_phase("settings_load")
     available_cash, min_position, max_position, min_allocation, buying_power_ticker = read_settings_rebalance(settings_file)
 
-    # Define current day, trading day and set year to pull holidays for
-    current_yyyymmdd = datetime.datetime.now().strftime("%Y%m%d")
-    this_year = current_yyyymmdd[0:4]
-    year_list = [this_year]
-    current_trading_day = current_yyyymmdd[0:4] + "-" + current_yyyymmdd[4:6] + "-" + current_yyyymmdd[6:8]
-
-    # Call function to get list of holidays for this year and next year
-    holiday_dates = get_holidays(year_list)
+    # Define current trading day
+    current_trading_day = datetime.datetime.now().strftime("%Y-%m-%d")
 
     # Check if current day is a holiday
-    if datetime.datetime.now() in holiday_dates:
+    if open_trading_calendar().is_holiday():
         print("Today is a market holiday. No trading today. Exiting")
-        sys.exit(1)
+        return False
 
     # Compute fraction below resistance level (ATH)
+    trace_phase("decision")
     percent_below = ((resistance_level - current) / resistance_level) * 100.0
     print("%Below Resistance: " + str(round(percent_below,3)) + "\n")
 
@@ -748,32 +871,41 @@ if args.rebalance != "None":
     # Define endpoint for account positions
     account_endpoint = trading_endpoint + "/accounts/" + account_hash + "?fields=positions"
 
-    # Get list of current stock positions
-    buying_power, account_positions = get_account_info(account_endpoint, access_token, "positions", args.rebalance, ["stock", buying_power_ticker])
+    # Get current stock positions and buying power ticker quote all at once
+    trace_phase("state_fetch")
+    state = fetch_trade_state(orders_endpoint, account_endpoint, access_token, current_trading_day, ticker, buying_power_ticker, fetch_orders=False, fetch_quote=False)
+    buying_power, account_positions = state.buying_power, state.positions
     print("BEFORE Rebalancing:")
     print("Account Buying Power: " + str(buying_power))
     if buying_power_ticker not in account_positions:
         account_positions[buying_power_ticker] = 0
-    if args.rebalance not in account_positions:
-        account_positions[args.rebalance] = 0
+    if ticker not in account_positions:
+        account_positions[ticker] = 0
     print(buying_power_ticker + " shares owned: " + str(account_positions[buying_power_ticker]))
-    print(args.rebalance + " shares owned: " + str(account_positions[args.rebalance]))
+    print(ticker + " shares owned: " + str(account_positions[ticker]))
 
     # Check on order type
+    trace_phase("orders")
     # BUY order
-    if nshares > account_positions[args.rebalance]:
+    if nshares > account_positions[ticker]:
         # Compute number of shares to buy
-        nshares_to_buy = nshares - account_positions[args.rebalance]
+        nshares_to_buy = nshares - account_positions[ticker]
         # Compute estimated buying power needed
         needed_buying_power = nshares_to_buy * current
-        # Defined endpoint for quote
-        quote_endpoint = marketdata_endpoint + "/quotes?symbols=" + buying_power_ticker + "&fields=quote&indicative=false"
         # Get latest quote for buying power ticker
-        current, highofday, lowofday = get_quote(quote_endpoint, access_token, buying_power_ticker)
+        current, highofday, lowofday = state.buying_power_quote
         # Compute number of shares needed to sell to raise buying power
         sell_shares = int(needed_buying_power / highofday) + 1
-        # Place market order to sell to raise buying power
-        print ("Placing market order to sell " + str(sell_shares) + " shares of " + buying_power_ticker)
+        # Place market order to sell to raise buying power, which triggers the buy once filled
+        print ("Placing market order to sell " + str(sell_shares) + " shares of " + buying_power_ticker + " that triggers market order to buy " + str(nshares_to_buy) + " shares of " + ticker)
+        buy_order = build_order_payload(
+                    symbol=ticker,
+                    order_type="MARKET", 
+                    instruction="BUY",
+                    quantity=nshares_to_buy,
+                    order_leg_type="EQUITY",
+                    asset_type="EQUITY",
+                    position_effect="OPENING")
         order_status = place_order(
                        endpoint=orders_endpoint,
                        access_token=access_token,
@@ -783,101 +915,68 @@ if args.rebalance != "None":
                        quantity=sell_shares,
                        order_leg_type="EQUITY",
                        asset_type="EQUITY",
-                       position_effect="CLOSING")
+                       position_effect="CLOSING",
+                       child_orders=[buy_order])
         # Check order status
         if order_status == 201:
-            print ("Order successfully placed to sell " + str(sell_shares) + " shares of " + buying_power_ticker)
-            # Loop to see if order has been filled and buying power has increased
-            for i in range(7):
-                print("Sleeping 5 seconds. Waiting for market order to be filled")
-                time.sleep(5)
-                buying_power, account_positions = get_account_info(account_endpoint, access_token, "positions", args.rebalance, ["stock", buying_power_ticker])
-                if buying_power >= needed_buying_power:
-                    print ("Order to sell " + str(sell_shares) + " shares of " + buying_power_ticker + " has been filled. \nPlacing market order to buy " + str(nshares_to_buy) + " shares of " + args.rebalance)
-                    order_status = place_order(
-                                   endpoint=orders_endpoint,
-                                   access_token=access_token,
-                                   symbol=args.rebalance,
-                                   order_type="MARKET", 
-                                   instruction="BUY",
-                                   quantity=nshares_to_buy,
-                                   order_leg_type="EQUITY",
-                                   asset_type="EQUITY",
-                                   position_effect="OPENING")
-                    # Check order status
-                    if order_status == 201:
-                        print ("Order successfully placed to buy " + str(nshares_to_buy) + " shares of " + args.rebalance)
-                    else:
-                        print ("FAILED to place order to buy " + str(nshares_to_buy) + " shares of " + args.rebalance)
-                    # Exit from loop
-                    break
+            print ("Order successfully placed to sell " + str(sell_shares) + " shares of " + buying_power_ticker + " and then buy " + str(nshares_to_buy) + " shares of " + ticker)
+        else:
+            print ("FAILED to place order to sell " + str(sell_shares) + " shares of " + buying_power_ticker + " and then buy " + str(nshares_to_buy) + " shares of " + ticker)
 
     # SELL order
-    elif nshares < account_positions[args.rebalance]:
+    elif nshares < account_positions[ticker]:
         # Compute number of shares to sell
-        nshares_to_sell = account_positions[args.rebalance] - nshares
+        nshares_to_sell = account_positions[ticker] - nshares
         # Compute estimated proceeds from sale
         proceeds = nshares_to_sell * current
-        # Defined endpoint for quote
-        quote_endpoint = marketdata_endpoint + "/quotes?symbols=" + buying_power_ticker + "&fields=quote&indicative=false"
         # Get latest quote for buying power ticker
-        current, highofday, lowofday = get_quote(quote_endpoint, access_token, buying_power_ticker)
+        current, highofday, lowofday = state.buying_power_quote
         # Compute number of shares needed to buy of buying power ticker
         buy_shares = int(proceeds / highofday)
-        # Place market order to sell to raise buying power
-        print ("Placing market order to sell " + str(nshares_to_sell) + " shares of " + args.rebalance)
+        # Place market order to sell, which triggers the buy of the buying power ticker once filled
+        print ("Placing market order to sell " + str(nshares_to_sell) + " shares of " + ticker + " that triggers market order to buy " + str(buy_shares) + " shares of " + buying_power_ticker)
+        buy_order = build_order_payload(
+                    symbol=buying_power_ticker,
+                    order_type="MARKET", 
+                    instruction="BUY",
+                    quantity=buy_shares,
+                    order_leg_type="EQUITY",
+                    asset_type="EQUITY",
+                    position_effect="OPENING")
         order_status = place_order(
                        endpoint=orders_endpoint,
                        access_token=access_token,
-                       symbol=args.rebalance,
+                       symbol=ticker,
                        order_type="MARKET", 
                        instruction="SELL", 
                        quantity=nshares_to_sell,
                        order_leg_type="EQUITY",
                        asset_type="EQUITY",
-                       position_effect="CLOSING")
+                       position_effect="CLOSING",
+                       child_orders=[buy_order] if buy_shares > 0 else None)
         # Check order status
         if order_status == 201:
-            print ("Order successfully placed to sell " + str(nshares_to_sell) + " shares of " + args.rebalance)
-            # Loop to see if order has been filled and buying power has increased
-            for i in range(7):
-                print("Sleeping 5 seconds. Waiting for market order to be filled")
-                time.sleep(5)
-                buying_power, account_positions = get_account_info(account_endpoint, access_token, "positions", args.rebalance, ["stock", buying_power_ticker])
-                if buying_power >= proceeds:
-                    print ("Order to sell " + str(nshares_to_sell) + " shares of " + args.rebalance + " has been filled. \nPlacing market order to buy " + str(buy_shares) + " shares of " + buying_power_ticker)
-                    order_status = place_order(
-                                   endpoint=orders_endpoint,
-                                   access_token=access_token,
-                                   symbol=buying_power_ticker,
-                                   order_type="MARKET", 
-                                   instruction="BUY",
-                                   quantity=buy_shares,
-                                   order_leg_type="EQUITY",
-                                   asset_type="EQUITY",
-                                   position_effect="OPENING")
-                    # Check order status
-                    if order_status == 201:
-                        print ("Order successfully placed to buy " + str(buy_shares) + " shares of " + buying_power_ticker)
-                    else:
-                        print ("FAILED to place order to buy " + str(buy_shares) + " shares of " + buying_power_ticker)
-                    # Exit from loop
-                    break
+            print ("Order successfully placed to sell " + str(nshares_to_sell) + " shares of " + ticker + " and then buy " + str(buy_shares) + " shares of " + buying_power_ticker)
+        else:
+            print ("FAILED to place order to sell " + str(nshares_to_sell) + " shares of " + ticker + " and then buy " + str(buy_shares) + " shares of " + buying_power_ticker)
 
     # Get list of current stock positions after rebalancing
-    buying_power, account_positions = get_account_info(account_endpoint, access_token, "positions", args.rebalance, ["stock", buying_power_ticker])
+    buying_power, account_positions = get_account_info(account_endpoint, access_token, "positions", ticker, ["stock", buying_power_ticker])
     print("\nAFTER Rebalancing:")
     print("Account Buying Power: " + str(buying_power))
     if buying_power_ticker not in account_positions:
         account_positions[buying_power_ticker] = 0
-    if args.rebalance not in account_positions:
-        account_positions[args.rebalance] = 0
+    if ticker not in account_positions:
+        account_positions[ticker] = 0
     print(buying_power_ticker + " shares owned: " + str(account_positions[buying_power_ticker]))
-    print(args.rebalance + " shares owned: " + str(account_positions[args.rebalance]))
+    print(ticker + " shares owned: " + str(account_positions[ticker]))
+
+    # Return that the cycle ran
+    return True
 
 
-# Check for options trading
-if args.sell_call_options != "None":
+# Function to run one cycle of selling call options for a ticker
+def run_sell_call_options(access_token: str, account_type: str, ticker: str, current: float, resistance_level: float, percent_threshold: float, order_log_name="orders.json"):
 
     # Define file containing settings for selling call options
     settings_file = "schwab_" + ticker + "_sell_call_options.ini"
@@ -885,42 +984,22 @@ if args.sell_call_options != "None":
     # Check to make sure settings file is present
     if not os.path.exists(settings_file):
         print("Option file: " + settings_file + " does not exist. Exiting")
-        sys.exit(1)
+        return False
 
     # Read variables from settings file
+    trace_phase("settings_load")
     trade_price, min_trade_price, transition_time, trade_contracts, max_contracts = read_settings(settings_file)
 
-    # Set years to pull holidays for. Handle holidays beginning in the new year
-    this_year = datetime.datetime.now().strftime("%Y")
-    next_year = (datetime.datetime.now() + datetime.timedelta(days=10)).strftime("%Y")
-    year_list = [this_year, next_year]
-
-    # Call function to get list of holidays for this year and next year
-    holiday_dates = get_holidays(year_list)
-
     # Check if current day is a holiday
-    if datetime.datetime.now() in holiday_dates:
+    calendar = open_trading_calendar()
+    if calendar.is_holiday():
         print("Today is a market holiday. No trading today. Exiting")
-        sys.exit(1)
+        return False
     else:
         current_trading_day = datetime.datetime.now().strftime("%Y-%m-%d")
 
-    # Check day of week and set next trading day
-    if datetime.datetime.now().weekday() == 4:
-        next_trading_day = datetime.datetime.now() + datetime.timedelta(days=3)
-    else:
-        next_trading_day = datetime.datetime.now() + datetime.timedelta(days=1)
-
-    # Check if the next trading day is a holiday
-    if next_trading_day in holiday_dates:
-        # Push ahead to next trading day
-        if next_trading_day.weekday() == 4:
-            next_trading_day = next_trading_day + datetime.timedelta(days=3)
-        else:
-            next_trading_day = next_trading_day + datetime.timedelta(days=1)
-
-    # Convert next trading day into a string
-    next_trading_day = next_trading_day.strftime("%Y-%m-%d")
+    # Set next trading day, skipping weekends and holidays
+    next_trading_day = calendar.next_session().strftime("%Y-%m-%d")
 
     # Define current and next trading day in yyyymmdd and yymmdd format
     current_parts = current_trading_day.split("-")
@@ -933,7 +1012,7 @@ if args.sell_call_options != "None":
     os.makedirs(ticker + "/" + current_yyyymmdd, exist_ok=True)
 
     # Define path to order log file
-    order_log = ticker + "/" + current_yyyymmdd + "/orders.json"
+    order_log = ticker + "/" + current_yyyymmdd + "/" + order_log_name
 
     # Read order log if it exists
     if os.path.exists(order_log):
@@ -946,6 +1025,7 @@ if args.sell_call_options != "None":
     endpoint = marketdata_endpoint + "/chains?symbol=" + ticker + "&contractType=CALL&strikeCount=24&fromDate=" + current_trading_day + "&toDate=" + next_trading_day
 
     # Get call options quotes
+    trace_phase("state_fetch")
     option_quotes = get_quote(endpoint, access_token, ticker, "option")
     #print(option_quotes)
 
@@ -954,24 +1034,25 @@ if args.sell_call_options != "None":
     print("%Below Resistance: " + str(round(percent_below,3)) + "\n")
 
     # Set flag for selling call options
-    if percent_below <= float(args.percent_threshold):
+    if percent_below <= percent_threshold:
         options_trading = True
     else:
         options_trading = False
 
     # Adjust number of contracts to trade based on how close to resistance level
-    trade_level_one = float(args.percent_threshold) * 0.3333333
-    trade_level_two = float(args.percent_threshold) * 0.6666667
+    trade_level_one = percent_threshold * 0.3333333
+    trade_level_two = percent_threshold * 0.6666667
     # Reduce contracts by 1/3
     if percent_below > trade_level_one and percent_below <= trade_level_two:
         trade_contracts = int(float(trade_contracts) * 0.66) + 1
-    elif percent_below > trade_level_two and percent_below <= float(args.percent_threshold):
+    elif percent_below > trade_level_two and percent_below <= percent_threshold:
         trade_contracts = int(float(trade_contracts) * 0.33) + 1
-    elif percent_below > float(args.percent_threshold):
+    elif percent_below > percent_threshold:
         trade_contracts = 0
 
-    # Get current time, HHMM
+    # Get current time, HHMM, and minutes to the close
     hhmm = int(datetime.datetime.now().strftime("%H%M"))
+    minutes_to_close = calendar.minutes_to_close()
 
     # Get account type hash
     account_hash = get_config_value(config_file, account_type)
@@ -989,8 +1070,9 @@ if args.sell_call_options != "None":
     # Define endpoint for orders
     orders_endpoint = trading_endpoint + "/accounts/" + account_hash + "/orders"
 
-    # Get all current open orders
+    # Get all current open orders, indexed by symbol and instruction
     current_open_orders = get_orders(orders_endpoint, access_token, current_trading_day, "WORKING")
+    open_order_index = OrderIndex(current_open_orders)
 
     # Write out current open orders, if any
     if current_open_orders:
@@ -1001,9 +1083,8 @@ if args.sell_call_options != "None":
             print("Instruction: " + current_open_orders[order][1])
             print("#Contracts: " + str(current_open_orders[order][2]))
             # Add contracts to total contracts if order still open
-            for symbol in stored_orders:
-                if symbol == current_open_orders[order][0] and stored_orders[symbol][0] == current_open_orders[order][1] and stored_orders[symbol][1] == current_open_orders[order][2] and stored_orders[symbol][2] == "WORKING":
-                    total_contracts = total_contracts + current_open_orders[order][2]
+            if is_stored_working(stored_orders, current_open_orders[order]):
+                total_contracts = total_contracts + current_open_orders[order][2]
 
     # Loop over current positions and total up number of contracts in play
     for key in account_positions:
@@ -1011,6 +1092,7 @@ if args.sell_call_options != "None":
         total_contracts = total_contracts + account_positions[key][0]
 
     # Loop over current positions and check if any should be closed
+    trace_phase("close_positions")
     for key in account_positions:
         # Extract out strike price
         strike_price = float(key.split()[1][9:12])
@@ -1030,22 +1112,25 @@ if args.sell_call_options != "None":
             print ("Ask Price: " + str(option_quotes[key][1]) + "\n")
         else:
             print ("")
-        # Close option position, if strike price exceeded or option about to expire
-        if current > strike_price or (current_yymmdd == expiration_date and hhmm >= 1610):
-            # Loop over current open orders
-            for order in current_open_orders:
-                if current_open_orders[order][0] == key and current_open_orders[order][1] == "BUY_TO_CLOSE":
-                    order_status = cancel_order(orders_endpoint,access_token,str(order))
-                    # Check order status
-                    if order_status == 200:
-                        print ("Canceled previous order for: (" + key + ") successfully\n")
-                    else:
-                        print ("FAILED to cancel previous order for (" + key + ")\n")
+        # Close option position, if strike price exceeded or option about to
+        # expire, 10 minutes after the close (16:10, or 13:10 on half days)
+        if current > strike_price or (current_yymmdd == expiration_date and minutes_to_close is not None and minutes_to_close <= -10):
+            # Mark when the quote showing the strike price was exceeded was received
+            if current > strike_price:
+                mark("quote", at=quote_cache.received(ticker), symbol=key, strike=strike_price)
+            # Loop over current open orders to close this position
+            for order in open_order_index.find(key, "BUY_TO_CLOSE"):
+                order_status = cancel_order(orders_endpoint,access_token,str(order))
+                # Check order status
+                if order_status == 200:
+                    print ("Canceled previous order for: (" + key + ") successfully\n")
+                else:
+                    print ("FAILED to cancel previous order for (" + key + ")\n")
             # Set limit price to close option
             limit_price = round(option_quotes[key][1] - 0.33 * (option_quotes[key][1] - option_quotes[key][0]),2)
             # Output what position is being closed
             print ("Placing order to buy to close: (" + key + ") at limit price of " + str(limit_price))
-            order_status = place_order(
+            order_status, close_order_id = place_order(
                            endpoint=orders_endpoint,
                            access_token=access_token,
                            symbol=key, 
@@ -1055,10 +1140,12 @@ if args.sell_call_options != "None":
                            order_leg_type="OPTION",
                            asset_type="OPTION",
                            position_effect="CLOSING",
-                           price=limit_price)
+                           price=limit_price,
+                           return_order_id=True)
             # Check order status
             if order_status == 201:
                 print ("Order successfully placed to buy to close: (" + key + ")")
+                mark("buy_to_close_ack", symbol=key, order_id=close_order_id)
                 # If stopped out, check to see if order can be rolled to next strike price
                 if current > strike_price:
                     # Compute contracts available
@@ -1069,24 +1156,22 @@ if args.sell_call_options != "None":
                         # to free up contracts for trading
                         # Loop over current open orders
                         for order in current_open_orders:
-                            # Check for SELL_TO_OPEN orders
-                            if current_open_orders[order][1] == "SELL_TO_OPEN":
-                                # Loop over stored orders to find matching order
-                                for symbol in stored_orders:
-                                    if symbol == current_open_orders[order][0] and stored_orders[symbol][0] == current_open_orders[order][1] and stored_orders[symbol][1] == current_open_orders[order][2] and stored_orders[symbol][2] == "WORKING":
-                                        # Cancel order
-                                        order_status = cancel_order(orders_endpoint,access_token,str(order))
-                                        # Check order status
-                                        if order_status == 200:
-                                            print ("Canceled order for: (" + symbol + ") successfully\n")
-                                            # Switch stored order status to CANCELED
-                                            stored_orders[symbol][2] = "CANCELED"
-                                            # Reduce the total number of contracts
-                                            total_contracts = total_contracts - current_open_orders[order][2]
-                                            # Update contracts available
-                                            contract_avail = max_contracts - total_contracts - 1
-                                        else:
-                                            print ("FAILED to cancel for: (" + symbol + ")\n")
+                            # Check for SELL_TO_OPEN orders in the order log
+                            if current_open_orders[order][1] == "SELL_TO_OPEN" and is_stored_working(stored_orders, current_open_orders[order]):
+                                symbol = current_open_orders[order][0]
+                                # Cancel order
+                                order_status = cancel_order(orders_endpoint,access_token,str(order))
+                                # Check order status
+                                if order_status == 200:
+                                    print ("Canceled order for: (" + symbol + ") successfully\n")
+                                    # Switch stored order status to CANCELED
+                                    stored_orders[symbol][2] = "CANCELED"
+                                    # Reduce the total number of contracts
+                                    total_contracts = total_contracts - current_open_orders[order][2]
+                                    # Update contracts available
+                                    contract_avail = max_contracts - total_contracts - 1
+                                else:
+                                    print ("FAILED to cancel for: (" + symbol + ")\n")
                     # Try to increment number of contracts by one
                     if contract_avail > 0:
                         roll_trade_contracts = account_positions[key][0] + 1
@@ -1094,112 +1179,59 @@ if args.sell_call_options != "None":
                         total_contracts = total_contracts + 1
                     else:
                         roll_trade_contracts = account_positions[key][0]
-                    # Initialize filled order flag to False
-                    close_order_filled = False
-                    # Loop to see if order to close has been filled
-                    for i in range(7):
-                        print("Sleeping 5 seconds. Waiting for buy to close order to be filled")
-                        time.sleep(5)
-                        # Get filled orders
-                        current_filled_orders = get_orders(orders_endpoint, access_token, current_trading_day, "FILLED")
-                        # Loop over orders
-                        for order in current_filled_orders:
-                            # Check to see if order has been filled
-                            if current_filled_orders[order][0] == key and current_filled_orders[order][1] == "BUY_TO_CLOSE" and current_filled_orders[order][2] == account_positions[key][0]:
-                                print ("Order to buy to close: (" + key + ") has been filled. Rolling option to next strike price above current price")
-                                # Set strike price to trade
-                                new_strike = int(current) + 1
-                                # Place new order based on time of day
-                                if hhmm > transition_time:
-                                    # Trade next day
-                                    # Find strike that provides at least as much premium as was closed
-                                    for strike in range(new_strike+10, new_strike-1, -1):
-                                        trade_symbol = key[0:6] + next_yymmdd + key[12:15] + str(strike) + key[18:]
-                                        if option_quotes[trade_symbol][0] >= limit_price:
-                                            break
-                                else:
-                                    # Trade same day that was closed
-                                    trade_symbol = key[0:15] + str(new_strike) + key[18:]
-                                # Set initial limit price to roll option
-                                limit_price = round(option_quotes[trade_symbol][1] + 0.33 * (option_quotes[trade_symbol][1] - option_quotes[trade_symbol][0]),2)
-                                # Output what order is being placed
-                                print ("Placing order to sell to open " + str(roll_trade_contracts) + " contracts of : (" + trade_symbol + ") at limit price of " + str(limit_price))
-                                order_status = place_order(
-                                               endpoint=orders_endpoint,
-                                               access_token=access_token,
-                                               symbol=trade_symbol, 
-                                               order_type="LIMIT", 
-                                               instruction="SELL_TO_OPEN", 
-                                               quantity=roll_trade_contracts,
-                                               order_leg_type="OPTION",
-                                               asset_type="OPTION",
-                                               position_effect="OPENING",
-                                               price=limit_price)
-                                # Check order status
-                                if order_status == 201:
-                                    print ("Order successfully placed to sell to open: (" + trade_symbol + ")")
+                    # Wait for order to close to be filled
+                    close_result = await_order(orders_endpoint, access_token, close_order_id, time.time() + 35, "buy to close order")
+                    if close_result.status == "FILLED":
+                        mark("buy_to_close_fill", symbol=key, order_id=close_order_id)
+                        print ("Order to buy to close: (" + key + ") has been filled. Rolling option to next strike price above current price")
+                        # Set strike price to trade
+                        new_strike = int(current) + 1
+                        # Place new order based on time of day
+                        if hhmm > transition_time:
+                            # Trade next day
+                            # Find highest strike up to 10 above the new strike that provides at least as much premium as was closed
+                            trade_symbol = option_quotes.highest_strike_bid_at_least(next_yymmdd, limit_price, new_strike, new_strike+10)
+                            if trade_symbol is None:
+                                trade_symbol = option_quotes.find(next_yymmdd, new_strike)
+                        else:
+                            # Trade same day that was closed
+                            trade_symbol = option_quotes.find(expiration_date, new_strike)
+                        # Check that an option quote was found to roll to
+                        if trade_symbol is None:
+                            print ("No option quote found to roll (" + key + ") to strike price " + str(new_strike) + ". Not rolling position.")
+                        else:
+                            # Set initial limit price to roll option
+                            limit_price = round(option_quotes[trade_symbol][1] + 0.33 * (option_quotes[trade_symbol][1] - option_quotes[trade_symbol][0]),2)
+                            # Output what order is being placed
+                            print ("Placing order to sell to open " + str(roll_trade_contracts) + " contracts of : (" + trade_symbol + ") at limit price of " + str(limit_price))
+                            roll_order = dict(symbol=trade_symbol,
+                                              order_type="LIMIT",
+                                              instruction="SELL_TO_OPEN",
+                                              quantity=roll_trade_contracts,
+                                              order_leg_type="OPTION",
+                                              asset_type="OPTION",
+                                              position_effect="OPENING")
+                            order_status, roll_order_id = place_order(
+                                           endpoint=orders_endpoint,
+                                           access_token=access_token,
+                                           price=limit_price,
+                                           return_order_id=True,
+                                           **roll_order)
+                            # Check order status
+                            if order_status == 201:
+                                print ("Order successfully placed to sell to open: (" + trade_symbol + ")")
+                                mark("sell_to_open_ack", symbol=trade_symbol, order_id=roll_order_id)
+                                # Walk the limit price down a cent at a time until filled
+                                open_order_filled, roll_order_id, limit_price = chase_order(orders_endpoint, access_token, roll_order_id, limit_price, -0.01, round(limit_price - 0.05, 2), 2, "sell to open order", **roll_order)
+                                # Write out message if order filled or not
+                                if open_order_filled:
+                                    print ("Order to sell to open: (" + trade_symbol + ") has been filled at limit price of " + str(limit_price) + ".")
                                 else:
-                                    print ("FAILED to place order to sell to open: (" + trade_symbol + ")")
-                                # Initialize filled order flag to False
-                                open_order_filled = False
-                                # Loop to see if order to roll has been filled
-                                for i in range(5):
-                                    print("Sleeping 2 seconds. Waiting for sell to open order to be filled")
-                                    time.sleep(2)
-                                    # Get filled orders
-                                    current_filled_orders = get_orders(orders_endpoint, access_token, current_trading_day, "FILLED")
-                                    # Loop over filled orders
-                                    for fill_order in current_filled_orders:
-                                        # Check to see if order has been filled
-                                        if current_filled_orders[fill_order][0] == trade_symbol and current_filled_orders[fill_order][1] == "SELL_TO_OPEN" and current_filled_orders[fill_order][2] == roll_trade_contracts:
-                                            print ("Order to sell to open: (" + trade_symbol + ") has been filled.")
-                                            open_order_filled = True
-                                    # If order has been filled exit loop
-                                    if open_order_filled:
-                                        break
-                                    else:
-                                        # Get all current open orders
-                                        current_open_orders = get_orders(orders_endpoint, access_token, current_trading_day, "WORKING")
-                                        # Loop over current open orders
-                                        for open_order in current_open_orders:
-                                            if current_open_orders[open_order][0] == trade_symbol and current_open_orders[open_order][1] == "SELL_TO_OPEN":
-                                                order_status = cancel_order(orders_endpoint,access_token,str(open_order))
-                                                # Check order status
-                                                if order_status == 200:
-                                                    print ("Canceled previous order for: (" + trade_symbol + ") successfully\n")
-                                                    # Set limit price to one cent lower
-                                                    limit_price = round(limit_price - 0.01,2)
-                                                    # Output what order is being placed
-                                                    print ("Placing order to sell to open " + str(roll_trade_contracts) + " contracts of : (" + trade_symbol + ") at limit price of " + str(limit_price))
-                                                    order_status = place_order(
-                                                                   endpoint=orders_endpoint,
-                                                                   access_token=access_token,
-                                                                   symbol=trade_symbol, 
-                                                                   order_type="LIMIT", 
-                                                                   instruction="SELL_TO_OPEN", 
-                                                                   quantity=roll_trade_contracts,
-                                                                   order_leg_type="OPTION",
-                                                                   asset_type="OPTION",
-                                                                   position_effect="OPENING",
-                                                                   price=limit_price)
-                                                    # Check order status
-                                                    if order_status == 201:
-                                                        print ("Order successfully placed to sell to open: (" + trade_symbol + ")")
-                                                    else:
-                                                        print ("FAILED to place order to sell to open: (" + trade_symbol + ")")
-                                                else:
-                                                    print ("FAILED to cancel previous order for (" + trade_symbol + ")\n")
-                                # Write out message if order not filled
-                                if not open_order_filled:
                                     print ("Order to sell to open: (" + trade_symbol + ") not filled.")
-                                # Set close order filled to True
-                                close_order_filled = True
-                        # If order has been filled exit loop
-                        if close_order_filled:
-                            break
-                    # Write out message if order not filled
-                    if not close_order_filled:
-                        print ("Order to buy to close: (" + key + ") not filled.")
+                            else:
+                                print ("FAILED to place order to sell to open: (" + trade_symbol + ")")
+                    else:
+                        print ("Order to buy to close: (" + key + ") not filled. Order status: " + close_result.status)
 
             else:
                 print ("FAILED to place order to buy to close: (" + key + ")")
@@ -1208,22 +1240,20 @@ if args.sell_call_options != "None":
     if hhmm > transition_time:
         # Loop over current open orders
         for order in current_open_orders:
-            # Check for matching date
-            if current_yymmdd == current_open_orders[order][0].split()[1][0:6] and current_open_orders[order][1] == "SELL_TO_OPEN":
-                # Loop over stored orders to find matching order
-                for symbol in stored_orders:
-                    if symbol == current_open_orders[order][0] and stored_orders[symbol][0] == current_open_orders[order][1] and stored_orders[symbol][1] == current_open_orders[order][2] and stored_orders[symbol][2] == "WORKING":
-                        # Cancel order
-                        order_status = cancel_order(orders_endpoint,access_token,str(order))
-                        # Check order status
-                        if order_status == 200:
-                            print ("Canceled order for: (" + symbol + ") successfully\n")
-                            # Switch stored order status to CANCELED
-                            stored_orders[symbol][2] = "CANCELED"
-                            # Reduce the total number of contracts
-                            total_contracts = total_contracts - current_open_orders[order][2]
-                        else:
-                            print ("FAILED to cancel for: (" + symbol + ")\n")
+            # Check for matching date and order in the order log
+            if current_yymmdd == current_open_orders[order][0].split()[1][0:6] and current_open_orders[order][1] == "SELL_TO_OPEN" and is_stored_working(stored_orders, current_open_orders[order]):
+                symbol = current_open_orders[order][0]
+                # Cancel order
+                order_status = cancel_order(orders_endpoint,access_token,str(order))
+                # Check order status
+                if order_status == 200:
+                    print ("Canceled order for: (" + symbol + ") successfully\n")
+                    # Switch stored order status to CANCELED
+                    stored_orders[symbol][2] = "CANCELED"
+                    # Reduce the total number of contracts
+                    total_contracts = total_contracts - current_open_orders[order][2]
+                else:
+                    print ("FAILED to cancel for: (" + symbol + ")\n")
 
     # Write out total number of contracts in play
     print ("Total Contracts: " + str(total_contracts))
@@ -1239,8 +1269,9 @@ if args.sell_call_options != "None":
         trade_contracts = contract_diff
 
     # Check whether to continue with trading or not
+    trace_phase("open_positions")
     if options_trading:
-        print ("\n%Below Resistance <= Threshold Value of " + str(float(args.percent_threshold)) + ". Will attempt to add options positions.\n")
+        print ("\n%Below Resistance <= Threshold Value of " + str(percent_threshold) + ". Will attempt to add options positions.\n")
 
         # Initialize trade symbol to None
         trade_symbol = "None"
@@ -1257,46 +1288,43 @@ if args.sell_call_options != "None":
                 print("Instruction: " + current_filled_orders[order][1])
                 print("#Contracts: " + str(current_filled_orders[order][2]))
                 # Check to see if any of today's orders have been filled
-                for symbol in stored_orders:
-                    if symbol == current_filled_orders[order][0] and stored_orders[symbol][0] == current_filled_orders[order][1] and stored_orders[symbol][1] == current_filled_orders[order][2] and stored_orders[symbol][2] == "WORKING":
-                        # Switch stored order status to FILLED
-                        stored_orders[symbol][2] = "FILLED"
-                        # Output what position is being closed
-                        print ("Placing order to buy to close: (" + symbol + ") at limit price of 0.01")
-                        # Place limit order to close position at limit price of 0.01
-                        order_status = place_order(
-                                       endpoint=orders_endpoint,
-                                       access_token=access_token,
-                                       symbol=symbol, 
-                                       order_type="LIMIT", 
-                                       instruction="BUY_TO_CLOSE", 
-                                       quantity=stored_orders[symbol][1],
-                                       order_leg_type="OPTION",
-                                       asset_type="OPTION",
-                                       position_effect="CLOSING",
-                                       price=0.01,
-                                       duration="GOOD_TILL_CANCEL")
-                        # Check order status
-                        if order_status == 201:
-                            print ("Order successfully placed to buy to close: (" + symbol + ")")
-                        else:
-                            print ("FAILED to place order to buy to close: (" + symbol + ")")
-                        # Place new order based on time of day
-                        if hhmm > transition_time:
-                            # Trade next day
-                            # Loop over option quotes
-                            for symbol in sorted(option_quotes):
-                                # Check for matching date
-                                if next_yymmdd == symbol.split()[1][0:6] and option_quotes[symbol][1] <= min_trade_price:
-                                    # Set symbol to trade
-                                    trade_symbol = symbol
-                                    # Exit loop
-                                    break
-                        else:
-                            # Trade current day
-                            # Increment strike price by one
-                            new_strike = int(symbol[15:18]) + 1
-                            trade_symbol = symbol[0:15] + str(new_strike) + symbol[18:]
+                if is_stored_working(stored_orders, current_filled_orders[order]):
+                    symbol = current_filled_orders[order][0]
+                    # Switch stored order status to FILLED
+                    stored_orders[symbol][2] = "FILLED"
+                    # Output what position is being closed
+                    print ("Placing order to buy to close: (" + symbol + ") at limit price of 0.01")
+                    # Place limit order to close position at limit price of 0.01
+                    order_status = place_order(
+                                   endpoint=orders_endpoint,
+                                   access_token=access_token,
+                                   symbol=symbol, 
+                                   order_type="LIMIT", 
+                                   instruction="BUY_TO_CLOSE", 
+                                   quantity=stored_orders[symbol][1],
+                                   order_leg_type="OPTION",
+                                   asset_type="OPTION",
+                                   position_effect="CLOSING",
+                                   price=0.01,
+                                   duration="GOOD_TILL_CANCEL")
+                    # Check order status
+                    if order_status == 201:
+                        print ("Order successfully placed to buy to close: (" + symbol + ")")
+                    else:
+                        print ("FAILED to place order to buy to close: (" + symbol + ")")
+                    # Place new order based on time of day
+                    if hhmm > transition_time:
+                        # Trade next day
+                        # Find lowest strike with an ask at or below the min trade price
+                        next_symbol = option_quotes.lowest_strike_ask_at_most(next_yymmdd, min_trade_price)
+                    else:
+                        # Trade current day
+                        # Increment strike price by one
+                        expiry, strike = parse_option_symbol(symbol)
+                        next_symbol = option_quotes.find(expiry, strike + 1)
+                    # Set symbol to trade if option quote found
+                    if next_symbol is not None:
+                        trade_symbol = next_symbol
 
         # Initialize new_trade to True
         new_trade = True
@@ -1315,11 +1343,10 @@ if args.sell_call_options != "None":
                     break
             # Set trade symbol if new trade should be placed
             if new_trade:
-                for symbol in sorted(option_quotes):
-                    # Check for matching date
-                    if trade_date == symbol.split()[1][0:6] and option_quotes[symbol][0] >= min_trade_price:
-                        # Set symbol to trade
-                        trade_symbol = symbol
+                # Find highest strike with a bid at or above the min trade price
+                next_symbol = option_quotes.highest_strike_bid_at_least(trade_date, min_trade_price)
+                if next_symbol is not None:
+                    trade_symbol = next_symbol
 
         # Place order if symbol found
         if trade_symbol != "None":
@@ -1355,8 +1382,558 @@ if args.sell_call_options != "None":
         if contract_diff <= 0:
             print("Total contracts in place: " + str(total_contracts) + " >= max contracts to trade: " + str(max_contracts) + ".")
         else:
-            print ("\n%Below Resistance > Threshold Value of " + str(float(args.percent_threshold)) + ".")
+            print ("\n%Below Resistance > Threshold Value of " + str(percent_threshold) + ".")
 
     # Write any stored orders to order log
     with open(order_log, "w") as file:
         json.dump(stored_orders, file, indent=4)
+
+    # Return that the cycle ran
+    return True
+
+
+# Function to read a watchlist file of symbols separated by commas, spaces
+# or new lines. Text after # on a line is ignored, and a symbol listed more
+# than once is only kept once.
+def read_watchlist(watchlist_file: str):
+
+    tickers = []
+    with open(watchlist_file, 'r') as file:
+        for line in file.readlines():
+            for ticker in line.split("#")[0].replace(",", " ").split():
+                if ticker.upper() not in tickers:
+                    tickers.append(ticker.upper())
+    return tickers
+
+
+# Function to request one chunk of watchlist quotes. Returns the number of
+# quotes received and the lag of each, in seconds from its quote time to
+# when it was received.
+def collect_chunk(access_token: str, tickers: list):
+
+    quotes = request_quotes(access_token, tickers)
+    received = time.time()
+    return len(quotes), [received - quote["quoteTime"] / 1000.0 for quote in quotes.values() if quote.get("quoteTime")]
+
+
+# Function to collect quotes for a watchlist. The chunks of up to
+# quote_chunk_size symbols are requested at the same time on the fetch pool,
+# within the market data rate limit, and each chunk is written to the quote
+# store as soon as it arrives. Prints and returns the throughput and lag of
+# the collection.
+def collect_quotes(access_token: str, tickers: list):
+
+    # Request all chunks
+    start_time = time.perf_counter()
+    futures = [submit_fetch(collect_chunk, access_token, tickers[start:start+quote_chunk_size]) for start in range(0, len(tickers), quote_chunk_size)]
+
+    # Count quotes as chunks arrive. A failed chunk is reported and the rest
+    # are still collected.
+    quote_count, errors, lags = 0, 0, []
+    for future in futures:
+        try:
+            count, chunk_lags = future.result()
+        except Exception as error:
+            print("Quote request failed: " + str(error))
+            errors = errors + 1
+            continue
+        quote_count = quote_count + count
+        lags = lags + chunk_lags
+    seconds = time.perf_counter() - start_time
+
+    # Informational Print
+    lags.sort()
+    collection = {"symbols": len(tickers),
+                  "quotes": quote_count,
+                  "requests": len(futures),
+                  "errors": errors,
+                  "seconds": seconds,
+                  "lag_median": lags[len(lags) // 2] if lags else None,
+                  "lag_max": lags[-1] if lags else None}
+    print("Collected " + str(quote_count) + " of " + str(len(tickers)) + " quotes in " + str(len(futures)) + " requests and " + str(round(seconds, 3)) + " seconds (" + str(round(quote_count / seconds if seconds > 0 else 0.0, 1)) + " quotes/second)")
+    if lags:
+        print("Quote lag: median " + str(round(collection["lag_median"], 3)) + " seconds, max " + str(round(collection["lag_max"], 3)) + " seconds")
+    if client.metrics is not None:
+        client.metrics.record_collection(collection)
+
+    # Return throughput and lag
+    return collection
+
+
+# Function to run the requested strategies once. If hhmm is set, only the
+# strategies whose daemon window contains hhmm are run.
+def run_strategies(args, access_token: str, account_type: str, hhmm=None):
+
+    # Determine which strategies are active for this cycle
+    active = {}
+    for strategy in daemon_windows:
+        active[strategy] = getattr(args, strategy) != "None" and (hhmm is None or in_window(daemon_windows[strategy], hhmm))
+
+    # Collect watchlist quotes first, so strategies on watchlist symbols use
+    # the cached quotes
+    if args.collect != "None" and (hhmm is None or in_window(collect_window, hhmm)):
+        with strategy_label("collect"):
+            collect_quotes(access_token, read_watchlist(args.collect))
+
+    # Set ticker to use for quote and/or options or rebalance trading
+    if active["sell_call_options"]:
+        ticker = args.sell_call_options
+    elif active["rebalance"]:
+        ticker = args.rebalance
+    elif args.get_quote != "None" and hhmm is None:
+        ticker = args.get_quote
+    else:
+        ticker = "None"
+
+    # Check to see if quote requested.
+    if ticker != "None":
+        # Get quotes for every symbol this cycle needs in one request. Later
+        # lookups within the cycle are served from the quote cache.
+        symbols = [ticker]
+        if active["range_trade"] and os.path.exists("schwab_" + args.range_trade + "_range_trade.ini"):
+            symbols = symbols + [args.range_trade, load_range_trade_settings("schwab_" + args.range_trade + "_range_trade.ini").buying_power_ticker]
+        if active["rebalance"] and os.path.exists("schwab_" + args.rebalance + "_rebalance.ini"):
+            symbols = symbols + [load_rebalance_settings("schwab_" + args.rebalance + "_rebalance.ini").buying_power_ticker]
+        get_quotes(access_token, symbols)
+        current, highofday, lowofday, resistance_level = run_get_quote(access_token, ticker)
+
+    # Check for range trading
+    if active["range_trade"]:
+        with strategy_label("range_trade"), trace_cycle("range_trade_" + args.range_trade, trace_dir):
+            if not run_range_trade(access_token, account_type, args.range_trade):
+                return False
+
+    # Check for rebalance
+    if active["rebalance"]:
+        with strategy_label("rebalance"), trace_cycle("rebalance_" + args.rebalance, trace_dir):
+            if not run_rebalance(access_token, account_type, args.rebalance, current, resistance_level):
+                return False
+
+    # Check for options trading
+    if active["sell_call_options"]:
+        with strategy_label("sell_call_options"), trace_cycle("sell_call_options_" + ticker, trace_dir):
+            if not run_sell_call_options(access_token, account_type, ticker, current, resistance_level, float(args.percent_threshold)):
+                return False
+
+    # Return that all strategies ran
+    return True
+
+
+# Function to read a jobs file. Each line after the header holds a
+# strategy, ticker, account type and optionally a percent threshold.
+def read_jobs(jobs_file: str):
+
+    # Initialize list of jobs
+    jobs = []
+
+    # Read jobs from input file
+    with open(jobs_file, 'r') as file:
+        next(file)
+        for line in file.readlines():
+            fields = [field.strip() for field in line.split(',')]
+            if len(fields) < 3 or fields[0] == "":
+                continue
+            if fields[0] not in daemon_windows:
+                print("Unknown strategy in jobs file: " + fields[0] + ". Skipping")
+                continue
+            percent_threshold = float(fields[3]) if len(fields) > 3 else 1.5
+            jobs.append([fields[0], fields[1], fields[2].lower(), percent_threshold])
+    return jobs
+
+
+# Class sending writes to stdout to a buffer for the current context, if one
+# is set, so each job's output is kept together. The buffer is a context
+# variable, so requests the job runs on the fetch pool write to it too.
+class JobOutput:
+
+    # Store the real stdout
+    def __init__(self, stdout):
+
+        self.stdout = stdout
+        self.job_buffer = contextvars.ContextVar("job_buffer", default=None)
+
+    def write(self, text):
+        buffer = self.job_buffer.get()
+        if buffer is None:
+            return self.stdout.write(text)
+        buffer.append(text)
+        return len(text)
+
+    def flush(self):
+        self.stdout.flush()
+
+
+# Function to run one job. Output is collected and returned with the result.
+def run_job(job: list, access_token: str, order_log_name: str):
+
+    # Collect output for this job
+    buffer = []
+    buffer_token = sys.stdout.job_buffer.set(buffer)
+    strategy, ticker, account_type, percent_threshold = job
+    try:
+        with strategy_label(strategy), trace_cycle(strategy + "_" + ticker + "_" + account_type, trace_dir):
+            if strategy == "range_trade":
+                result = run_range_trade(access_token, account_type, ticker)
+            else:
+                current, highofday, lowofday, resistance_level = run_get_quote(access_token, ticker)
+                if strategy == "rebalance":
+                    result = run_rebalance(access_token, account_type, ticker, current, resistance_level)
+                else:
+                    result = run_sell_call_options(access_token, account_type, ticker, current, resistance_level, percent_threshold, order_log_name)
+    except Exception:
+        print(traceback.format_exc())
+        result = False
+    finally:
+        output = "".join(buffer)
+        sys.stdout.job_buffer.reset(buffer_token)
+    return result, output
+
+
+# Function to run jobs concurrently in a bounded pool of workers. Quotes for
+# every ticker are requested once up front and shared through the quote
+# cache, along with the trading calendar and access token. If hhmm is set, only
+# jobs whose strategy window contains hhmm are run.
+def run_jobs(jobs: list, access_token: str, max_workers: int, hhmm=None):
+
+    # Determine which jobs are active for this cycle
+    active_jobs = []
+    for job in jobs:
+        if hhmm is None or in_window(daemon_windows[job[0]], hhmm):
+            active_jobs.append(job)
+    if not active_jobs:
+        return True
+
+    # Get quotes for every ticker and buying power ticker in one request
+    symbols = []
+    for strategy, ticker, account_type, percent_threshold in active_jobs:
+        symbols.append(ticker)
+        if strategy == "range_trade" and os.path.exists("schwab_" + ticker + "_range_trade.ini"):
+            symbols.append(load_range_trade_settings("schwab_" + ticker + "_range_trade.ini").buying_power_ticker)
+        if strategy == "rebalance" and os.path.exists("schwab_" + ticker + "_rebalance.ini"):
+            symbols.append(load_rebalance_settings("schwab_" + ticker + "_rebalance.ini").buying_power_ticker)
+    get_quotes(access_token, symbols)
+
+    # Load trading calendar before starting jobs so it is shared
+    open_trading_calendar()
+
+    # Keep a separate option order log per account if a ticker is traded in more than one account
+    accounts = {}
+    for strategy, ticker, account_type, percent_threshold in active_jobs:
+        accounts.setdefault((strategy, ticker), set()).add(account_type)
+
+    # Run jobs in a bounded pool, sending each job's output to its own buffer
+    real_stdout = sys.stdout
+    sys.stdout = JobOutput(real_stdout)
+    all_ran = True
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = []
+            for job in active_jobs:
+                if len(accounts[(job[0], job[1])]) > 1:
+                    order_log_name = "orders." + job[2] + ".json"
+                else:
+                    order_log_name = "orders.json"
+                futures.append(pool.submit(run_job, job, access_token, order_log_name))
+            for job, future in zip(active_jobs, futures):
+                result, output = future.result()
+                real_stdout.write("\n----- " + job[0] + " " + job[1] + " (" + job[2] + ") -----\n" + output)
+                all_ran = all_ran and result
+    finally:
+        sys.stdout = real_stdout
+
+    # Return whether all jobs ran
+    return all_ran
+
+
+# Function to run the requested strategies once per minute inside one process
+def run_daemon(args, account_type: str, jobs=None):
+
+    # Check if today is a trading day before starting the scheduler
+    if not open_trading_calendar().is_session():
+        print("Today is not a trading day. Exiting daemon")
+        return
+
+    # Determine last minute any requested strategy trades in
+    end_hhmm = 0
+    for strategy in daemon_windows:
+        if getattr(args, strategy) != "None" or (jobs and strategy in [job[0] for job in jobs]):
+            start_hhmm, window_end_hhmm = window_hhmm(daemon_windows[strategy])
+            print("Daemon window for " + strategy + ": " + str(start_hhmm) + " - " + str(window_end_hhmm))
+            end_hhmm = max(end_hhmm, window_end_hhmm)
+    if args.collect != "None":
+        start_hhmm, window_end_hhmm = window_hhmm(collect_window)
+        print("Daemon window for collect: " + str(start_hhmm) + " - " + str(window_end_hhmm))
+        end_hhmm = max(end_hhmm, window_end_hhmm)
+    if end_hhmm == 0:
+        print("No strategies requested for daemon. Exiting")
+        return
+
+    # Loop over minutes of the trading day
+    while True:
+
+        # Sleep until the next minute boundary plus the cycle offset
+        now = time.time()
+        next_cycle = int(now // 60) * 60 + int(args.cycle_offset)
+        if next_cycle <= now:
+            next_cycle = next_cycle + 60
+        time.sleep(next_cycle - now)
+
+        # Get current time, HHMM
+        hhmm = int(datetime.datetime.now().strftime("%H%M"))
+        if hhmm > end_hhmm:
+            print("Past end of daemon windows. Exiting daemon")
+            return
+
+        # Get access token from memory, refreshing it if it is about to expire
+        access_token = token_manager.get_access_token()
+
+        # Run the strategies for this minute. Errors are reported and the
+        # daemon moves on to the next minute.
+        print("\n===== Cycle at " + datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") + " =====")
+        try:
+            run_strategies(args, access_token, account_type, hhmm)
+            if jobs:
+                run_jobs(jobs, access_token, int(args.max_workers), hhmm)
+        except Exception:
+            traceback.print_exc()
+        if client.metrics is not None:
+            client.metrics.write_textfile()
+        sys.stdout.flush()
+
+
+# Function to point the API endpoints at another server, such as the mock
+# Schwab API in mock_schwab_api.py. Tokens for the other server are kept in
+# their own token file, so the live tokens are never overwritten.
+def set_api_url(api_url: str):
+
+    global trading_endpoint, marketdata_endpoint, token_endpoint, price_history_file
+    api_url = api_url.rstrip("/")
+    trading_endpoint = api_url + "/trader/v1"
+    marketdata_endpoint = api_url + "/marketdata/v1"
+    token_endpoint = api_url + "/v1/oauth/token"
+    token_manager.token_endpoint = token_endpoint
+    token_manager.token_file = mock_token_file
+    token_manager.lock_file = mock_token_file + ".lock"
+    token_manager.token_mtime = None
+    price_history_file = mock_price_history_file
+
+    # Write placeholder tokens the first time
+    if not os.path.exists(mock_token_file):
+        with open(mock_token_file, "w") as token_out:
+            token_out.write("[myvars]\n")
+            token_out.write("refresh_token: mock-refresh-token\n")
+            token_out.write("access_token: mock-access-token\n")
+
+# END FUNCTIONS
+
+# BEGIN MAIN CODE
+
+# Define endpoints
+trading_endpoint = r"https://api.schwabapi.com/trader/v1"
+marketdata_endpoint = r"https://api.schwabapi.com/marketdata/v1"
+token_endpoint = r"https://api.schwabapi.com/v1/oauth/token"
+
+# Define configuration file containing access token
+token_file = "schwab_tokens.ini"
+
+# Define configuration file containing access token when -api_url is set
+mock_token_file = "schwab_mock_tokens.ini"
+
+# Define file caching daily bars for all time highs, and the file used
+# instead when -api_url is set
+price_history_file = "schwab_price_history.db"
+mock_price_history_file = "schwab_mock_price_history.db"
+
+# Define cache of daily bars. Opened the first time it is used.
+price_history = None
+price_history_lock = threading.Lock()
+
+# Define file caching the trading calendar
+calendar_file = "schwab_calendar.json"
+
+# Define trading calendar. Loaded the first time it is used.
+trading_calendar = None
+trading_calendar_lock = threading.Lock()
+
+# Define configuation file containing hash of account numbers
+config_file = "schwab_config.ini"
+
+# Define HTTP client shared by all API calls. Connections are kept alive and reused.
+client = SchwabClient()
+
+# Define token manager. The access token is kept in memory and refreshed
+# before it expires, and the client retries once with a new token on a 401.
+token_manager = TokenManager(client, token_endpoint, token_file, config_file)
+client.token_manager = token_manager
+
+# Define cache for quotes. Quotes are reused for up to 30 seconds, so each
+# symbol is requested at most once per cycle.
+quote_cache = QuoteCache(ttl=30.0)
+
+# Define maximum number of symbols to request in one /quotes call
+quote_chunk_size = 200
+
+# Define limit on market data requests, 120 a minute
+marketdata_limiter = RateLimiter(120, 60.0)
+
+# Define thread pool used to fetch the state for a cycle concurrently. A
+# cycle makes up to 3 requests at once, so the pool is made larger when jobs
+# run at the same time.
+fetch_pool = ThreadPoolExecutor(max_workers=4)
+
+# Define recorder appending each requested quote to the quote store. Set when quotes are recorded.
+quote_recorder = None
+
+# Define directory to write a timeline of each strategy cycle to. Set when cycles are traced.
+trace_dir = None
+
+# Define account activity streamer. Set when fills are streamed instead of polled.
+streamer = None
+
+# Define window each strategy runs in daemon mode, as its start and end in
+# minutes after the open or close (negative for before). On a full day these
+# are 9:30 - 15:59, 15:59 and 9:30 - 16:14.
+daemon_windows = {"range_trade": [["open", 0], ["close", -1]],
+                  "rebalance": [["close", -1], ["close", -1]],
+                  "sell_call_options": [["open", 0], ["close", 14]]}
+
+# Define window watchlist quotes are collected in daemon mode, 9:30 - 16:00 on a full day
+collect_window = [["open", 0], ["close", 0]]
+
+if __name__ == "__main__":
+
+    # Argument Parsing
+    parser = argparse.ArgumentParser()
+
+    # Read in arguments
+    parser.add_argument("-get_tokens","--get_tokens", action='store_true', help='Get an updated access token. Tokens are also refreshed automatically shortly before they expire.')
+    parser.add_argument("-get_account_hashes","--get_account_hashes", action='store_true', help='Get hash value for all accounts returned in JSON format.')
+    parser.add_argument("-get_balance","--get_balance", action='store_true', help='Get current account balance. Use account_type option to set the account. Default is brokerage.')
+    parser.add_argument("-account_type","--account_type", required=False, default="brokerage", help='Account type to grab balance or place trades for. Options are ira or brokerage. Default is brokerage.')
+    parser.add_argument("-get_quote","--get_quote", required=False, default="None", help='Ticker Symbol to get quote for. Prints the current price, high and low of the day and resistance level. Default is None (No quote requested).')
+    parser.add_argument("-get_ath","--get_ath", required=False, default="None", help='Ticker Symbols, separated by commas, to print the all time high, drawdown from it and 20, 50 and 252 day highs for. Daily bars are cached in schwab_price_history.db. Default is None.')
+    parser.add_argument("-sell_call_options","--sell_call_options", required=False, default="None", help='Ticker Symbol to sell call options for. Default is None. If set, this will automatically get a quote for the ticker. A threshold for %% from resistance level can be set with the -percent_threshold option. The default threshold is 1.5%%. Option file schwab_$ticker_sell_call_options.ini is required.')
+    parser.add_argument("-percent_threshold","--percent_threshold", required=False, default=1.5, help='Percent threshold from resistance level in which options trading is allowed. If outside this threshold, no new option trades will be placed. Default is 1.5.')
+    parser.add_argument("-range_trade","--range_trade", required=False, default="None", help='Ticker Symbol to range trade for. Default is None. Option file schwab_$ticker_range_trade.ini with settings for trading is required.')
+    parser.add_argument("-rebalance","--rebalance", required=False, default="None", help='Ticker Symbol to use for rebalancing. Default is None. Option file schwab_$ticker_rebalance.ini with settings for trading is required.')
+    parser.add_argument("-daemon","--daemon", action='store_true', help='Run the requested strategies once per minute inside one process until the end of the trading day instead of once per invocation.')
+    parser.add_argument("-stream_fills","--stream_fills", action='store_true', help='Wait for option order fills pushed by the Schwab account activity streamer instead of polling orders. Requires the websockets package.')
+    parser.add_argument("-jobs","--jobs", required=False, default="None", help='File listing jobs to run concurrently, one strategy, ticker and account type per line. Default is None.')
+    parser.add_argument("-max_workers","--max_workers", required=False, default=4, help='Maximum number of jobs from the jobs file to run at the same time. Default is 4.')
+    parser.add_argument("-cycle_offset","--cycle_offset", required=False, default=15, help='Seconds after each minute to start a daemon cycle. Default is 15.')
+    parser.add_argument("-metrics_file","--metrics_file", required=False, default="None", help='Prometheus text file to write API request counts, status codes, latencies, bytes and retries to, by endpoint and strategy. Written at exit, and after each cycle in daemon mode. Default is None.')
+    parser.add_argument("-metrics_log","--metrics_log", required=False, default="None", help='File to append a JSON log line to for each API request. Default is None.')
+    parser.add_argument("-collect","--collect", required=False, default="None", help='Watchlist file of symbols to record quotes for, separated by commas, spaces or new lines. Quotes are requested in chunks of 200 symbols at the same time and written to the quote store, once or each minute in daemon mode. Requires -quote_store. Default is None.')
+    parser.add_argument("-quote_store","--quote_store", required=False, default="None", help='Directory to append every quote requested to, in one binary file per ticker per day. Read it with quote_store.py. Default is None.')
+    parser.add_argument("-trace_dir","--trace_dir", required=False, default="None", help='Directory to write a timeline of the phases, requests, orders and waits of each strategy cycle to, in JSON format. Summarize timelines with trace_report.py. Default is None.')
+    parser.add_argument("-api_url","--api_url", required=False, default="None", help='Base URL of the Schwab API, such as http://127.0.0.1:8080 for the mock server in mock_schwab_api.py. Tokens are then kept in schwab_mock_tokens.ini. Default is None (https://api.schwabapi.com).')
+
+    # Parse the input
+    args = parser.parse_args()
+
+    # Point endpoints at another server, if set
+    if args.api_url != "None":
+        set_api_url(args.api_url)
+
+    # Size fetch pool so every job running at the same time can make its requests at once
+    if args.jobs != "None" and 3 * int(args.max_workers) > 4:
+        fetch_pool = ThreadPoolExecutor(max_workers=3 * int(args.max_workers))
+
+    # Check watchlist for collecting quotes
+    if args.collect != "None":
+        if not os.path.exists(args.collect):
+            print("Watchlist file: " + args.collect + " does not exist. Exiting")
+            sys.exit(1)
+        if args.quote_store == "None":
+            print("Option -quote_store is required with -collect. Exiting")
+            sys.exit(1)
+
+    # Record requested quotes, if requested
+    if args.quote_store != "None":
+        quote_recorder = QuoteRecorder(args.quote_store)
+        atexit.register(quote_recorder.close)
+
+    # Trace strategy cycles, if requested
+    if args.trace_dir != "None":
+        trace_dir = args.trace_dir
+
+    # Record metrics for every API request, if requested
+    if args.metrics_file != "None" or args.metrics_log != "None":
+        client.metrics = Metrics(None if args.metrics_file == "None" else args.metrics_file,
+                                 None if args.metrics_log == "None" else args.metrics_log)
+        atexit.register(client.metrics.close)
+
+    # Check to see if new token should be grabbed
+    if args.get_tokens:
+
+        # Get updated tokens
+        token_manager.refresh()
+
+    # Make sure account type is all lower case
+    account_type = args.account_type.lower()
+
+    # Get latest access token, refreshing it if it is about to expire
+    access_token = token_manager.get_access_token()
+
+    # Check to see if account hashes should be grabbed
+    if args.get_account_hashes:
+
+        # Define endpint for getting account hashes
+        endpoint = trading_endpoint + "/accounts/accountNumbers"
+
+        # Get account hashes
+        get_account_hashes(endpoint, access_token)
+
+    # Check to see if all time highs are requested
+    if args.get_ath != "None":
+        run_get_ath(access_token, [ticker.strip().upper() for ticker in args.get_ath.split(",") if ticker.strip()])
+
+    # Check to see if account balance is requested.
+    if args.get_balance:
+
+        # Get current date
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d")
+
+        # Get account type hash
+        account_hash = get_config_value(config_file, account_type)
+
+        # Define endpoint for account balance
+        endpoint = trading_endpoint + "/accounts/" + account_hash
+
+        # Get account balance
+        account_balance = get_account_info(endpoint, access_token, "balance")
+
+        # Write out account balance
+        print(account_type + " account balance:")
+        print(str(timestamp) + ", " + str(account_balance))
+
+        # Define name of file to output balance to
+        balance_file = "schwab_" + account_type + "_balance.csv"
+
+        # Append account balance to a file
+        balance_out = open(balance_file,"a")
+        balance_out.write(str(timestamp) + ", " + str(account_balance) + "\n")
+        balance_out.close()
+
+    # Start account activity streamer if fills should be streamed
+    if args.stream_fills:
+        from schwab_streamer import StreamerThread
+        streamer = StreamerThread(get_streamer_info(trading_endpoint + "/userPreference", access_token), access_token, token_manager.get_access_token)
+        atexit.register(streamer.close)
+
+    # Read jobs file, if set
+    jobs = None
+    if args.jobs != "None":
+        if not os.path.exists(args.jobs):
+            print("Jobs file: " + args.jobs + " does not exist. Exiting")
+            sys.exit(1)
+        jobs = read_jobs(args.jobs)
+
+    # Run strategies either once per minute in a daemon or once
+    if args.daemon:
+        run_daemon(args, account_type, jobs)
+    else:
+        if not run_strategies(args, access_token, account_type):
+            sys.exit(1)
+        if jobs and not run_jobs(jobs, access_token, int(args.max_workers)):
+            sys.exit(1)
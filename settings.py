@@ -0,0 +1,177 @@
+#!/usr/bin/python
+import os
+import threading
+import configparser
+from dataclasses import dataclass
+from ladder import Ladder
+
+# Class holding settings for selling call options
+@dataclass
+class SellCallOptionsSettings:
+    limit_price: float
+    min_limit_price: float
+    transition_time: int
+    num_contracts: int
+    max_contracts: int
+
+
+# Class holding settings for range trading. trade_ranges maps the number of
+# shares to own to [buy price, sell price], and ladder holds the same rungs
+# for lookups.
+@dataclass
+class RangeTradeSettings:
+    trade_shares: int
+    max_shares: int
+    buying_power_ticker: str
+    trade_ranges: dict
+    ladder: Ladder
+
+
+# Class holding settings for rebalancing. min_allocation is a fraction.
+@dataclass
+class RebalanceSettings:
+    available_cash: float
+    min_position: float
+    max_position: float
+    min_allocation: float
+    buying_power_ticker: str
+
+
+# Function to get the value after the colon on a settings line
+def header_value(option_file: str, line: str):
+
+    if ':' not in line:
+        raise ValueError("Option file " + option_file + ": expected 'name: value' but found '" + line.strip() + "'")
+    return line.split(':', 1)[1].strip()
+
+
+# Function to read the myvars section of a configuration file
+def parse_config(config_file: str):
+
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    return dict(config.items("myvars"))
+
+
+# Function to read and check settings for selling call options
+def parse_sell_call_options_settings(option_file: str):
+
+    config = parse_config(option_file)
+    settings = SellCallOptionsSettings(limit_price=float(config["limit_price"]),
+                                       min_limit_price=float(config["min_limit_price"]),
+                                       transition_time=int(config["transition_time"]),
+                                       num_contracts=int(config["num_contracts"]),
+                                       max_contracts=int(config["max_contracts"]))
+    if settings.num_contracts <= 0 or settings.max_contracts <= 0:
+        raise ValueError("Option file " + option_file + ": num_contracts and max_contracts must be greater than 0")
+    if settings.transition_time < 0 or settings.transition_time > 2359 or settings.transition_time % 100 > 59:
+        raise ValueError("Option file " + option_file + ": transition_time must be a time in HHMM format")
+    return settings
+
+
+# Function to read and check range trade settings. The first three lines hold
+# the shares per trade, max shares and buying power ticker. After a header
+# line, each line holds a share count, buy price and sell price.
+def parse_range_trade_settings(option_file: str):
+
+    # Read variables from input file
+    with open(option_file, 'r') as file:
+        lines = file.readlines()
+    if len(lines) < 5:
+        raise ValueError("Option file " + option_file + ": expected 3 settings lines, a header line and at least one trade range")
+    trade_shares = int(header_value(option_file, lines[0]))
+    max_shares = int(header_value(option_file, lines[1]))
+    buying_power_ticker = header_value(option_file, lines[2])
+    trade_ranges = {}
+    for line in lines[4:]:
+        if line.strip() == "":
+            continue
+        fields = line.split(',')
+        if len(fields) != 3:
+            raise ValueError("Option file " + option_file + ": expected 'shares, buy price, sell price' but found '" + line.strip() + "'")
+        trade_ranges[int(fields[0])] = [float(fields[1]), float(fields[2])]
+
+    # Check settings
+    if trade_shares <= 0 or max_shares < trade_shares:
+        raise ValueError("Option file " + option_file + ": shares to trade must be greater than 0 and no more than max shares")
+    if trade_shares not in trade_ranges or max_shares not in trade_ranges:
+        raise ValueError("Option file " + option_file + ": trade ranges must include " + str(trade_shares) + " and " + str(max_shares) + " shares")
+    for shares in trade_ranges:
+        if shares % trade_shares != 0:
+            raise ValueError("Option file " + option_file + ": share count " + str(shares) + " is not a multiple of " + str(trade_shares))
+        if trade_ranges[shares][0] >= trade_ranges[shares][1]:
+            raise ValueError("Option file " + option_file + ": buy price must be below sell price for " + str(shares) + " shares")
+    return RangeTradeSettings(trade_shares, max_shares, buying_power_ticker, trade_ranges, Ladder(trade_shares, max_shares, trade_ranges))
+
+
+# Function to read and check rebalance settings
+def parse_rebalance_settings(option_file: str):
+
+    # Read variables from input file
+    with open(option_file, 'r') as file:
+        lines = file.readlines()
+    if len(lines) < 5:
+        raise ValueError("Option file " + option_file + ": expected 5 settings lines")
+    settings = RebalanceSettings(available_cash=float(header_value(option_file, lines[0])),
+                                 min_position=float(header_value(option_file, lines[1])),
+                                 max_position=float(header_value(option_file, lines[2])),
+                                 min_allocation=float(header_value(option_file, lines[3])) * 0.01,
+                                 buying_power_ticker=header_value(option_file, lines[4]))
+
+    # Check settings
+    if settings.available_cash <= 0.0:
+        raise ValueError("Option file " + option_file + ": available cash must be greater than 0")
+    if settings.min_position < 0.0 or settings.min_position >= settings.max_position:
+        raise ValueError("Option file " + option_file + ": min position % must be at least 0 and below max position %")
+    if settings.min_allocation < 0.0 or settings.min_allocation > 1.0:
+        raise ValueError("Option file " + option_file + ": min allocation % must be between 0 and 100")
+    return settings
+
+
+# Class caching parsed settings files. A file is only parsed again when its
+# modification time or size changes, so a long running process picks up
+# edits without reading the file every cycle.
+class SettingsCache:
+
+    # Initialize empty cache
+    def __init__(self):
+
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    # Function to get parsed settings for a file
+    def get(self, option_file: str, parse):
+
+        stat = os.stat(option_file)
+        key = (option_file, parse)
+        with self.lock:
+            if key in self.entries and self.entries[key][0] == (stat.st_mtime_ns, stat.st_size):
+                return self.entries[key][1]
+        settings = parse(option_file)
+        with self.lock:
+            self.entries[key] = [(stat.st_mtime_ns, stat.st_size), settings]
+        return settings
+
+
+# Define cache shared by all settings loads
+settings_cache = SettingsCache()
+
+
+# Function to get the myvars section of a configuration file
+def load_config(config_file: str):
+    return settings_cache.get(config_file, parse_config)
+
+
+# Function to get settings for selling call options
+def load_sell_call_options_settings(option_file: str):
+    return settings_cache.get(option_file, parse_sell_call_options_settings)
+
+
+# Function to get range trade settings
+def load_range_trade_settings(option_file: str):
+    return settings_cache.get(option_file, parse_range_trade_settings)
+
+
+# Function to get rebalance settings
+def load_rebalance_settings(option_file: str):
+    return settings_cache.get(option_file, parse_rebalance_settings)
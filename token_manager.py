@@ -0,0 +1,138 @@
+#!/usr/bin/python
+import os
+import time
+import base64
+import fcntl
+import threading
+import configparser
+
+# Class keeping the access token in memory and refreshing it before it
+# expires. The token file records when the access token expires so every
+# process sharing it knows when to refresh. Refreshes take an exclusive lock
+# on a lock file next to the token file, so concurrent processes don't race
+# on the refresh token or the rename of the temporary token file.
+class TokenManager:
+
+    # Store file names and settings. Tokens are refreshed refresh_margin
+    # seconds before they expire.
+    def __init__(self, client, token_endpoint: str, token_file: str, config_file: str, refresh_margin=300.0):
+
+        self.client = client
+        self.token_endpoint = token_endpoint
+        self.token_file = token_file
+        self.config_file = config_file
+        self.refresh_margin = refresh_margin
+        self.lock_file = token_file + ".lock"
+        self.lock = threading.Lock()
+        self.access_token = None
+        self.refresh_token = None
+        self.expires_at = None
+        self.token_mtime = None
+
+    # Function to read tokens from the token file if it has changed since it
+    # was last read
+    def load(self):
+
+        token_mtime = os.path.getmtime(self.token_file)
+        if token_mtime == self.token_mtime:
+            return
+        config = configparser.ConfigParser()
+        config.read(self.token_file)
+        self.refresh_token = config.get("myvars", "refresh_token")
+        self.access_token = config.get("myvars", "access_token")
+        if config.has_option("myvars", "access_token_expires"):
+            self.expires_at = float(config.get("myvars", "access_token_expires"))
+        else:
+            self.expires_at = None
+        self.token_mtime = token_mtime
+
+    # Function to check if the access token needs to be refreshed. A token
+    # with no recorded expiry is used until the API rejects it.
+    def needs_refresh(self):
+
+        return self.expires_at is not None and time.time() >= self.expires_at - self.refresh_margin
+
+    # Function to get a valid access token, refreshing it first if it is
+    # about to expire
+    def get_access_token(self):
+
+        with self.lock:
+            self.load()
+            if self.needs_refresh():
+                self.refresh_locked()
+            return self.access_token
+
+    # Function to refresh the access token. If expired_token is set and the
+    # current token is already different, another caller has refreshed it and
+    # no request is made.
+    def refresh(self, expired_token=None):
+
+        with self.lock:
+            self.load()
+            if expired_token is not None and self.access_token != expired_token:
+                return self.access_token
+            self.refresh_locked(force=True)
+            return self.access_token
+
+    # Function to refresh tokens while holding the thread lock. The file lock
+    # keeps other processes out. After getting the file lock the token file is
+    # read again, since another process may have refreshed it while waiting.
+    def refresh_locked(self, force=False):
+
+        with open(self.lock_file, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                previous_token = self.access_token
+                self.load()
+                if not force and not self.needs_refresh():
+                    return
+                if force and self.access_token != previous_token:
+                    return
+                self.request_tokens()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    # Function to request new tokens and write them to the token file
+    def request_tokens(self):
+
+        #Read in variables from configuration file
+        config = configparser.ConfigParser()
+        config.read(self.config_file)
+        app_key = config.get("myvars", "app_key")
+        app_secret = config.get("myvars", "app_secret")
+
+        #Define payload and headers
+        payload = {"grant_type":"refresh_token",
+                   "refresh_token":self.refresh_token}
+        headers = {
+                 "Authorization": f'Basic {base64.b64encode(f"{app_key}:{app_secret}".encode()).decode()}',
+                 "Content-Type": "application/x-www-form-urlencoded"}
+
+        #Make request for new token
+        requested_at = time.time()
+        content = self.client.post(self.token_endpoint, headers = headers, data = payload)
+
+        #Convert json to a dictionary
+        auth = content.json()
+        print ("Access Token: " + auth["access_token"])
+        print ("Refresh Token: " + auth["refresh_token"])
+
+        #Store tokens and time the access token expires
+        self.access_token = auth["access_token"]
+        self.refresh_token = auth["refresh_token"]
+        self.expires_at = requested_at + float(auth.get("expires_in", 1800))
+
+        #Define name of temporary token file
+        token_temp = self.token_file + ".tmp"
+
+        #Open temporary token file and write out new tokens
+        auth_out = open(token_temp,"w+")
+        auth_out.write('[myvars]\n')
+        auth_out.write('refresh_token: ' + str(self.refresh_token) + '\n')
+        auth_out.write('access_token: ' + str(self.access_token) + '\n')
+        auth_out.write('access_token_expires: ' + str(round(self.expires_at, 3)) + '\n')
+        auth_out.close()
+
+        #Move token file to final name
+        os.rename(token_temp,self.token_file)
+        self.token_mtime = os.path.getmtime(self.token_file)
@@ -0,0 +1,127 @@
+#!/usr/bin/python
+import os
+import sys
+import json
+import math
+import glob
+import argparse
+
+# START FUNCTIONS
+
+# Function to load the timelines in a directory, optionally only those whose
+# name starts with prefix
+def load_timelines(trace_dir: str, prefix: str):
+
+    timelines = []
+    for timeline_file in sorted(glob.glob(os.path.join(trace_dir, "*.json"))):
+        with open(timeline_file, "r") as timeline_in:
+            timeline = json.load(timeline_in)
+        if prefix is None or timeline["name"].startswith(prefix):
+            timelines.append(timeline)
+    return timelines
+
+
+# Function to get a percentile of a list of values, using the nearest rank
+def percentile(values: list, percent: float):
+
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100.0 * len(ordered)))
+    return ordered[rank-1]
+
+
+# Function to collect span durations by path across timelines
+def span_durations(timelines: list):
+
+    durations = {}
+    for timeline in timelines:
+        for span in timeline["spans"]:
+            durations.setdefault(span["path"], []).append(span["duration"])
+    return durations
+
+
+# Function to collect the time from a start mark to the first of each later
+# mark in each timeline. Timelines without the start mark are skipped.
+def mark_intervals(timelines: list, start_mark: str):
+
+    intervals = {}
+    for timeline in timelines:
+        start = next((mark["time"] for mark in timeline["marks"] if mark["name"] == start_mark), None)
+        if start is None:
+            continue
+        seen = set()
+        for mark in timeline["marks"]:
+            if mark["name"] != start_mark and mark["name"] not in seen and mark["time"] >= start:
+                seen.add(mark["name"])
+                intervals.setdefault(start_mark + " -> " + mark["name"], []).append(mark["time"] - start)
+    return intervals
+
+
+# Function to get the self time of each span path, in microseconds, summed
+# across timelines: the time spent in spans at the path less the time spent
+# in spans nested directly in them. Requests made at the same time can add
+# up to more than the span they are in, so self time is never below 0.
+def folded_stacks(timelines: list):
+
+    stacks = {}
+    for timeline in timelines:
+        totals = {}
+        for span in timeline["spans"]:
+            totals[span["path"]] = totals.get(span["path"], 0.0) + span["duration"]
+        children = {}
+        for path in totals:
+            if ";" in path:
+                parent = path.rsplit(";", 1)[0]
+                children[parent] = children.get(parent, 0.0) + totals[path]
+        for path in totals:
+            stacks[path] = stacks.get(path, 0) + max(0, round((totals[path] - children.get(path, 0.0)) * 1e6))
+    return stacks
+
+
+# Function to print a table of percentiles in milliseconds
+def print_percentiles(title: str, values_by_name: dict, percents: list):
+
+    width = max([len(title)] + [len(name) for name in values_by_name])
+    print(title.ljust(width) + "  Count" + "".join(("p" + format(percent, "g")).rjust(10) for percent in percents) + "       Max")
+    for name in sorted(values_by_name):
+        values = values_by_name[name]
+        print(name.ljust(width) + str(len(values)).rjust(7) + "".join(f"{percentile(values, percent) * 1000.0:10.2f}" for percent in percents) + f"{max(values) * 1000.0:10.2f}")
+
+# END FUNCTIONS
+
+if __name__ == "__main__":
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(description="Summarize cycle timelines written by schwab_trader.py -trace_dir")
+    parser.add_argument("-trace_dir","--trace_dir", default="traces", help='Directory of timeline files. Default is traces')
+    parser.add_argument("-name","--name", default="None", help='Only use timelines whose name starts with this, such as sell_call_options_SPY. Default is None (all)')
+    parser.add_argument("-percentiles","--percentiles", default="50,90,99", help='Percentiles to report, separated by commas. Default is 50,90,99')
+    parser.add_argument("-start_mark","--start_mark", default="quote", help='Mark to measure the time to later marks from. Default is quote')
+    parser.add_argument("-folded","--folded", default="None", help='File to write folded stacks of span self time in microseconds to, for flamegraph.pl or speedscope. Default is None')
+    args = parser.parse_args()
+
+    # Load timelines
+    if not os.path.isdir(args.trace_dir):
+        print("Trace directory: " + args.trace_dir + " does not exist. Exiting")
+        sys.exit(1)
+    timelines = load_timelines(args.trace_dir, None if args.name == "None" else args.name)
+    if not timelines:
+        print("No timelines found in " + args.trace_dir + ". Exiting")
+        sys.exit(1)
+    percents = [float(percent) for percent in args.percentiles.split(",")]
+    print("Timelines: " + str(len(timelines)) + "\n")
+
+    # Write out span and mark interval percentiles in milliseconds
+    print_percentiles("Span (ms)", span_durations(timelines), percents)
+    intervals = mark_intervals(timelines, args.start_mark)
+    if intervals:
+        print("")
+        print_percentiles("Marks (ms)", intervals, percents)
+
+    # Write folded stacks
+    if args.folded != "None":
+        stacks = folded_stacks(timelines)
+        with open(args.folded, "w") as folded_out:
+            for path in sorted(stacks):
+                if stacks[path] > 0:
+                    folded_out.write(path + " " + str(stacks[path]) + "\n")
+        print("\nWrote folded stacks to " + args.folded)
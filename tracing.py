@@ -0,0 +1,145 @@
+#!/usr/bin/python
+import os
+import json
+import time
+import datetime
+import threading
+import contextlib
+import contextvars
+
+# Trace of the cycle being run, and the span new spans are nested in. Pool
+# threads see both if work is submitted through contextvars.copy_context().run.
+current_trace = contextvars.ContextVar("trace", default=None)
+current_span = contextvars.ContextVar("span", default=None)
+
+
+# Class holding the spans and marks of one strategy cycle. Times are seconds
+# from the start of the cycle. A span covers a stretch of work and is nested
+# in the span that was open when it started; its path is the names of the
+# spans it is nested in joined by ";". A mark is a point in time, such as a
+# quote being received or an order being acknowledged.
+class Trace:
+
+    # Start trace
+    def __init__(self, name: str):
+
+        self.name = name
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+        self.marks = []
+        self.phase = None
+        self.lock = threading.Lock()
+        self.root = {"name": name, "path": name, "start": 0.0, "end": None, "attributes": {}}
+
+    # Function to open a span nested in parent
+    def open_span(self, name: str, parent: dict, attributes: dict):
+
+        span = {"name": name, "path": parent["path"] + ";" + name, "start": time.perf_counter() - self.start, "end": None, "attributes": attributes}
+        with self.lock:
+            self.spans.append(span)
+        return span
+
+    # Function to close a span
+    def close_span(self, span: dict):
+
+        span["end"] = time.perf_counter() - self.start
+
+    # Function to add a mark. at is a time.time() value, and defaults to now.
+    def add_mark(self, name: str, at=None, attributes=None):
+
+        if at is None:
+            offset = time.perf_counter() - self.start
+        else:
+            offset = at - self.started
+        with self.lock:
+            self.marks.append({"name": name, "time": offset, "attributes": attributes or {}})
+
+    # Function to get the trace as a timeline dictionary
+    def timeline(self):
+
+        with self.lock:
+            spans = [self.root] + list(self.spans)
+            marks = list(self.marks)
+        return {"name": self.name,
+                "started": datetime.datetime.fromtimestamp(self.started).isoformat(timespec="microseconds"),
+                "duration": self.root["end"],
+                "spans": [{"name": span["name"],
+                           "path": span["path"],
+                           "start": round(span["start"], 6),
+                           "duration": round((span["end"] if span["end"] is not None else self.root["end"]) - span["start"], 6),
+                           "attributes": span["attributes"]} for span in spans],
+                "marks": [{"name": mark["name"], "time": round(mark["time"], 6), "attributes": mark["attributes"]} for mark in sorted(marks, key=lambda mark: mark["time"])]}
+
+
+# Function to trace a strategy cycle run inside a with block, and write its
+# timeline to a JSON file in trace_dir when the block ends. Does nothing if
+# trace_dir is None.
+@contextlib.contextmanager
+def trace_cycle(name: str, trace_dir):
+
+    if trace_dir is None:
+        yield None
+        return
+    trace = Trace(name)
+    trace_token = current_trace.set(trace)
+    span_token = current_span.set(trace.root)
+    try:
+        yield trace
+    finally:
+        if trace.phase is not None:
+            trace.close_span(trace.phase)
+        trace.root["end"] = time.perf_counter() - trace.start
+        current_span.reset(span_token)
+        current_trace.reset(trace_token)
+        write_timeline(trace, trace_dir)
+
+
+# Function to write the timeline of a trace to trace_dir, named after the
+# trace and the time it started
+def write_timeline(trace: Trace, trace_dir: str):
+
+    os.makedirs(trace_dir, exist_ok=True)
+    timeline_file = os.path.join(trace_dir, trace.name + "." + datetime.datetime.fromtimestamp(trace.started).strftime("%Y%m%d-%H%M%S-%f") + ".json")
+    with open(timeline_file, "w") as timeline_out:
+        json.dump(trace.timeline(), timeline_out)
+
+
+# Function to start the next phase of a cycle, ending the last one. Phases
+# follow each other at the top level of the cycle, and later spans are
+# nested in the current phase.
+def trace_phase(name: str):
+
+    trace = current_trace.get()
+    if trace is None:
+        return
+    if trace.phase is not None:
+        trace.close_span(trace.phase)
+    trace.phase = trace.open_span(name, trace.root, {})
+    current_span.set(trace.phase)
+
+
+# Function to trace work run inside a with block as a span
+@contextlib.contextmanager
+def span(name: str, **attributes):
+
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    new_span = trace.open_span(name, current_span.get(), attributes)
+    token = current_span.set(new_span)
+    try:
+        yield
+    finally:
+        current_span.reset(token)
+        trace.close_span(new_span)
+
+
+# Function to add a mark to the current trace. at is a time.time() value,
+# and defaults to now.
+def mark(name: str, at=None, **attributes):
+
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_mark(name, at, attributes)
@@ -0,0 +1,188 @@
+#!/usr/bin/python
+import os
+import sys
+import json
+import argparse
+import datetime
+
+# Minutes after midnight the regular session opens and closes, and the early
+# close on half days
+SESSION_OPEN = 570
+SESSION_CLOSE = 960
+EARLY_CLOSE = 780
+
+# Codes for each day in a calendar table: no session, a full session and a
+# session ending at the early close
+CLOSED = "-"
+FULL_DAY = "F"
+EARLY_CLOSE_DAY = "E"
+
+# START FUNCTIONS
+
+# Function to turn minutes after midnight into HHMM, such as 959 for 15:59
+def minute_hhmm(minute: int):
+
+    return (minute // 60) * 100 + minute % 60
+
+
+# Class answering questions about NYSE sessions from a table with one code
+# per day starting at start. Lookups index the table by the number of days
+# since start, and the next session after each day is worked out once when
+# the calendar is made, so every lookup takes the same time however far
+# ahead it is.
+class TradingCalendar:
+
+    # Initialize calendar from the first day of the table and its codes
+    def __init__(self, start: datetime.date, days: str):
+
+        self.start = start
+        self.days = days
+
+        # Index of the next session after each day. The last entry points
+        # past the end of the table.
+        self.next_index = [len(days)] * len(days)
+        next_session = len(days)
+        for index in range(len(days) - 1, -1, -1):
+            self.next_index[index] = next_session
+            if days[index] != CLOSED:
+                next_session = index
+
+    # Function to get the index of a day in the table. Raises a ValueError if
+    # the day is outside the table.
+    def index(self, day):
+
+        if isinstance(day, datetime.datetime):
+            day = day.date()
+        index = (day - self.start).days
+        if index < 0 or index >= len(self.days):
+            raise ValueError("Trading calendar does not cover " + day.isoformat())
+        return index
+
+    # Function to get the open and close of a day's session in minutes after
+    # midnight, or None if the market is closed that day
+    def session(self, day=None):
+
+        code = self.days[self.index(datetime.date.today() if day is None else day)]
+        if code == CLOSED:
+            return None
+        return SESSION_OPEN, EARLY_CLOSE if code == EARLY_CLOSE_DAY else SESSION_CLOSE
+
+    # Function to check if the market is open on a day
+    def is_session(self, day=None):
+
+        return self.days[self.index(datetime.date.today() if day is None else day)] != CLOSED
+
+    # Function to check if a weekday is a market holiday
+    def is_holiday(self, day=None):
+
+        day = datetime.date.today() if day is None else day
+        return day.weekday() < 5 and not self.is_session(day)
+
+    # Function to check if a day's session ends at the early close
+    def is_early_close(self, day=None):
+
+        return self.days[self.index(datetime.date.today() if day is None else day)] == EARLY_CLOSE_DAY
+
+    # Function to get the first session after a day
+    def next_session(self, day=None):
+
+        day = datetime.date.today() if day is None else day
+        if isinstance(day, datetime.datetime):
+            day = day.date()
+        next_index = self.next_index[self.index(day)]
+        if next_index >= len(self.days):
+            raise ValueError("Trading calendar has no session after " + day.isoformat())
+        return self.start + datetime.timedelta(days=next_index)
+
+    # Function to get the whole minutes from the current minute of now to the
+    # close of its session: 1 at 15:59 on a full day, 0 at the close and
+    # negative after it. Returns None if the market is closed that day.
+    def minutes_to_close(self, now=None):
+
+        now = datetime.datetime.now() if now is None else now
+        session = self.session(now.date())
+        if session is None:
+            return None
+        return session[1] - (now.hour * 60 + now.minute)
+
+    # Function to get the calendar as a dictionary to save as JSON
+    def to_json(self):
+
+        return {"start": self.start.isoformat(), "days": self.days}
+
+
+# Function to build a calendar of NYSE sessions for the years first_year to
+# last_year. Market holidays come from the holidays package, which is only
+# imported here. Sessions close early at 13:00 on July 3, December 24 and the
+# day after Thanksgiving.
+def build_calendar(first_year: int, last_year: int):
+
+    import holidays
+    years = list(range(first_year, last_year + 1))
+    holiday_dates = holidays.financial_holidays('NYSE', years=years)
+    start = datetime.date(first_year, 1, 1)
+    days = []
+    day = start
+    while day.year <= last_year:
+        if day.weekday() >= 5 or day in holiday_dates:
+            days.append(CLOSED)
+        elif (day.month == 7 and day.day == 3) or (day.month == 12 and day.day == 24) or (day.month == 11 and day.weekday() == 4 and 23 <= day.day <= 29):
+            days.append(EARLY_CLOSE_DAY)
+        else:
+            days.append(FULL_DAY)
+        day = day + datetime.timedelta(days=1)
+    return TradingCalendar(start, "".join(days))
+
+
+# Function to load the calendar cached in calendar_file, building it again
+# for last year to years_ahead years ahead if the file is missing or doesn't
+# cover this year and the next
+def load_calendar(calendar_file: str, years_ahead=2):
+
+    this_year = datetime.date.today().year
+    if os.path.exists(calendar_file):
+        with open(calendar_file, "r") as calendar_in:
+            saved = json.load(calendar_in)
+        calendar = TradingCalendar(datetime.date.fromisoformat(saved["start"]), saved["days"])
+        last_day = calendar.start + datetime.timedelta(days=len(calendar.days) - 1)
+        if calendar.start.year <= this_year and last_day >= datetime.date(this_year + 1, 12, 31):
+            return calendar
+
+    # Build calendar and save it under a temporary name, then rename it so a
+    # process reading it never sees a partly written file
+    calendar = build_calendar(this_year - 1, this_year + years_ahead)
+    calendar_temp = calendar_file + "." + str(os.getpid()) + ".tmp"
+    with open(calendar_temp, "w") as calendar_out:
+        json.dump(calendar.to_json(), calendar_out)
+    os.replace(calendar_temp, calendar_file)
+    return calendar
+
+# END FUNCTIONS
+
+if __name__ == "__main__":
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(description="Print NYSE sessions from the cached trading calendar")
+    parser.add_argument("-calendar_file","--calendar_file", default="schwab_calendar.json", help='Trading calendar file. Built if missing or out of date. Default is schwab_calendar.json')
+    parser.add_argument("-start","--start", default="None", help='First day to print, as YYYY-MM-DD. Default is None (today)')
+    parser.add_argument("-days","--days", type=int, default=14, help='Number of days to print. Default is 14')
+    parser.add_argument("-closed","--closed", action='store_true', help='Only print weekdays the market is closed or closes early')
+    args = parser.parse_args()
+
+    # Load calendar
+    calendar = load_calendar(args.calendar_file)
+    day = datetime.date.today() if args.start == "None" else datetime.date.fromisoformat(args.start)
+
+    # Write out sessions
+    for offset in range(args.days):
+        try:
+            session = calendar.session(day)
+        except ValueError as error:
+            print(str(error))
+            sys.exit(1)
+        if not args.closed or (day.weekday() < 5 and (session is None or session[1] != SESSION_CLOSE)):
+            if session is None:
+                print(day.strftime("%Y-%m-%d %a") + "  closed")
+            else:
+                print(day.strftime("%Y-%m-%d %a") + "  " + str(minute_hhmm(session[0])).zfill(4) + " - " + str(minute_hhmm(session[1])).zfill(4) + ("  early close" if session[1] != SESSION_CLOSE else ""))
+        day = day + datetime.timedelta(days=1)